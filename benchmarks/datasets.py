@@ -0,0 +1,36 @@
+import os
+import sys
+
+main_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+sys.path.append(main_path)
+
+import pandas as pd
+from research.Market.synthetic import SyntheticMarket
+
+RECORDED_PATH = os.path.join(main_path, "production/data/BTCUSDT_1m.csv")
+DATASETS = ("synthetic", "recorded")
+
+
+def synthetic_klines(num_bars: int = 20_000, seed: int = 0, start: str = "2024-01-01") -> pd.DataFrame:
+    """
+    seeded SyntheticMarket 1m klines in the layout of the exported csv (opentime index, closetime,
+    volume_U ...), the same seed gives the same candles on every machine
+    """
+    return SyntheticMarket(seed=seed, start=start).klines(num_bars)
+
+
+def recorded_klines(path: str = RECORDED_PATH) -> pd.DataFrame:
+    """klines exported by production.kline, parsed like the models read them"""
+    kdf = pd.read_csv(path, index_col="opentime", parse_dates=True)
+    kdf["closetime"] = pd.to_datetime(kdf["closetime"])
+    return kdf
+
+
+def load(name: str, num_bars: int = 20_000, seed: int = 0) -> pd.DataFrame:
+    if name == "synthetic":
+        return synthetic_klines(num_bars, seed)
+    if name == "recorded":
+        return recorded_klines()
+    if os.path.isfile(name):
+        return recorded_klines(name)
+    raise ValueError(f"unknown dataset {name}, use one of {DATASETS} or a kline csv path")
@@ -0,0 +1,158 @@
+import os
+import sys
+
+main_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+sys.path.append(main_path)
+
+import argparse
+import fnmatch
+import json
+import platform
+import statistics
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import datasets
+from benchmarks.suite import BENCHMARKS
+from index.jit import NUMBA_AVAILABLE
+
+warnings.filterwarnings("ignore")
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "numba": NUMBA_AVAILABLE,
+    }
+
+
+def _timed(func, reset) -> float:
+    reset()
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def measure(func, repeat: int, min_time: float, reset=None) -> dict:
+    """
+    warm up once (compiles numba kernels, fills caches), then time repeat rounds of number calls,
+    number calibrated so a round takes at least min_time. With reset, reset is called untimed
+    before every call and the calls are timed one by one
+    """
+    if reset is not None:
+        first = _timed(func, reset)
+    else:
+        start = time.perf_counter()
+        func()
+        first = time.perf_counter() - start
+    number = max(1, int(min_time / max(first, 1e-9)))
+    rounds = []
+    for _ in range(repeat):
+        if reset is not None:
+            rounds.append(sum(_timed(func, reset) for _ in range(number)) / number)
+            continue
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        rounds.append((time.perf_counter() - start) / number)
+    return {"first": first, "min": min(rounds), "median": statistics.median(rounds), "number": number}
+
+
+def run(names: list, kdf: pd.DataFrame, repeat: int, min_time: float) -> dict:
+    results = {}
+    for name in names:
+        group, factory = BENCHMARKS[name]
+        try:
+            timed = factory(kdf)
+            func, reset = timed if isinstance(timed, tuple) else (timed, None)
+            result = measure(func, repeat, min_time, reset)
+            result["status"] = "ok"
+        except ImportError as e:
+            result = {"status": "skipped", "reason": str(e)}
+        except Exception as e:
+            result = {"status": "error", "reason": f"{type(e).__name__}: {e}"}
+        result["group"] = group
+        results[name] = result
+        if result["status"] == "ok":
+            print(f"{name:45} {_format(result['min']):>10} {_format(result['median']):>10}  x{result['number']}")
+        else:
+            print(f"{name:45} {result['status']}: {result['reason']}")
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """print min time against the baseline, return the names slower than threshold (0.2 = 20%)"""
+    regressions = []
+    print(f"\n{'benchmark':45} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, result in results.items():
+        before = baseline["results"].get(name, {})
+        if result["status"] != "ok" or before.get("status") != "ok":
+            continue
+        change = result["min"] / before["min"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif change < -threshold:
+            flag = "  faster"
+        print(f"{name:45} {_format(before['min']):>10} {_format(result['min']):>10} {change:>+8.1%}{flag}")
+    if baseline["environment"] != environment():
+        print(f"\nbaseline environment differs: {baseline['environment']}")
+    return regressions
+
+
+def _format(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the indicators, strategies, alphas and io")
+    parser.add_argument("--dataset", default="synthetic", help=f"one of {datasets.DATASETS} or a kline csv path")
+    parser.add_argument("--bars", type=int, default=20_000, help="bars of the synthetic dataset")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic dataset")
+    parser.add_argument("--filter", default="*", help="glob of benchmark names, e.g. 'strategy.*'")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.05, help="minimum seconds of a timed round")
+    parser.add_argument("--save", help="save the results as baselines/<name>.json")
+    parser.add_argument("--compare", help="compare against baselines/<name>.json, exit 1 on a regression")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown counted as a regression")
+    args = parser.parse_args()
+
+    kdf = datasets.load(args.dataset, args.bars, args.seed)
+    names = [name for name in BENCHMARKS if fnmatch.fnmatch(name, args.filter)]
+    print(f"{len(names)} benchmarks on {args.dataset} ({len(kdf)} bars)\n")
+    print(f"{'benchmark':45} {'min':>10} {'median':>10}")
+    results = run(names, kdf, args.repeat, args.min_time)
+    report = {
+        "environment": environment(),
+        "dataset": {"name": args.dataset, "bars": len(kdf), "seed": args.seed},
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "results": results,
+    }
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(os.path.join(BASELINE_DIR, f"{args.save}.json"), "w") as f:
+            json.dump(report, f, indent=1)
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json")) as f:
+            baseline = json.load(f)
+        if baseline["dataset"] != report["dataset"]:
+            print(f"\nbaseline dataset differs: {baseline['dataset']}")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regressions over {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
@@ -0,0 +1,271 @@
+import os
+import sys
+
+main_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+sys.path.append(main_path)
+
+import atexit
+import importlib
+import shutil
+import tempfile
+import uuid
+
+import numpy as np
+import pandas as pd
+
+# name -> (group, factory), a factory takes the dataset kdf, does the untimed setup and returns
+# the zero argument callable that is timed, or (timed callable, reset) where the untimed reset
+# restores the state before every timed call
+BENCHMARKS = {}
+_scratch = tempfile.mkdtemp(prefix="benchmarks_")
+atexit.register(shutil.rmtree, _scratch, ignore_errors=True)
+
+
+def benchmark(name: str, group: str):
+    def register(factory):
+        BENCHMARKS[name] = (group, factory)
+        return factory
+
+    return register
+
+
+def scratch_dir() -> str:
+    """fresh directory under the suite's scratch dir, removed at exit"""
+    path = os.path.join(_scratch, uuid.uuid4().hex)
+    os.makedirs(path)
+    return path
+
+
+def clear_dir(path: str) -> None:
+    """remove the contents of a scratch directory, keeping the directory"""
+    for entry in os.listdir(path):
+        entry_path = os.path.join(path, entry)
+        if os.path.isdir(entry_path):
+            shutil.rmtree(entry_path)
+        else:
+            os.remove(entry_path)
+
+
+def signal_frame(kdf: pd.DataFrame, seed: int = 0) -> pd.DataFrame:
+    """kdf with the columns every strategy reads: seeded sparse entry signals, atr, std and dema"""
+    from index import ta
+
+    rng = np.random.default_rng(seed)
+    signal = kdf.copy()
+    signal["signal"] = rng.choice([-1, 0, 1], len(kdf), p=[0.02, 0.96, 0.02])
+    high, low, close = (kdf[col].to_numpy() for col in ("high", "low", "close"))
+    signal["atr"] = ta.atr(high, low, close, 14)
+    signal["std"] = ta.stdev(close, 54)
+    signal["dema"] = ta.dema(close, 54)
+    return signal.bfill()
+
+
+# indicators
+
+
+def _indicator(cls_path: str, *params):
+    def factory(kdf):
+        module, cls = cls_path.rsplit(".", 1)
+        indicator = getattr(importlib.import_module(module), cls)
+        return lambda: indicator(kdf, *params).get_indicator()
+
+    return factory
+
+
+benchmark("indicator.adx", "indicators")(_indicator("index.indicators.Adx", 14))
+benchmark("indicator.stochrsi", "indicators")(_indicator("index.indicators.StochRsi", 72, 9, 6))
+benchmark("indicator.macd", "indicators")(_indicator("index.indicators.Macd", 12, 26, 9))
+benchmark("indicator.supertrend", "indicators")(_indicator("index.indicators.Supertrend", 10, 3.0))
+benchmark("indicator.trendline", "indicators")(_indicator("index.indicators.Trendline", 14, 10, 1.0))
+benchmark("indicator.vwap", "indicators")(_indicator("index.indicators.Vwap", 20))
+
+
+@benchmark("idx_pvdf.pvdf", "indicators")
+def _pvdf(kdf):
+    from index.idx_pvdf import IdxPvdf
+
+    return lambda: IdxPvdf(kdf).pvdf()
+
+
+@benchmark("idx_pvdf.pvdf_pandas", "indicators")
+def _pvdf_pandas(kdf):
+    from index.idx_pvdf import IdxPvdf
+
+    return lambda: IdxPvdf(kdf)._pvdf_pandas()
+
+
+@benchmark("idx_pvdf.stream_1000_bars", "indicators")
+def _pvdf_stream(kdf):
+    from index.idx_pvdf import PvdfStream
+
+    close = kdf["close"].to_numpy()
+    volume = kdf["volume_U"].to_numpy()
+    split = max(len(kdf) - 1000, 200)
+
+    def run():
+        stream = PvdfStream()
+        stream.warmup(close[:split], volume[:split])
+        for i in range(split, len(close)):
+            stream.update(close[i], volume[i])
+
+    return run
+
+
+# strategies
+
+
+@benchmark("strategy.atropen.get_result", "strategies")
+def _atropen(kdf):
+    from strategy.stringent import AtrOpen
+
+    signal = signal_frame(kdf)
+    return lambda: AtrOpen(6.0, 2.0, 2000, 5).get_result(signal)
+
+
+@benchmark("strategy.atropen.grid_performance_100", "strategies")
+def _atropen_grid(kdf):
+    from strategy.stringent import AtrOpen
+
+    signal = signal_frame(kdf)
+    tp_atr, sl_atr = (axis.ravel() for axis in np.meshgrid(np.arange(1, 11.0), np.arange(0.5, 5.5, 0.5)))
+    return lambda: AtrOpen.grid_performance(signal, 2000, tp_atr, sl_atr)
+
+
+@benchmark("strategy.demastd.get_result", "strategies")
+def _demastd(kdf):
+    from strategy.multiple import DemaStd
+
+    signal = signal_frame(kdf)
+    return lambda: DemaStd(10, 2, 2000, 5).get_result(signal)
+
+
+@benchmark("strategy.trailing.get_result", "strategies")
+def _trailing(kdf):
+    from strategy.trailing import DemaTrailing
+
+    signal = signal_frame(kdf)
+    return lambda: DemaTrailing(0.02, 0.01, 2000, 5).get_result(signal)
+
+
+@benchmark("strategy.fishnet.generate_portfolio", "strategies")
+def _fishnet(kdf):
+    from strategy.fishnet import StgyMakerjay
+
+    maker_price = kdf[["high", "low", "close"]].copy()
+    for name, offset in (("buy1", -1e-3), ("sell1", 1e-3), ("buy2", -2e-3), ("sell2", 2e-3)):
+        maker_price[name] = maker_price["close"].shift(1).bfill() * (1 + offset)
+    return lambda: StgyMakerjay(2000, 0.01, -0.01).generate_portfolio(maker_price)
+
+
+@benchmark("backtest.calculate_performance", "strategies")
+def _performance(kdf):
+    from strategy.stringent import AtrOpen
+
+    strategy = AtrOpen(6.0, 2.0, 2000, 5)
+    portfolio = strategy.get_result(signal_frame(kdf))
+    return lambda: strategy.calculate_performance(portfolio)
+
+
+# one optuna trial of every alpha, on the dataset instead of the test_data csv
+
+
+def _alpha_trial(module_name: str, kdf_hook: str, **kwargs):
+    def factory(kdf):
+        import optuna
+        from research.result_book import ResultBook, dataset_hash
+
+        optuna.logging.set_verbosity(optuna.logging.WARNING)
+        module = importlib.import_module(module_name)
+        cls = next(
+            obj for name, obj in vars(module).items()
+            if name.startswith("Alp") and isinstance(obj, type) and obj.__module__ == module_name
+        )
+        alpha = cls(money=2000, leverage=5, **kwargs)
+        setattr(alpha, kdf_hook, lambda symbol: kdf)
+        alpha.dataset_hash = dataset_hash([kdf])
+        book_dir = scratch_dir()
+        alpha.result_book = ResultBook(book_dir)
+
+        def run():
+            study = optuna.create_study(direction="maximize", sampler=optuna.samplers.RandomSampler(seed=0))
+            study.optimize(alpha.objective, n_trials=1)
+            return study.best_value
+
+        def reset():
+            # an empty book so the trial is computed rather than found
+            alpha.result_book.flush()
+            clear_dir(book_dir)
+            alpha.result_book.reload()
+
+        return run, reset
+
+    return factory
+
+
+benchmark("alpha.adx_stochrsi_atropen.trial", "alphas")(
+    _alpha_trial("research.Alpha.alp_adx_stochrsi_atropen", "_read_kdf_from_csv", params={})
+)
+benchmark("alpha.adx_stochrsi_demastd.trial", "alphas")(
+    _alpha_trial("research.Alpha.alp_adx_stochrsi_demastd", "_read_kdf")
+)
+benchmark("alpha.super_vwap_atropen.trial", "alphas")(
+    _alpha_trial("research.Alpha.alp_super_vwap_atropen", "_read_kdf_from_csv", params={})
+)
+benchmark("alpha.super_vwap_trailing.trial", "alphas")(
+    _alpha_trial("research.Alpha.alp_super_vwap_trailing", "_read_kdf_from_csv", params={})
+)
+
+
+# io
+
+
+@benchmark("kline_csv.parse", "io")
+def _csv_parse(kdf):
+    path = os.path.join(scratch_dir(), "BTCUSDT_1m.csv")
+    kdf.to_csv(path)
+
+    def run():
+        # the parsing of ModeLBest.read_market
+        market = pd.read_csv(path)
+        market["opentime"] = pd.to_datetime(market["opentime"], format="%Y-%m-%d %H:%M:%S")
+        market["closetime"] = pd.to_datetime(market["closetime"], format="%Y-%m-%d %H:%M:%S")
+        return market.set_index("opentime")
+
+    return run
+
+
+@benchmark("kline_store.ingest_csv_and_load", "io")
+def _store_ingest(kdf):
+    from research.Market.kline_store import KlineStore
+
+    path = os.path.join(scratch_dir(), "BTCUSDT_1m.csv")
+    kdf.to_csv(path)
+    store_dir = scratch_dir()
+    store = KlineStore(store_dir)
+    # an empty store so every call ingests
+    return lambda: store.load_or_ingest_csv("BTCUSDT", "1m", path), lambda: clear_dir(store_dir)
+
+
+@benchmark("kline_store.load", "io")
+def _store_load(kdf):
+    from research.Market.kline_store import KlineStore
+
+    store = KlineStore(scratch_dir())
+    store.ingest("BTCUSDT", "1m", kdf)
+    return lambda: store.load("BTCUSDT", "1m")
+
+
+@benchmark("shared_numpy_array.roundtrip", "io")
+def _shm_roundtrip(kdf):
+    from contek_pyutils.shm.shared_numpy_array import SharedNumpyArray
+
+    array = kdf.select_dtypes("number").to_numpy(np.float64)
+
+    def run():
+        shared = SharedNumpyArray(f"bench_{uuid.uuid4().hex[:12]}", array)
+        try:
+            return SharedNumpyArray(shared.name).copy()
+        finally:
+            shared.unlink()
+
+    return run
@@ -2,16 +2,19 @@ import asyncio
 import json
 import logging
 import traceback
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
 import pandas as pd
 import psycopg
+from psycopg import sql
 from psycopg_pool.pool_async import AsyncConnectionPool
 from tenacity import retry
 from tenacity.after import after_log
 from tenacity.stop import stop_after_attempt
 
+from contek_pyutils.pg_binary import PgBinaryDecoder
+
 logger = logging.getLogger(__name__)
 
 
@@ -21,6 +24,7 @@ class AsyncTsdbClient:
     """
 
     CHUNK_MILLIS = 1000 * 60 * 60 * 24 * 7  # 7 days
+    BIGINT_COLUMNS = ("time", "ingestion_tp", "last_update_tp")
 
     def __init__(
         self,
@@ -48,6 +52,9 @@ class AsyncTsdbClient:
     def stats(self) -> Dict[str, int]:
         return self._pool.get_stats()
 
+    async def close(self):
+        await self._pool.close()
+
     @property
     async def current_tables(self) -> List[str]:
         query = "SELECT table_name FROM information_schema.tables " "WHERE table_schema = 'public'"
@@ -151,6 +158,39 @@ class AsyncTsdbClient:
         col_nonnumeric = dict(zip(columns, list(np.isnan(c_r))))
         return col_nonnumeric
 
+    @classmethod
+    def _get_copy_types(cls, tags: List[str], columns: List[str], col_nonnumeric: dict) -> List[str]:
+        def copy_type(col: str) -> str:
+            if col in cls.BIGINT_COLUMNS:
+                return "int8"
+            elif col in tags or col_nonnumeric.get(col):
+                return "text"
+            else:
+                return "float8"
+
+        return [copy_type(col) for col in columns]
+
+    async def _repair_schema(
+        self,
+        e: BaseException,
+        table_name: str,
+        tags: List[str],
+        columns: List[str],
+        col_nonnumeric: dict,
+    ):
+        match type(e):
+            case psycopg.errors.UndefinedTable:
+                logger.warning(f"table {table_name} not found, creating...")
+                await self._create_hypertable(table_name, tags, columns, col_nonnumeric)
+
+            case psycopg.errors.UndefinedColumn:
+                logger.warning(f"{table_name}: updating columns...")
+                await self._update_columns(table_name, columns, tags, col_nonnumeric)
+
+            case psycopg.errors.InvalidColumnReference:
+                logger.warning(f"{table_name}: updating index...")
+                await self._update_unique_index(table_name, tags)
+
     @retry(
         after=after_log(logger, logging.ERROR),
         stop=stop_after_attempt(3),
@@ -183,19 +223,60 @@ class AsyncTsdbClient:
                     await cursor.executemany(query.encode(), records)
 
         except BaseException as e:
-            match type(e):
-                case psycopg.errors.UndefinedTable:
-                    logger.warning(f"table {table_name} not found, creating...")
-                    await self._create_hypertable(table_name, tags, columns, col_nonnumeric)
+            await self._repair_schema(e, table_name, tags, columns, col_nonnumeric)
+            logger.error("".join(traceback.TracebackException.from_exception(e).format()))
+            raise e
+
+    @retry(
+        after=after_log(logger, logging.ERROR),
+        stop=stop_after_attempt(3),
+    )
+    async def copy_write(
+        self,
+        table_name: str,
+        tags: List[str],
+        columns: List[str],
+        records: List[list],
+    ):
+        """
+        Bulk upsert through binary COPY into a temporary staging table followed by a single
+        INSERT ... SELECT ... ON CONFLICT merge. Records must be unique by (tags, time).
+        """
+        assert set(tags).issubset(set(columns)), "tags must be a subset of columns"
+        assert (
+            len(tags) >= 2 and tags[0] == "interval" and tags[1] == "c_symbol"
+        ), f"tags {tags} must start with [interval, c_symbol...]"
 
-                case psycopg.errors.UndefinedColumn:
-                    logger.warning(f"{table_name}: updating columns...")
-                    await self._update_columns(table_name, columns, tags, col_nonnumeric)
+        col_nonnumeric = self._get_col_nonnumeric(columns, records)
+        copy_types = self._get_copy_types(tags, columns, col_nonnumeric)
 
-                case psycopg.errors.InvalidColumnReference:
-                    logger.warning(f"{table_name}: updating index...")
-                    await self._update_unique_index(table_name, tags)
+        staging_name = f"{table_name}_staging"
+        cols_str = json.dumps(columns)[1:-1]
+        tags_str = json.dumps(list({*tags, "time"}))[1:-1]
+        set_str = ",".join([f'"{t}" = excluded."{t}"' for t in columns])
+        merge_query = f"""
+            INSERT INTO {table_name} ({cols_str})
+            SELECT {cols_str} FROM "{staging_name}"
+            ON CONFLICT ({tags_str}) DO UPDATE SET {set_str}
+            """
+        try:
+            async with self._pool.connection() as conn:
+                async with conn.transaction():
+                    async with conn.cursor() as cursor:
+                        await cursor.execute(
+                            f'CREATE TEMP TABLE "{staging_name}" (LIKE {table_name} INCLUDING DEFAULTS) '
+                            f"ON COMMIT DROP".encode()
+                        )
+                        async with cursor.copy(
+                            f'COPY "{staging_name}" ({cols_str}) FROM STDIN (FORMAT BINARY)'.encode()
+                        ) as copy:
+                            copy.set_types(copy_types)
+                            for record in records:
+                                await copy.write_row(record)
+                        await cursor.execute(merge_query.encode())
 
+        except BaseException as e:
+            await self._repair_schema(e, table_name, tags, columns, col_nonnumeric)
             logger.error("".join(traceback.TracebackException.from_exception(e).format()))
             raise e
 
@@ -205,3 +286,43 @@ class AsyncTsdbClient:
             return pd.DataFrame()
         else:
             return pd.DataFrame(cur_res, columns=[c.name for c in cur_des])
+
+    async def iter_arrays(
+        self,
+        query: Union[str, sql.Composable],
+        params: Optional[Sequence[Any]] = None,
+        chunk_rows: int = 1_000_000,
+    ) -> AsyncIterator[Dict[str, np.ndarray]]:
+        """
+        Stream the result of a SELECT through binary COPY TO STDOUT and yield it in chunks of
+        about chunk_rows rows as typed numpy columns. Every selected column must be fixed width
+        (bigint, integer, double precision, real, bool, timestamp), cast the others in the query.
+        Values are passed as %s params, bound client side since COPY takes no server side params.
+        The pooled connection is held until the iterator is exhausted or closed.
+        """
+        if isinstance(query, str):
+            query = sql.SQL(query.strip().rstrip(";"))
+        async with self._pool.connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(sql.SQL("SELECT * FROM ({}) AS q LIMIT 0").format(query), params)
+                columns = [c.name for c in cursor.description]
+                decoder = PgBinaryDecoder(columns, [c.type_code for c in cursor.description])
+                async with cursor.copy(sql.SQL("COPY ({}) TO STDOUT (FORMAT BINARY)").format(query), params) as copy:
+                    async for data in copy:
+                        decoder.feed_pending(data)
+                        if decoder.num_pending_rows >= chunk_rows:
+                            yield decoder.take()
+                tail = decoder.finish()
+                if len(tail[columns[0]]) > 0:
+                    yield tail
+
+    async def query_arrays(
+        self, query: Union[str, sql.Composable], params: Optional[Sequence[Any]] = None
+    ) -> Dict[str, np.ndarray]:
+        """query_df counterpart decoding straight into numpy columns, see iter_arrays"""
+        chunks = [chunk async for chunk in self.iter_arrays(query, params)]
+        if len(chunks) == 1:
+            return chunks[0]
+        elif not chunks:
+            return {}
+        return {c: np.concatenate([chunk[c] for chunk in chunks]) for c in chunks[0]}
@@ -1,15 +1,16 @@
 import functools
 import os
+import sys
 from typing import Optional
 
 
 @functools.cache
 def is_interactive() -> bool:
-    try:
-        from IPython import get_ipython  # type: ignore
-    except ImportError:
+    # an IPython shell has imported IPython already, importing it here would cost plain processes ~0.3s
+    ipython = sys.modules.get("IPython")
+    if ipython is None:
         return False
-    ip = get_ipython()
+    ip = ipython.get_ipython()
     return ip is not None  # Probably standard Python interpreter
 
 
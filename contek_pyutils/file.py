@@ -6,14 +6,16 @@ import shutil
 import tempfile
 from functools import cache
 from pathlib import Path
-from typing import Dict, List, Optional, Set
+from typing import TYPE_CHECKING, Dict, List, Optional, Set
 
-import aiohttp
 import pandas as pd
 from expression import Nothing, Option, Some
 
 from contek_pyutils.func.core import none_or
 
+if TYPE_CHECKING:
+    import aiohttp
+
 
 def pickle_dump_to_temp(obj, prefix=None, suffix=None, tmp_dir=None) -> Option[str]:
     tmp_dir = none_or(tmp_dir, tempfile.gettempdir())
@@ -61,11 +63,13 @@ def csv_to_df(file: str | Path) -> pd.DataFrame:
 
 @cache
 def get_session(host: str, token: str):
+    import aiohttp
+
     s = aiohttp.ClientSession(base_url=host, headers={"authorization": f"token {token}"})
     return s
 
 
-def check_http_status_code(resp: aiohttp.ClientResponse) -> aiohttp.ClientResponse:
+def check_http_status_code(resp: "aiohttp.ClientResponse") -> "aiohttp.ClientResponse":
     if resp.status != 200:
         raise Exception(resp.content)
     return resp
@@ -5,17 +5,16 @@ import logging
 import tarfile
 import tempfile
 
-import aiohttp
-import git
-from aiohttp_retry import RetryClient
-from git.repo import Repo
-
 from contek_pyutils.file import load_dir
 
 GITHUB_API_ENTRY_POINT = "https://api.github.com"
 
 
 async def release_from_github(token: str, repo: str, owner: str = "contek-io", release_name="latest") -> dict:
+    # aiohttp is slow to import and only needed for the api calls
+    import aiohttp
+    from aiohttp_retry import RetryClient
+
     auth_header = {"authorization": f"token {token}"}
     release_name = f"tags/{release_name}" if release_name != "latest" else "latest"
     async with RetryClient(
@@ -36,6 +35,9 @@ async def release_from_github(token: str, repo: str, owner: str = "contek-io", r
 
 
 async def file_from_github(token: str, repo: str, path: str, owner: str = "contek-io", branch="master") -> str:
+    import aiohttp
+    from aiohttp_retry import RetryClient
+
     async with RetryClient(
         aiohttp.ClientSession(
             base_url="https://api.github.com",
@@ -58,6 +60,10 @@ async def dir_from_github(
     use_clone=True,
 ) -> dict:
     if use_clone:
+        # GitPython is slow to import and only needed for cloning
+        import git
+        from git.repo import Repo
+
         success = False
         count = 0
         while not success and count < 2:
@@ -74,6 +80,9 @@ async def dir_from_github(
                 continue
         raise ValueError("Load dir from github failed")
     else:
+        import aiohttp
+        from aiohttp_retry import RetryClient
+
         base_url = "https://api.github.com"
 
         def get_url(e):
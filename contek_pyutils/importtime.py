@@ -0,0 +1,105 @@
+import argparse
+import os
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+IMPORT_TIME_PREFIX = "import time:"
+
+
+@dataclass
+class ImportRecord:
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(stderr: str) -> List[ImportRecord]:
+    """parse the -X importtime lines of a python process, in the order python prints them"""
+    records = []
+    for line in stderr.splitlines():
+        if not line.startswith(IMPORT_TIME_PREFIX):
+            continue
+        fields = line[len(IMPORT_TIME_PREFIX) :].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # the header line
+            continue
+        name = fields[2].rstrip()
+        stripped = name.lstrip(" ")
+        records.append(
+            ImportRecord(
+                name=stripped,
+                self_us=int(fields[0]),
+                cumulative_us=int(fields[1]),
+                depth=(len(name) - len(stripped) - 1) // 2,
+            )
+        )
+    return records
+
+
+def profile_imports(target: str, python: str = sys.executable, env: Optional[Dict[str, str]] = None) -> List[ImportRecord]:
+    """
+    import target in a fresh interpreter with -X importtime. A path to a script is run without its
+    __main__ block, anything else is imported as a module name.
+    """
+    if os.path.isfile(target):
+        code = f"import runpy; runpy.run_path({os.path.abspath(target)!r}, run_name='__importtime__')"
+    else:
+        code = f"import {target}"
+    proc = subprocess.run([python, "-X", "importtime", "-c", code], capture_output=True, text=True, env=env)
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {target} failed:\n{proc.stderr[-2000:]}")
+    return parse_importtime(proc.stderr)
+
+
+def total_seconds(records: List[ImportRecord]) -> float:
+    return sum(record.cumulative_us for record in records if record.depth == 0) / 1e6
+
+
+def package_cost(records: List[ImportRecord]) -> Dict[str, int]:
+    """self time summed by top level package, in microseconds"""
+    cost: Dict[str, int] = {}
+    for record in records:
+        package = record.name.split(".")[0]
+        cost[package] = cost.get(package, 0) + record.self_us
+    return dict(sorted(cost.items(), key=lambda item: -item[1]))
+
+
+def format_report(records: List[ImportRecord], top: int = 20) -> str:
+    lines = [f"total import time: {total_seconds(records):.3f}s over {len(records)} modules", ""]
+    lines.append(f"{'package':<40}{'self ms':>10}")
+    for package, self_us in list(package_cost(records).items())[:top]:
+        lines.append(f"{package:<40}{self_us / 1e3:>10.1f}")
+    lines.append("")
+    lines.append(f"{'module':<60}{'self ms':>10}{'cumul ms':>10}")
+    for record in sorted(records, key=lambda record: -record.cumulative_us)[:top]:
+        lines.append(f"{record.name:<60}{record.self_us / 1e3:>10.1f}{record.cumulative_us / 1e3:>10.1f}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="per module import cost of a script or module")
+    parser.add_argument("targets", nargs="+", help="script paths or module names")
+    parser.add_argument("--top", type=int, default=20, help="rows per table")
+    parser.add_argument("--budget", type=float, default=None, help="fail when a target imports slower, in seconds")
+    parser.add_argument("--repeat", type=int, default=1, help="report the fastest of this many imports")
+    args = parser.parse_args(argv)
+
+    over_budget = []
+    for target in args.targets:
+        # the first import also warms the file cache, later ones measure the interpreter alone
+        records = min((profile_imports(target) for _ in range(args.repeat)), key=total_seconds)
+        print(f"=== {target}")
+        print(format_report(records, args.top))
+        print()
+        if args.budget is not None and total_seconds(records) > args.budget:
+            over_budget.append(target)
+    for target in over_budget:
+        print(f"{target} is over the startup budget of {args.budget}s")
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
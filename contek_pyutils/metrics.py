@@ -0,0 +1,311 @@
+import bisect
+import functools
+import inspect
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# histogram upper bounds in seconds, four per octave from 1us to ~100s
+BUCKETS: List[float] = [1e-6 * 2 ** (i / 4) for i in range(108)]
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Histogram:
+    """Counts of observations per BUCKETS bucket, with sum and max, quantiles are interpolated"""
+
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return math.nan
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if cumulative + count >= rank and count > 0:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(lower + (upper - lower) * (rank - cumulative) / count, self.max)
+            cumulative += count
+        return self.max
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms keyed by name and labels. Updates are not locked: they come from the
+    event loop thread of a process, a racing update from another thread may be lost, never corrupt.
+    """
+
+    def __init__(self) -> None:
+        self.counters: Dict[_Key, float] = {}
+        self.histograms: Dict[_Key, Histogram] = {}
+        self.started = time.time()
+
+    def inc(self, name: str, value: float, labels: dict) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: dict) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def clear(self) -> None:
+        self.counters.clear()
+        self.histograms.clear()
+        self.started = time.time()
+
+    def snapshot(self, quantiles=(0.5, 0.9, 0.99)) -> dict:
+        """{"counters": [...], "histograms": [...]} of plain values, e.g. for a json file"""
+        return {
+            "time": time.time(),
+            "started": self.started,
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self.counters.items())
+            ],
+            "histograms": [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": h.count,
+                    "sum": h.sum,
+                    "max": h.max,
+                    **{f"p{q * 100:g}": h.quantile(q) for q in quantiles},
+                }
+                for (name, labels), h in sorted(self.histograms.items())
+            ],
+        }
+
+    def render_prometheus(self) -> str:
+        """prometheus text exposition format"""
+        lines = []
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), h in sorted(self.histograms.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS, h.counts):
+                cumulative += count
+                if count:
+                    lines.append(f"{name}_bucket{_labels(labels, le=f'{bound:.6g}')} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {h.count}")
+            lines.append(f"{name}_sum{_labels(labels)} {h.sum}")
+            lines.append(f"{name}_count{_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: tuple, **extra) -> str:
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+REGISTRY = MetricsRegistry()
+_enabled = False
+
+
+def enable(enabled: bool = True) -> None:
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    if _enabled:
+        REGISTRY.inc(name, value, labels)
+
+
+def observe(name: str, value: float, **labels) -> None:
+    if _enabled:
+        REGISTRY.observe(name, value, labels)
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name: str, labels: dict) -> None:
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        REGISTRY.observe(self.name, time.perf_counter() - self.start, self.labels)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name: str, **labels):
+    """context manager observing the seconds of its block into a histogram, a no-op when disabled"""
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(name, labels)
+
+
+def timed(name: str, **labels) -> Callable:
+    """decorator observing the seconds of every call of a function or coroutine function"""
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return await func(*args, **kwargs)
+                with _Timer(name, labels):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Timer(name, labels):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def latency_since(name: str, event_time: float, **labels) -> None:
+    """observe the wall clock seconds since event_time (epoch seconds), e.g. since a candle closed"""
+    if _enabled:
+        REGISTRY.observe(name, time.time() - event_time, labels)
+
+
+class SnapshotWriter:
+    """Thread writing REGISTRY.snapshot() to a json file every interval seconds, atomically replaced"""
+
+    def __init__(self, path: str, interval: float = 10.0) -> None:
+        self._path = path
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name="metrics-snapshot", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.write()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            try:
+                self.write()
+            except Exception:
+                logger.exception(f"Failed to write metrics snapshot {self._path}.")
+
+    def write(self) -> None:
+        tmp = f"{self._path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(REGISTRY.snapshot(), f, indent=1)
+        os.replace(tmp, self._path)
+
+
+async def serve(host: str = "127.0.0.1", port: int = 9464):
+    """serve /metrics in the prometheus text format and /snapshot as json, returns the aiohttp runner"""
+    from aiohttp import web
+
+    async def metrics(request):
+        return web.Response(text=REGISTRY.render_prometheus(), content_type="text/plain")
+
+    async def snapshot(request):
+        return web.json_response(REGISTRY.snapshot())
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    app.router.add_get("/snapshot", snapshot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return runner
+
+
+async def start_from_config(config: dict, name: str):
+    """
+    enable the metrics of the process name by the "metrics" section of a config, e.g.
+    {"enabled": true, "ports": {"model_best": 9464}, "snapshot_dir": "logs/metrics", "interval": 10};
+    a process listed in ports serves /metrics, returns the SnapshotWriter if a snapshot_dir is set
+    """
+    metrics_config = config.get("metrics") or {}
+    if not metrics_config.get("enabled", False):
+        return None
+    enable()
+    port = (metrics_config.get("ports") or {}).get(name)
+    if port is not None:
+        await serve(metrics_config.get("host", "127.0.0.1"), port)
+    if "snapshot_dir" in metrics_config:
+        writer = SnapshotWriter(
+            os.path.join(metrics_config["snapshot_dir"], f"{name}.json"), metrics_config.get("interval", 10.0)
+        )
+        writer.start()
+        return writer
+    return None
+
+
+if __name__ == "__main__":
+    # overhead of an instrumented block with metrics disabled and enabled
+    def benchmark(num_calls: int = 1_000_000) -> None:
+        for enabled in (False, True):
+            enable(enabled)
+            start = time.perf_counter()
+            for _ in range(num_calls):
+                with timer("bench_seconds", model="model_best"):
+                    pass
+            elapsed = time.perf_counter() - start
+            print(f"enabled={enabled}: {elapsed / num_calls * 1e9:.0f} ns/timer")
+        h = REGISTRY.histograms[("bench_seconds", (("model", "model_best"),))]
+        print(f"p50 {h.quantile(0.5) * 1e9:.0f} ns p99 {h.quantile(0.99) * 1e9:.0f} ns max {h.max * 1e9:.0f} ns")
+
+    benchmark()
@@ -0,0 +1,285 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import TYPE_CHECKING, Deque, Dict, Iterator, List, Optional
+
+if TYPE_CHECKING:
+    # aiohttp is slow to import, it is only needed once the notifier starts
+    import aiohttp
+
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = "oldest"
+DROP_NEWEST = "newest"
+
+
+class Notifier:
+    """
+    Batched alert dispatcher posting to a webhook style HTTP endpoint from a background task.
+
+    notify() only appends to a bounded buffer, so it never waits on the network and can be called
+    from the trading path or from other threads. Every coalesce_window seconds the background task
+    drains the buffer, collapses repeated messages, packs them into as few posts as the destination
+    allows and sends them over one pooled aiohttp session. When the buffer is full the oldest (or
+    the newest, see drop_policy) message is dropped and counted in stats.
+
+    Usage:
+        notifier = DiscordNotifier(url)
+        await notifier.start()
+        notifier.notify("BTCUSD position 0.1")
+        ...
+        await notifier.close()
+    """
+
+    # destination limits of one post, None when unlimited
+    max_chars: Optional[int] = None
+    max_messages: Optional[int] = None
+
+    def __init__(
+        self,
+        url: str,
+        coalesce_window: float = 1.0,
+        max_queue: int = 1000,
+        drop_policy: str = DROP_OLDEST,
+        timeout: float = 10.0,
+        max_retries: int = 3,
+    ):
+        if drop_policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"drop_policy must be {DROP_OLDEST} or {DROP_NEWEST}, got {drop_policy}")
+        self._url = url
+        self._coalesce_window = coalesce_window
+        self._max_queue = max_queue
+        self._drop_policy = drop_policy
+        self._timeout = timeout
+        self._max_retries = max_retries
+        self._buffer: Deque[str] = deque()
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing: Optional[asyncio.Event] = None
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stats = {"messages_sent": 0, "messages_dropped": 0, "posts": 0, "posts_failed": 0}
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Content-Type": "application/json"}
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        stats = dict(self._stats)
+        stats["messages_buffered"] = len(self._buffer)
+        return stats
+
+    def payload(self, messages: List[str]) -> dict:
+        raise NotImplementedError
+
+    def notify(self, message: str) -> bool:
+        """buffer a message for the next post, False when it is dropped by the drop policy"""
+        if len(self._buffer) >= self._max_queue:
+            self._stats["messages_dropped"] += 1
+            if self._drop_policy == DROP_NEWEST:
+                return False
+            try:
+                self._buffer.popleft()
+            except IndexError:
+                pass
+        self._buffer.append(message)
+        return True
+
+    async def start(self):
+        if self._task is None:
+            import aiohttp
+
+            timeout = aiohttp.ClientTimeout(total=self._timeout)
+            self._session = aiohttp.ClientSession(timeout=timeout, headers=self.headers)
+            self._closing = asyncio.Event()
+            self._task = asyncio.create_task(self._dispatch_loop())
+
+    async def close(self):
+        if self._task is not None:
+            # let the dispatch loop finish the post in flight and flush the rest, cancelling it would
+            # lose that batch without counting it as dropped
+            self._closing.set()
+            try:
+                await asyncio.shield(self._task)
+            except asyncio.CancelledError:
+                if not self._task.cancelled():
+                    raise
+            self._task = None
+        if self._session is not None:
+            await self.flush()
+            await self._session.close()
+            self._session = None
+
+    def start_thread(self):
+        """run the dispatcher in a daemon thread with its own event loop, for synchronous callers"""
+        if self._thread is not None:
+            return
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.close())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop_thread(self, timeout: Optional[float] = None):
+        """flush the buffer and stop the thread of start_thread"""
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._thread = None
+
+    async def _dispatch_loop(self):
+        closing = False
+        while not closing:
+            try:
+                await asyncio.wait_for(self._closing.wait(), timeout=self._coalesce_window)
+                closing = True
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to dispatch notifications.")
+
+    async def flush(self):
+        messages = []
+        while self._buffer:
+            messages.append(self._buffer.popleft())
+        if not messages:
+            return
+        for batch in self._batches(self._collapse(messages)):
+            if await self._post(self.payload(batch)):
+                self._stats["messages_sent"] += len(batch)
+            else:
+                self._stats["messages_dropped"] += len(batch)
+
+    @staticmethod
+    def _collapse(messages: List[str]) -> List[str]:
+        """merge runs of the same message into one with a repeat count"""
+        collapsed = []
+        count = 0
+        for i, message in enumerate(messages):
+            count += 1
+            if i + 1 < len(messages) and messages[i + 1] == message:
+                continue
+            collapsed.append(message if count == 1 else f"{message} (x{count})")
+            count = 0
+        return collapsed
+
+    def _batches(self, messages: List[str]) -> Iterator[List[str]]:
+        """consecutive messages packed under max_chars and max_messages of one post"""
+        batch: List[str] = []
+        num_chars = 0
+        for message in messages:
+            if self.max_chars is not None:
+                message = message[: self.max_chars]
+            # one separator per joined message
+            size = len(message) + (1 if batch else 0)
+            if batch and (
+                (self.max_chars is not None and num_chars + size > self.max_chars)
+                or (self.max_messages is not None and len(batch) >= self.max_messages)
+            ):
+                yield batch
+                batch, num_chars, size = [], 0, len(message)
+            batch.append(message)
+            num_chars += size
+        if batch:
+            yield batch
+
+    async def _post(self, payload: dict) -> bool:
+        import aiohttp
+
+        for attempt in range(self._max_retries + 1):
+            try:
+                async with self._session.post(self._url, json=payload) as response:
+                    if response.status == 429:
+                        retry_after = float(response.headers.get("Retry-After", 1.0))
+                        logger.warning(f"Rate limited by {type(self).__name__}, retry after {retry_after}s")
+                        await asyncio.sleep(retry_after)
+                        continue
+                    if response.status >= 400:
+                        logger.warning(f"{type(self).__name__} post failed: {response.status} {await response.text()}")
+                        break
+                    if not await self._accepted(response):
+                        break
+                self._stats["posts"] += 1
+                return True
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"{type(self).__name__} post failed: {e!r}")
+                await asyncio.sleep(min(2**attempt, 30))
+        self._stats["posts_failed"] += 1
+        return False
+
+    async def _accepted(self, response: "aiohttp.ClientResponse") -> bool:
+        return True
+
+
+class DiscordNotifier(Notifier):
+    """Notifier of a discord webhook, the messages of a post are joined into one content"""
+
+    max_chars = 2000
+
+    def payload(self, messages: List[str]) -> dict:
+        return {"content": "\n".join(messages)}
+
+    @classmethod
+    def from_config(cls, config: dict) -> Optional["DiscordNotifier"]:
+        """build a notifier from the "discord_webhook" section of a config, None when it is absent"""
+        webhook_config = dict(config.get("discord_webhook") or {})
+        if not webhook_config.get("url"):
+            return None
+        return cls(**webhook_config)
+
+
+class SlackNotifier(Notifier):
+    """Notifier posting to a slack channel id through chat.postMessage, one code block per message"""
+
+    base_url = "https://slack.com/api/chat.postMessage"
+    max_chars = 2900  # section text is limited to 3000 chars
+    max_messages = 50  # blocks per message
+
+    def __init__(self, token: str, channel_id: str, url: Optional[str] = None, **kwargs):
+        self._token = token
+        self._channel_id = channel_id
+        super().__init__(url or self.base_url, **kwargs)
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Content-Type": "application/json; charset=utf-8", "Authorization": f"Bearer {self._token}"}
+
+    def _batches(self, messages: List[str]) -> Iterator[List[str]]:
+        # the chars limit is per block rather than per post
+        batch: List[str] = []
+        for message in messages:
+            batch.append(message[: self.max_chars])
+            if len(batch) >= self.max_messages:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def payload(self, messages: List[str]) -> dict:
+        return {
+            "channel": self._channel_id,
+            "text": messages[0],
+            "blocks": [{"type": "section", "text": {"type": "mrkdwn", "text": f"```\n{msg}\n```"}} for msg in messages],
+        }
+
+    async def _accepted(self, response: "aiohttp.ClientResponse") -> bool:
+        # slack answers 200 with ok false on errors
+        result = await response.json(content_type=None)
+        if not result.get("ok", False):
+            logger.warning(f"SlackNotifier post failed: {result.get('error')}")
+            return False
+        return True
+
@@ -0,0 +1,177 @@
+import struct
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+__all__ = ["PgBinaryDecoder", "decode_copy_binary", "PG_FIXED_TYPES"]
+
+COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+# microseconds between 1970-01-01 and the postgres epoch 2000-01-01
+PG_EPOCH_MICROS = 946_684_800_000_000
+
+# oid -> (wire dtype, output dtype) for the fixed width types we can decode without python loops
+PG_FIXED_TYPES = {
+    16: (">?", np.bool_),  # bool
+    20: (">i8", np.int64),  # int8
+    21: (">i2", np.int16),  # int2
+    23: (">i4", np.int32),  # int4
+    700: (">f4", np.float32),  # float4
+    701: (">f8", np.float64),  # float8
+    1114: (">i8", "datetime64[us]"),  # timestamp
+    1184: (">i8", "datetime64[us]"),  # timestamptz
+}
+
+
+class PgBinaryDecoder:
+    """
+    Incremental decoder of the postgres binary COPY format into typed numpy columns.
+
+    Rows without NULL have a fixed size, so complete rows are decoded by viewing the
+    buffer through a structured big-endian dtype. A row holding NULL breaks the fixed
+    layout and is decoded on its own, NULL becoming NaN (integer columns are promoted
+    to float64, timestamps to NaT).
+
+    Usage:
+        decoder = PgBinaryDecoder(["time", "close"], [20, 701])
+        for data in copy_stream:
+            columns = decoder.feed(data)
+        columns = decoder.finish()
+    """
+
+    def __init__(self, columns: Sequence[str], oids: Sequence[int]):
+        unsupported = [c for c, oid in zip(columns, oids) if oid not in PG_FIXED_TYPES]
+        if unsupported:
+            raise ValueError(f"Columns {unsupported} are not fixed width numeric, cast them in the query")
+        self.columns = list(columns)
+        self._wire_dtypes = [np.dtype(PG_FIXED_TYPES[oid][0]) for oid in oids]
+        self._out_dtypes = [np.dtype(PG_FIXED_TYPES[oid][1]) for oid in oids]
+        self._is_timestamp = [oid in (1114, 1184) for oid in oids]
+        fields = [("count", ">i2")]
+        for i, wire_dtype in enumerate(self._wire_dtypes):
+            fields += [(f"len{i}", ">i4"), (f"val{i}", wire_dtype)]
+        self._row_dtype = np.dtype(fields)
+        self._widths = [d.itemsize for d in self._wire_dtypes]
+        self._buf = bytearray()
+        self._header_done = False
+        self._finished = False
+        self._pending: List[Dict[str, np.ndarray]] = []
+
+    def _parse_header(self) -> bool:
+        if len(self._buf) < len(COPY_SIGNATURE) + 8:
+            return False
+        if bytes(self._buf[: len(COPY_SIGNATURE)]) != COPY_SIGNATURE:
+            raise ValueError("Not a postgres binary COPY stream")
+        offset = len(COPY_SIGNATURE) + 4
+        (extension_len,) = struct.unpack_from(">i", self._buf, offset)
+        header_len = offset + 4 + extension_len
+        if len(self._buf) < header_len:
+            return False
+        del self._buf[:header_len]
+        self._header_done = True
+        return True
+
+    def _convert(self, i: int, values: np.ndarray) -> np.ndarray:
+        if self._is_timestamp[i]:
+            return (values.astype(np.int64) + PG_EPOCH_MICROS).view("datetime64[us]")
+        return values.astype(self._out_dtypes[i])
+
+    def _decode_fixed_rows(self, offset: int, num_rows: int) -> int:
+        """decode the leading rows without NULL, return how many were decoded"""
+        rows = np.frombuffer(self._buf, dtype=self._row_dtype, count=num_rows, offset=offset)
+        valid = rows["count"] == len(self.columns)
+        for i, width in enumerate(self._widths):
+            valid &= rows[f"len{i}"] == width
+        num_valid = num_rows if valid.all() else int(np.argmin(valid))
+        if num_valid > 0:
+            self._pending.append(
+                {c: self._convert(i, rows[f"val{i}"][:num_valid]) for i, c in enumerate(self.columns)}
+            )
+        return num_valid
+
+    def _decode_one_row(self, offset: int) -> Optional[int]:
+        """decode a row holding NULL starting at offset, return the offset after it or None if incomplete"""
+        values = {}
+        pos = offset + 2
+        for i, c in enumerate(self.columns):
+            if len(self._buf) < pos + 4:
+                return None
+            (length,) = struct.unpack_from(">i", self._buf, pos)
+            pos += 4
+            if length == -1:
+                if self._is_timestamp[i]:
+                    values[c] = np.array(["NaT"], dtype="datetime64[us]")
+                else:
+                    values[c] = np.array([np.nan])
+                continue
+            if len(self._buf) < pos + length:
+                return None
+            raw = np.frombuffer(self._buf, dtype=self._wire_dtypes[i], count=1, offset=pos)
+            values[c] = self._convert(i, raw)
+            pos += length
+        self._pending.append(values)
+        return pos
+
+    def _consume(self):
+        row_size = self._row_dtype.itemsize
+        offset = 0
+        while not self._finished:
+            available = len(self._buf) - offset
+            if available < 2:
+                break
+            num_rows = available // row_size
+            if num_rows > 0:
+                num_valid = self._decode_fixed_rows(offset, num_rows)
+                if num_valid > 0:
+                    offset += num_valid * row_size
+                    continue
+            (count,) = struct.unpack_from(">h", self._buf, offset)
+            if count == -1:
+                offset += 2
+                self._finished = True
+                break
+            if count != len(self.columns):
+                raise ValueError(f"Expected {len(self.columns)} fields per row but got {count}")
+            next_offset = self._decode_one_row(offset)
+            if next_offset is None:
+                break
+            offset = next_offset
+        del self._buf[:offset]
+
+    def _take(self) -> Dict[str, np.ndarray]:
+        if not self._pending:
+            return {c: np.empty(0, dtype=d) for c, d in zip(self.columns, self._out_dtypes)}
+        pending, self._pending = self._pending, []
+        if len(pending) == 1:
+            return pending[0]
+        return {c: np.concatenate([p[c] for p in pending]) for c in self.columns}
+
+    @property
+    def num_pending_rows(self) -> int:
+        return sum(len(p[self.columns[0]]) for p in self._pending)
+
+    def feed(self, data: bytes) -> Dict[str, np.ndarray]:
+        """feed a block of the stream, return the columns of the rows completed so far"""
+        self._buf += data
+        if self._header_done or self._parse_header():
+            self._consume()
+        return self._take()
+
+    def feed_pending(self, data: bytes):
+        """like feed but keep the decoded rows until take() or finish()"""
+        self._buf += data
+        if self._header_done or self._parse_header():
+            self._consume()
+
+    def take(self) -> Dict[str, np.ndarray]:
+        return self._take()
+
+    def finish(self) -> Dict[str, np.ndarray]:
+        if self._buf:
+            raise ValueError(f"Incomplete binary COPY stream, {len(self._buf)} bytes left")
+        return self._take()
+
+
+def decode_copy_binary(data: bytes, columns: Sequence[str], oids: Sequence[int]) -> Dict[str, np.ndarray]:
+    decoder = PgBinaryDecoder(columns, oids)
+    decoder.feed_pending(data)
+    return decoder.finish()
@@ -1,62 +1,62 @@
 import logging
 import re
-import sys
 import time
 
 from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
+
+from contek_pyutils.notifier import SlackNotifier
+from contek_pyutils.notifier import logger as notifier_logger
 
 
 class SlackHandler(logging.Handler):
+    """
+    Logging handler posting records to a slack channel or user. emit only buffers the record, a
+    SlackNotifier thread posts the records of every rate limit window as one message, so logging
+    never waits on slack. Beyond max_queue buffered records the oldest are dropped.
+    """
+
     def __init__(
         self,
         token: str,
         destination: str,
         limit=20,
+        slack_rate_limit=1.0,
+        max_queue=1000,
     ):
         logging.Handler.__init__(self)
-        self.client = WebClient(token=token)
-        self.limit = limit  # max number of messages in the queue
-        self.msg_queue = []
-        self.last_post_time = 0
-        self.slack_rate_limit = 1.0
+        client = WebClient(token=token)
 
         if re.fullmatch(r"^[a-z0-9]+[\._]?[a-z0-9]+[@]\w+[.]\w+$", destination):
             # Lookup user ID by email
-            self.channel_id = self.client.users_lookupByEmail(email=destination)["user"]["id"]
+            self.channel_id = client.users_lookupByEmail(email=destination)["user"]["id"]
         else:
             # Lookup channel ID by name
             channel_info_list = (
-                self.client.conversations_list(types="private_channel")["channels"]
-                + self.client.conversations_list(types="public_channel")["channels"]
+                client.conversations_list(types="private_channel")["channels"]
+                + client.conversations_list(types="public_channel")["channels"]
             )
             self.channel_id = next(filter(lambda x: x["name"] == destination, channel_info_list))["id"]
 
+        self.notifier = SlackNotifier(
+            token,
+            self.channel_id,
+            coalesce_window=slack_rate_limit,
+            max_queue=max_queue,
+        )
+        self.notifier.max_messages = limit  # max number of records in one message
+        self.notifier.start_thread()
+        # failures of the notifier itself must not be posted back through it
+        self.addFilter(lambda record: record.name != notifier_logger.name)
+
     def emit(self, record):
-        log_entry = self.format(record)
-        self.msg_queue.append(log_entry)
-        if time.time() - self.last_post_time >= self.slack_rate_limit or len(self.msg_queue) >= self.limit:
-            self.post_to_slack(self.msg_queue)
-            self.msg_queue = []
-            self.last_post_time = time.time()
-
-    def post_to_slack(self, msg_queue):
         try:
-            # Create blocks of text with markdown
-            blocks = [
-                {
-                    "type": "section",
-                    "text": {"type": "mrkdwn", "text": f"```\n{msg}\n```"},
-                }
-                for msg in msg_queue
-            ]
-            response = self.client.chat_postMessage(channel=self.channel_id, blocks=blocks, text=msg_queue[0])
-            if not response["ok"]:
-                print(f"Got an error: {response['error']}", file=sys.stderr)
-        except SlackApiError as e:
-            print(f"Got an error: {e.response['error']}", file=sys.stderr)
-        except Exception as e:
-            print(f"Got an error: {e}", file=sys.stderr)
+            self.notifier.notify(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.notifier.stop_thread(timeout=10)
+        logging.Handler.close(self)
 
 
 if __name__ == "__main__":
@@ -81,5 +81,6 @@ if __name__ == "__main__":
         for i in range(5):
             time.sleep(1)
             logger.info("Hello, Slack!")
+        sh.close()
 
     test()
@@ -15,6 +15,8 @@ from tenacity import (
     wait_fixed,
 )
 
+from contek_pyutils.pg_binary import PgBinaryDecoder
+
 logger = logging.getLogger(__name__)
 
 
@@ -416,3 +418,34 @@ class TimescaleDBClient:
             return pd.DataFrame(records, columns=columns)
         else:
             return pd.DataFrame()
+
+    @retry(
+        retry=retry_if_exception_type(psycopg2.OperationalError),
+        after=after_log(logger, logging.WARNING),
+        stop=stop_after_attempt(10),
+    )
+    def query_arrays(self, sql) -> dict:
+        """
+        query_df counterpart streaming the result through binary COPY TO STDOUT and decoding it
+        straight into numpy columns. Selected columns must be fixed width numeric or timestamp.
+        """
+        sql = sql.strip().rstrip(";")
+        self.semaphore.acquire()
+        db_conn = self.try_get_conn()
+
+        try:
+            with db_conn:
+                with db_conn.cursor() as cursor:
+                    cursor.execute(f"SELECT * FROM ({sql}) AS q LIMIT 0")
+                    columns = [desc[0] for desc in cursor.description]
+                    decoder = PgBinaryDecoder(columns, [desc[1] for desc in cursor.description])
+
+                    class _DecoderWriter:
+                        write = staticmethod(decoder.feed_pending)
+
+                    cursor.copy_expert(f"COPY ({sql}) TO STDOUT (FORMAT BINARY)", _DecoderWriter())
+        finally:
+            self.recycle_conn(db_conn)
+            self.semaphore.release()
+
+        return decoder.finish()
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    # psycopg is heavy to import, the client is only built once the sink starts
+    from contek_pyutils.async_tsdb_client import AsyncTsdbClient
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _TableBuffer:
+    tags: List[str]
+    columns: List[str]
+    key_idx: Tuple[int, ...]
+    # (tags..., time) -> record, the last write of a key wins
+    rows: Dict[Tuple[Any, ...], list] = field(default_factory=dict)
+
+
+class AsyncTsdbSink:
+    """
+    Buffered persistence sink on top of AsyncTsdbClient.copy_write.
+
+    put() only appends to an in-memory buffer so it can be called from the trading path,
+    a background task flushes every table with one binary COPY + merge whenever
+    max_rows are buffered or flush_interval seconds passed. Rows beyond max_buffered_rows
+    are dropped and counted in stats instead of growing memory while the database is down.
+
+    Usage:
+        sink = AsyncTsdbSink({"host": ..., "db_name": ...})  # or an AsyncTsdbClient
+        await sink.start()
+        sink.put("kline", ["interval", "c_symbol"], columns, record)
+        ...
+        await sink.close()
+    """
+
+    def __init__(
+        self,
+        client: Union["AsyncTsdbClient", dict],
+        max_rows: int = 10000,
+        flush_interval: float = 1.0,
+        max_buffered_rows: int = 1_000_000,
+    ):
+        self._client = client
+        # a client built from kwargs is owned by the sink and closed with it
+        self._owns_client = isinstance(client, dict)
+        self._max_rows = max_rows
+        self._flush_interval = flush_interval
+        self._max_buffered_rows = max_buffered_rows
+        self._buffers: Dict[str, _TableBuffer] = {}
+        self._num_buffered = 0
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"rows_written": 0, "rows_dropped": 0, "flushes": 0, "flush_seconds": 0.0}
+
+    @classmethod
+    def from_config(cls, config: dict) -> Optional["AsyncTsdbSink"]:
+        """build a sink from the "tsdb" section of a config, None when it is absent"""
+        tsdb_config = dict(config.get("tsdb") or {})
+        if not tsdb_config:
+            return None
+        sink_config = tsdb_config.pop("sink", {})
+        return cls(tsdb_config, **sink_config)
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        stats = dict(self._stats)
+        stats["rows_buffered"] = self._num_buffered
+        if stats["flush_seconds"] > 0:
+            stats["rows_per_sec"] = stats["rows_written"] / stats["flush_seconds"]
+        return stats
+
+    def put(self, table_name: str, tags: List[str], columns: List[str], record: list) -> bool:
+        buffer = self._buffers.get(table_name)
+        if buffer is None:
+            key_idx = tuple(columns.index(col) for col in (*tags, "time"))
+            buffer = self._buffers[table_name] = _TableBuffer(tags, columns, key_idx)
+        elif buffer.columns != columns:
+            raise ValueError(f"{table_name} columns changed from {buffer.columns} to {columns}")
+
+        key = tuple(record[i] for i in buffer.key_idx)
+        if key not in buffer.rows:
+            if self._num_buffered >= self._max_buffered_rows:
+                self._stats["rows_dropped"] += 1
+                return False
+            self._num_buffered += 1
+        buffer.rows[key] = record
+        if self._num_buffered >= self._max_rows:
+            self._full.set()
+        return True
+
+    async def start(self):
+        if isinstance(self._client, dict):
+            from contek_pyutils.async_tsdb_client import AsyncTsdbClient
+
+            self._client = AsyncTsdbClient(**self._client)
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._owns_client and not isinstance(self._client, dict):
+            await self._client.close()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        self._full.clear()
+        buffers, self._buffers = self._buffers, {}
+        self._num_buffered = 0
+        for table_name, buffer in buffers.items():
+            if not buffer.rows:
+                continue
+            records = list(buffer.rows.values())
+            start = time.perf_counter()
+            try:
+                await self._client.copy_write(table_name, buffer.tags, buffer.columns, records)
+            except Exception:
+                logger.exception(f"Failed to flush {len(records)} records into {table_name}, dropped.")
+                self._stats["rows_dropped"] += len(records)
+                continue
+            self._stats["flush_seconds"] += time.perf_counter() - start
+            self._stats["rows_written"] += len(records)
+            self._stats["flushes"] += 1
+            logger.debug(f"Flushed {len(records)} records into {table_name}")
+
+
+if __name__ == "__main__":
+    # throughput benchmark against a local postgres/timescale, e.g.
+    # docker run -d -p 5432:5432 -e POSTGRES_PASSWORD=postgres timescale/timescaledb:latest-pg16
+    import os
+    import random
+
+    async def benchmark(num_rows: int = 200_000):
+        client = AsyncTsdbClient(
+            host=os.getenv("TSDB_HOST", "localhost"),
+            password=os.getenv("TSDB_PASSWORD", "postgres"),
+        )
+        await client._pool.open()
+        tags = ["interval", "c_symbol"]
+        columns = ["time", "interval", "c_symbol", "open", "high", "low", "close", "volume"]
+        start_ms = 1_700_000_000_000
+
+        def records(table_offset: int):
+            return [
+                [start_ms + (i + table_offset) * 60_000, "1m", "BTCUSD"] + [random.random() for _ in range(5)]
+                for i in range(num_rows)
+            ]
+
+        await client.copy_write("bench_kline_copy", tags, columns, records(0)[:1])
+        start = time.perf_counter()
+        await client.copy_write("bench_kline_copy", tags, columns, records(0))
+        copy_rps = num_rows / (time.perf_counter() - start)
+
+        await client.write("bench_kline_values", tags, columns, records(0)[:1])
+        small = records(0)[: num_rows // 10]
+        start = time.perf_counter()
+        await client.write("bench_kline_values", tags, columns, small)
+        executemany_rps = len(small) / (time.perf_counter() - start)
+
+        sink = AsyncTsdbSink(client, max_rows=20000)
+        await sink.start()
+        for record in records(num_rows):
+            sink.put("bench_kline_copy", tags, columns, record)
+            if sink._num_buffered >= 20000:
+                await asyncio.sleep(0)
+        await sink.close()
+
+        print(f"copy_write: {copy_rps:,.0f} rows/sec")
+        print(f"write (executemany): {executemany_rps:,.0f} rows/sec")
+        print(f"sink: {sink.stats}")
+        await client._pool.close()
+
+    asyncio.run(benchmark())
@@ -1,11 +1,15 @@
+import atexit
 import logging.config
 import os
 import sys
 import time
 from typing import Optional
 
+from contek_timbersaw.queue_handler import BoundedQueueHandler, QueueWriter
 from contek_timbersaw.timed_rolling_file_handler import TimedRollingFileHandler
 
+_writer: Optional[QueueWriter] = None
+
 
 def setup():
     log_format = os.getenv(
@@ -22,19 +26,40 @@ def setup():
     log_info_retention_days = int(os.getenv('log_info_retention_days', '7'))
     log_warn_retention_days = int(os.getenv('log_warn_retention_days', '14'))
     log_error_retention_days = int(os.getenv('log_error_retention_days', '28'))
+    # size quotas of the log directories on top of the retention days, 0 for none
+    log_info_quota_mb = int(os.getenv('log_info_quota_mb', '0'))
+    log_warn_quota_mb = int(os.getenv('log_warn_quota_mb', '0'))
+    log_error_quota_mb = int(os.getenv('log_error_quota_mb', '0'))
+    compression_options = {
+        'threads': int(os.getenv('log_compression_threads', '1')),
+        'block_size': int(os.getenv('log_compression_block_size', str(4 * 1024 * 1024))),
+        'bytes_per_sec': float(os.getenv('log_compression_bytes_per_sec', '0')),
+    }
+    # opt-in: the root logger only queues records, a writer thread formats and writes them
+    log_queue = bool(os.getenv('log_queue', False))
+    log_queue_capacity = int(os.getenv('log_queue_capacity', '100000'))
+    log_queue_overflow = os.getenv('log_queue_overflow', 'drop_oldest')
+
+    global _writer
 
     logger = logging.getLogger()
+    handlers = []
     formatter = logging.Formatter(fmt=log_format, datefmt=log_date_format)
     if log_utc:
         formatter.converter = time.gmtime
     stream_handler = logging.StreamHandler()
     stream_handler.setFormatter(formatter)
     stream_handler.setStream(sys.stdout)
-    logger.addHandler(stream_handler)
+    handlers.append(stream_handler)
     logger.setLevel(logging.INFO)
     logger.propagate = True
 
-    def add_file_handler(level: int, retention_days: int, compression_format: Optional[str] = None):
+    def add_file_handler(
+            level: int,
+            retention_days: int,
+            quota_mb: int,
+            compression_format: Optional[str] = None,
+    ):
         file_dir = os.path.join(log_root, logging.getLevelName(level).lower())
         os.makedirs(file_dir, exist_ok=True)
         handler = TimedRollingFileHandler(
@@ -43,14 +68,26 @@ def setup():
             retention=retention_days * 24 * 60 * 60,
             when=log_rolling,
             utc=log_utc,
+            compression_options=compression_options,
+            max_bytes=quota_mb * 1024 * 1024,
         )
         handler.setFormatter(formatter)
         handler.setLevel(level)
-        logger.addHandler(handler)
+        handlers.append(handler)
+
+    add_file_handler(logging.INFO, log_info_retention_days, log_info_quota_mb, 'gz')
+    add_file_handler(logging.WARN, log_warn_retention_days, log_warn_quota_mb)
+    add_file_handler(logging.ERROR, log_error_retention_days, log_error_quota_mb)
 
-    add_file_handler(logging.INFO, log_info_retention_days, 'gz')
-    add_file_handler(logging.WARN, log_warn_retention_days)
-    add_file_handler(logging.ERROR, log_error_retention_days)
+    if log_queue:
+        queue_handler = BoundedQueueHandler(log_queue_capacity, log_queue_overflow)
+        _writer = QueueWriter(queue_handler, handlers)
+        _writer.start()
+        atexit.register(shutdown)
+        logger.addHandler(queue_handler)
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
 
     def handle_exception(exc_type, exc_value, exc_traceback) -> None:
         if issubclass(exc_type, KeyboardInterrupt):
@@ -63,3 +100,11 @@ def setup():
         )
 
     sys.excepthook = handle_exception
+
+
+def shutdown() -> None:
+    """write the records still queued in the log_queue mode and stop the writer thread"""
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
@@ -1,37 +1,106 @@
+import bisect
 import logging
 import os
+import threading
 import time
-import multiprocessing
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Tuple
 
 logger = logging.getLogger(__name__)
-deleter_lock = multiprocessing.Lock()
+
 
 class Deleter:
+    """
+    Retention sweeper of a log directory, by age and optionally by total size.
+
+    A sweep runs on the deleter's own thread. Files are kept in an index sorted by mtime, so a
+    sweep only stats the files that appeared since the last one (plus the ones recently written
+    to, which may still grow) and deletes from the old end of the index. Every deletion is checked
+    against a fresh stat, and files modified in the last min_age seconds are never deleted, which
+    keeps the file being written even when it alone exceeds max_bytes.
+    """
 
-    def __init__(self, log_dir: str, retention: int) -> None:
+    def __init__(self, log_dir: str, retention: int, max_bytes: int = 0, min_age: float = 60) -> None:
         self._executor = ThreadPoolExecutor(1)
         self._log_dir = log_dir
         self._retention = retention
+        self._max_bytes = max_bytes
+        self._min_age = min_age
+        # (mtime, name) in mtime order, name -> (mtime, size, stat time)
+        self._index: List[Tuple[float, str]] = []
+        self._stats: Dict[str, Tuple[float, int, float]] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
 
-    def __call__(self) -> None:
-        if self._retention <= 0:
-            return
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
 
-        now = time.time()
-        min_modified_time = now - self._retention
+    def __call__(self) -> Future:
+        if self._retention <= 0 and self._max_bytes <= 0:
+            return None
+        return self._executor.submit(self._sweep)
 
-        with deleter_lock:
+    def _sweep(self) -> None:
+        with self._lock:
             try:
-                for f in os.listdir(self._log_dir):
-                    file_path = os.path.join(self._log_dir, f)
-                    if not os.path.isfile(file_path):
-                        continue
-
-                    stats = os.stat(file_path)
-                    last_modified = stats.st_mtime
-                    if last_modified < min_modified_time:
-                        os.remove(file_path)
+                self._update_index()
+                self._delete_expired()
             except (FileNotFoundError, IOError):
-                logger.exception(
-                    f"Failed to delete files modified before {min_modified_time}.")
+                logger.exception(f"Failed to sweep {self._log_dir}.")
+
+    def _update_index(self) -> None:
+        now = time.time()
+        seen = set()
+        with os.scandir(self._log_dir) as entries:
+            for entry in entries:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                seen.add(entry.name)
+                cached = self._stats.get(entry.name)
+                # a file modified shortly before it was indexed may have been written to since
+                if cached is not None and cached[2] - cached[0] > self._min_age:
+                    continue
+                try:
+                    stats = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                self._put(entry.name, stats.st_mtime, stats.st_size, now)
+        for name in [name for name in self._stats if name not in seen]:
+            self._remove(name)
+
+    def _delete_expired(self) -> None:
+        now = time.time()
+        min_modified_time = now - self._retention if self._retention > 0 else float('-inf')
+        newest_deletable = now - self._min_age
+        # every step deletes or moves the oldest file of the index
+        while self._index:
+            mtime, name = self._index[0]
+            over_quota = 0 < self._max_bytes < self._total_bytes
+            if mtime >= newest_deletable or (mtime >= min_modified_time and not over_quota):
+                break
+            file_path = os.path.join(self._log_dir, name)
+            try:
+                stats = os.stat(file_path)
+            except FileNotFoundError:
+                self._remove(name)
+                continue
+            if stats.st_mtime != mtime:
+                # written to since it was indexed, move it to its place and look again
+                self._put(name, stats.st_mtime, stats.st_size, now)
+                continue
+            os.remove(file_path)
+            self._remove(name)
+
+    def _put(self, name: str, mtime: float, size: int, stat_time: float) -> None:
+        if name in self._stats:
+            self._remove(name)
+        bisect.insort(self._index, (mtime, name))
+        self._stats[name] = (mtime, size, stat_time)
+        self._total_bytes += size
+
+    def _remove(self, name: str) -> None:
+        mtime, size, _ = self._stats.pop(name)
+        i = bisect.bisect_left(self._index, (mtime, name))
+        del self._index[i]
+        self._total_bytes -= size
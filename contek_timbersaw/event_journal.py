@@ -0,0 +1,273 @@
+import bz2
+import gzip
+import lzma
+import os
+from enum import IntEnum
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from contek_timbersaw.timed_rolling_file_handler import TimedRollingFileHandler
+
+JOURNAL_SUFFIX = '.evj'
+NUM_VALUES = 12
+
+# one fixed size little-endian record per event, a journal file is a plain array of them
+EVENT_DTYPE = np.dtype([
+    ('time', '<i8'),  # ns since epoch, opentime of the candle of model events, exchange time of orders
+    ('kind', 'u1'),
+    ('pair', 'S15'),
+    ('name', 'S40'),
+    ('values', '<f8', (NUM_VALUES,)),
+])
+
+_DECOMPRESSORS = {'.gz': gzip.open, '.bz2': bz2.open, '.lzma': lzma.open}
+
+
+class EventKind(IntEnum):
+    CANDLE = 1  # name: timeframe, values: CANDLE_FIELDS
+    INDICATOR = 2  # name: alpha.indicator, values[0]: value of the last candle
+    POSITION = 3  # name: alpha or merged_position, values: position, window_len
+    ORDER = 4  # name: order id, values: ORDER_FIELDS
+    FILL = 5  # name: order id, values: ORDER_FIELDS
+
+
+CANDLE_FIELDS = (
+    'open',
+    'high',
+    'low',
+    'close',
+    'volume',
+    'closetime',  # ms since epoch
+    'volume_U',
+    'num_trade',
+    'taker_buy',
+    'taker_buy_volume_U',
+)
+ORDER_FIELDS = ('side', 'orig_qty', 'price', 'executed_qty', 'avg_price')
+
+
+def encode_events(
+        kind: EventKind,
+        times: Sequence[int],
+        pair: str,
+        names: Sequence[str],
+        values: Sequence[Sequence[float]],
+) -> np.ndarray:
+    events = np.zeros(len(times), dtype=EVENT_DTYPE)
+    events['time'] = times
+    events['kind'] = kind
+    events['pair'] = pair
+    events['name'] = names
+    values = np.asarray(values, dtype=np.float64).reshape(len(times), -1)
+    events['values'][:, :values.shape[1]] = values
+    return events
+
+
+class EventJournal(TimedRollingFileHandler):
+    """
+    Append-only binary journal of trading decisions on top of TimedRollingFileHandler, so the
+    files roll, are compressed and expire like the logs. Events are EVENT_DTYPE records buffered
+    by the file object, flush() after each decision cycle makes them durable.
+
+    Usage:
+        journal = EventJournal("logs/journal/model_best")
+        journal.candles("BTCUSD", "1m", kdf)
+        journal.position("BTCUSD", "alp_adx_stochrsi_multiple", kdf.index[-1], 0.01, len(kdf))
+        journal.flush()
+    """
+
+    def __init__(
+            self,
+            log_dir: str,
+            compression_format: Optional[str] = 'gz',
+            retention: int = 0,
+            **kwargs,
+    ) -> None:
+        os.makedirs(log_dir, exist_ok=True)
+        super().__init__(
+            log_dir,
+            file_suffix=JOURNAL_SUFFIX,
+            compression_format=compression_format,
+            retention=retention,
+            **kwargs,
+        )
+
+    @classmethod
+    def from_config(cls, config: dict, name: str) -> Optional['EventJournal']:
+        """journal of a process under the "event_journal" section of a config, None when it is absent"""
+        journal_config = dict(config.get('event_journal') or {})
+        if not journal_config:
+            return None
+        root = journal_config.pop('root')
+        retention_days = journal_config.pop('retention_days', 0)
+        return cls(os.path.join(root, name), retention=retention_days * 24 * 60 * 60, **journal_config)
+
+    def _open(self):
+        return open(self.baseFilename, 'ab')
+
+    def write(self, events: np.ndarray) -> None:
+        self.acquire()
+        try:
+            if self.shouldRollover(None):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(events.tobytes())
+        finally:
+            self.release()
+
+    def emit(self, record) -> None:
+        raise TypeError('EventJournal is written with write(), not through logging')
+
+    def candles(self, pair: str, timeframe: str, kdf) -> None:
+        """the candles of a kline frame indexed by opentime"""
+        values = kdf[list(CANDLE_FIELDS)].copy()
+        values['closetime'] = values['closetime'].to_numpy().astype('datetime64[ms]').astype(np.int64)
+        self.write(encode_events(
+            EventKind.CANDLE, kdf.index.asi8, pair, [timeframe] * len(kdf), values.to_numpy(np.float64)))
+
+    def indicators(self, pair: str, time, snapshot: Dict[str, float]) -> None:
+        time = _to_ns(time)
+        self.write(encode_events(
+            EventKind.INDICATOR, [time] * len(snapshot), pair, list(snapshot), [[v] for v in snapshot.values()]))
+
+    def position(self, pair: str, name: str, time, position: float, window_len: int) -> None:
+        self.write(encode_events(EventKind.POSITION, [_to_ns(time)], pair, [name], [[position, window_len]]))
+
+    def order(self, pair: str, time, order_id: str, values: Sequence[float], filled: bool = False) -> None:
+        kind = EventKind.FILL if filled else EventKind.ORDER
+        self.write(encode_events(kind, [_to_ns(time)], pair, [order_id], [values]))
+
+
+def _to_ns(time) -> int:
+    if isinstance(time, (int, np.integer)):
+        return int(time)
+    return int(np.datetime64(time, 'ns').astype(np.int64))
+
+
+def journal_files(path: str) -> List[str]:
+    """journal files of a directory in time order, the file names start with the rolling time"""
+    if os.path.isfile(path):
+        return [path]
+    # skips the temporary file of a compression in progress
+    files = [f for f in os.listdir(path) if f.endswith(JOURNAL_SUFFIX) or f.endswith(tuple(_DECOMPRESSORS))]
+    return [os.path.join(path, f) for f in sorted(files)]
+
+
+def read_journal(path: str) -> np.ndarray:
+    """
+    events of a journal file, memory-mapped when it is not compressed. A record torn by a crash
+    at the end of the file is ignored.
+    """
+    extension = os.path.splitext(path)[1]
+    if extension in _DECOMPRESSORS:
+        with _DECOMPRESSORS[extension](path, 'rb') as f:
+            data = f.read()
+        num_events = len(data) // EVENT_DTYPE.itemsize
+        return np.frombuffer(data, dtype=EVENT_DTYPE, count=num_events)
+    num_events = os.path.getsize(path) // EVENT_DTYPE.itemsize
+    if num_events == 0:
+        return np.zeros(0, dtype=EVENT_DTYPE)
+    return np.memmap(path, dtype=EVENT_DTYPE, mode='r', shape=(num_events,))
+
+
+class JournalReader:
+    """
+    Reader of the journals of one or more directories or files, events come out in time order
+    (stable, so the write order of a candle's events is kept).
+
+    Usage:
+        reader = JournalReader(["logs/journal/model_best"])
+        kdf = reader.candles("BTCUSD", "1m")
+        for event in reader.events(EventKind.POSITION):
+            ...
+    """
+
+    def __init__(self, paths: Iterable[str]) -> None:
+        if isinstance(paths, str):
+            paths = [paths]
+        arrays = [read_journal(f) for path in paths for f in journal_files(path)]
+        events = np.concatenate(arrays) if arrays else np.zeros(0, dtype=EVENT_DTYPE)
+        self._events = events[np.argsort(events['time'], kind='stable')]
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def select(self, kind: Optional[EventKind] = None, pair: Optional[str] = None, name: Optional[str] = None) -> np.ndarray:
+        mask = np.ones(len(self._events), dtype=bool)
+        if kind is not None:
+            mask &= self._events['kind'] == kind
+        if pair is not None:
+            mask &= self._events['pair'] == pair.encode()
+        if name is not None:
+            mask &= self._events['name'] == name.encode()
+        return self._events[mask]
+
+    def events(self, kind: Optional[EventKind] = None, pair: Optional[str] = None) -> Iterator[np.void]:
+        return iter(self.select(kind, pair))
+
+    def candles(self, pair: str, timeframe: str):
+        """kline frame of the journaled candles, the last journaled version of a candle wins"""
+        import pandas as pd
+
+        events = self.select(EventKind.CANDLE, pair, timeframe)
+        values = events['values'][:, :len(CANDLE_FIELDS)]
+        kdf = pd.DataFrame(values, columns=CANDLE_FIELDS, index=pd.to_datetime(events['time'], unit='ns'))
+        kdf.index.name = 'opentime'
+        kdf = kdf[~kdf.index.duplicated(keep='last')]
+        kdf['closetime'] = pd.to_datetime(kdf['closetime'].astype(np.int64), unit='ms')
+        kdf['num_trade'] = kdf['num_trade'].astype(np.int64)
+        return kdf
+
+    def frame(self, kind: EventKind, fields: Sequence[str] = ('value',)):
+        """events of a kind as a frame of time, pair, name and the first len(fields) values"""
+        import pandas as pd
+
+        events = self.select(kind)
+        frame = pd.DataFrame({
+            'time': pd.to_datetime(events['time'], unit='ns'),
+            'pair': events['pair'].astype(str),
+            'name': events['name'].astype(str),
+        })
+        for i, field in enumerate(fields):
+            frame[field] = events['values'][:, i]
+        return frame
+
+
+if __name__ == '__main__':
+    # write and read back a day of 1m candles with their indicator snapshot and positions
+    import tempfile
+    import time
+
+    import pandas as pd
+
+    def benchmark(num_candles: int = 1440) -> None:
+        index = pd.date_range('2024-01-01', periods=num_candles, freq='1min', name='opentime')
+        close = 40000 + np.cumsum(np.random.standard_normal(num_candles))
+        kdf = pd.DataFrame({field: close for field in CANDLE_FIELDS}, index=index)
+        kdf['closetime'] = index + pd.Timedelta(seconds=59)
+        with tempfile.TemporaryDirectory() as log_dir:
+            journal = EventJournal(log_dir, compression_format=None)
+            start = time.perf_counter()
+            for i in range(num_candles):
+                candle = kdf.iloc[i:i + 1]
+                journal.candles('BTCUSD', '1m', candle)
+                journal.indicators('BTCUSD', index[i], {'alpha.adx': 20.0, 'alpha.std': 1.5, 'alpha.dema': close[i]})
+                journal.position('BTCUSD', 'alpha', index[i], 0.01, 300)
+                journal.position('BTCUSD', 'merged_position', index[i], 0.01, 300)
+                journal.flush()
+            write_us = (time.perf_counter() - start) / num_candles * 1e6
+            journal.close()
+
+            start = time.perf_counter()
+            reader = JournalReader(log_dir)
+            candles = reader.candles('BTCUSD', '1m')
+            positions = reader.frame(EventKind.POSITION, ('position', 'window_len'))
+            num_events = sum(1 for _ in reader.events())
+            read_ms = (time.perf_counter() - start) * 1e3
+        assert np.array_equal(candles['close'].to_numpy(), kdf['close'].to_numpy())
+        print(f'write: {write_us:.1f} us/candle, {EVENT_DTYPE.itemsize} bytes/event')
+        print(f'replay: {num_events} events, {len(candles)} candles, {len(positions)} positions in {read_ms:.1f} ms')
+
+    benchmark()
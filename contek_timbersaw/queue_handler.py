@@ -0,0 +1,201 @@
+import logging
+import threading
+import time
+from collections import deque
+from logging.handlers import BaseRotatingHandler
+from typing import Deque, Dict, List, Optional
+
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+
+
+class BoundedQueueHandler(logging.Handler):
+    """
+    Hands records to a QueueWriter instead of writing them on the calling thread.
+
+    emit only resolves the message and traceback, which may not outlive the call, and appends
+    the record to a deque; appending and popping from opposite ends of a deque needs no lock in
+    CPython. At most capacity records are queued, beyond that the oldest or the newest record is
+    dropped and counted.
+    """
+
+    def __init__(self, capacity: int = 100_000, overflow: str = DROP_OLDEST) -> None:
+        if overflow not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f'overflow must be {DROP_OLDEST} or {DROP_NEWEST}, got {overflow}')
+        super().__init__()
+        self.capacity = capacity
+        self.overflow = overflow
+        self.queue: Deque[logging.LogRecord] = deque(maxlen=capacity if overflow == DROP_OLDEST else None)
+        self.dropped = 0
+        self._exc_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self._exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            if len(self.queue) >= self.capacity:
+                self.dropped += 1
+                if self.overflow == DROP_NEWEST:
+                    return
+            self.queue.append(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+    # the deque is its own synchronization, skip the handler lock of Handler.handle
+    def handle(self, record: logging.LogRecord) -> bool:
+        rv = self.filter(record)
+        if rv:
+            self.emit(record)
+        return rv
+
+
+class QueueWriter:
+    """
+    Writer thread draining a BoundedQueueHandler into the actual handlers.
+
+    The queue is polled every poll_interval seconds and drained in batches of up to batch_size
+    records. Records of a batch are written to a stream handler with one flush, other handlers
+    handle them one by one. stop() writes what is left in the queue.
+
+    Usage:
+        queue_handler = BoundedQueueHandler()
+        writer = QueueWriter(queue_handler, [logging.StreamHandler()])
+        writer.start()
+        logging.getLogger().addHandler(queue_handler)
+        ...
+        writer.stop()
+    """
+
+    def __init__(
+            self,
+            queue_handler: BoundedQueueHandler,
+            handlers: List[logging.Handler],
+            batch_size: int = 1000,
+            poll_interval: float = 0.05,
+    ) -> None:
+        self._queue = queue_handler.queue
+        self._queue_handler = queue_handler
+        self._handlers = handlers
+        self._batch_size = batch_size
+        self._poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {'records_written': 0, 'batches': 0}
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        stats = dict(self._stats)
+        stats['records_queued'] = len(self._queue)
+        stats['records_dropped'] = self._queue_handler.dropped
+        return stats
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='timbersaw-writer', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.drain()
+        for handler in self._handlers:
+            handler.flush()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if not self.drain():
+                self._stop.wait(self._poll_interval)
+
+    def drain(self) -> int:
+        num_records = 0
+        while self._queue:
+            batch = []
+            try:
+                while len(batch) < self._batch_size:
+                    batch.append(self._queue.popleft())
+            except IndexError:
+                pass
+            for handler in self._handlers:
+                self._write_batch(handler, batch)
+            num_records += len(batch)
+            self._stats['records_written'] += len(batch)
+            self._stats['batches'] += 1
+        return num_records
+
+    @staticmethod
+    def _write_batch(handler: logging.Handler, batch: List[logging.LogRecord]) -> None:
+        if not isinstance(handler, logging.StreamHandler):
+            for record in batch:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+            return
+
+        # StreamHandler.emit flushes per record, write the whole batch with one flush instead
+        handler.acquire()
+        try:
+            for record in batch:
+                if record.levelno < handler.level or not handler.filter(record):
+                    continue
+                try:
+                    if isinstance(handler, BaseRotatingHandler) and handler.shouldRollover(record):
+                        handler.doRollover()
+                    if handler.stream is None:
+                        handler.stream = handler._open()
+                    handler.stream.write(handler.format(record) + handler.terminator)
+                except Exception:
+                    handler.handleError(record)
+            if handler.stream is not None:
+                handler.stream.flush()
+        finally:
+            handler.release()
+
+
+if __name__ == '__main__':
+    # log call latency of a file handler on the calling thread against the queued writer
+    import os
+    import tempfile
+
+    def benchmark(queued: bool, log_dir: str, num_records: int = 100_000) -> None:
+        logger = logging.getLogger(f'benchmark.{queued}')
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        file_handler = logging.FileHandler(os.path.join(log_dir, f'{queued}.log'))
+        file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(filename)s:%(lineno)d - %(message)s'))
+        if queued:
+            queue_handler = BoundedQueueHandler(capacity=num_records)
+            writer = QueueWriter(queue_handler, [file_handler])
+            writer.start()
+            logger.addHandler(queue_handler)
+        else:
+            logger.addHandler(file_handler)
+
+        latencies = []
+        start = time.perf_counter()
+        for i in range(num_records):
+            t = time.perf_counter_ns()
+            logger.info(f'BTCUSD position {i} at bar {i * 60}')
+            latencies.append(time.perf_counter_ns() - t)
+        elapsed = time.perf_counter() - start
+        if queued:
+            writer.stop()
+        file_handler.close()
+
+        latencies.sort()
+        p50, p99, p999 = (latencies[int(q * (num_records - 1))] / 1e3 for q in (0.5, 0.99, 0.999))
+        print(f"{'queued' if queued else 'direct'}: {num_records / elapsed:,.0f} calls/sec "
+              f'p50 {p50:.1f}us p99 {p99:.1f}us p99.9 {p999:.1f}us')
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        benchmark(False, log_dir)
+        benchmark(True, log_dir)
@@ -15,13 +15,15 @@ class TimedRollingFileHandler(TimedRotatingFileHandler):
             file_suffix: str = '.log',
             compression_format: Optional[str] = None,
             retention: int = 0,
+            compression_options: Optional[dict] = None,
+            max_bytes: int = 0,
             **kwargs,
     ) -> None:
         super().__init__(log_dir, delay=True, **kwargs)
         self._log_dir = log_dir
         self._file_suffix = file_suffix
-        self._compress = AsyncCompressor(compression_format)
-        self._delete = Deleter(log_dir, retention)
+        self._compress = AsyncCompressor(compression_format, **(compression_options or {}))
+        self._delete = Deleter(log_dir, retention, max_bytes)
         self._delete()
         self._update_current_file()
 
@@ -1,6 +1,148 @@
 import pandas as pd
-import pandas_ta as pta
 import numpy as np
+from index.jit import NUMBA_AVAILABLE, njit
+
+EMA_LENGTHS = (10, 30, 60, 100, 200)
+VOLUME_WINDOWS = (5, 10, 20, 60)
+# bars per block of the vectorized ema scan
+EMA_BLOCK = 128
+
+
+@njit(cache=True)
+def _pvdf_kernel(close, volume, ema_lengths, volume_windows, out):
+    """
+    single pass over one symbol writing pvdf into out, O(1) state per bar. The warm-up bars take the
+    first ema / rolling mean value like the bfill of the pandas version, so the seeds are read ahead.
+    """
+    n = len(close)
+    num_ema = len(ema_lengths)
+    num_vol = len(volume_windows)
+    emas = np.empty(num_ema)
+    for j in range(num_ema):
+        length = ema_lengths[j]
+        emas[j] = close[:length].mean() if n >= length else np.nan
+    vol_seeds = np.empty(num_vol)
+    for j in range(num_vol):
+        window = volume_windows[j]
+        vol_seeds[j] = volume[:window].mean() if n >= window else np.nan
+    values = np.empty(max(num_ema, num_vol + 1))
+    prev_pvdf = np.nan
+    for t in range(n):
+        count = 0
+        for j in range(num_ema):
+            length = ema_lengths[j]
+            if n < length:
+                continue
+            if t >= length:
+                alpha = 2.0 / (length + 1)
+                emas[j] = alpha * close[t] + (1 - alpha) * emas[j]
+            values[count] = emas[j]
+            count += 1
+        pdf = np.log(1 + _sample_std(values, count))
+
+        values[0] = volume[t]
+        count = 1
+        for j in range(num_vol):
+            window = volume_windows[j]
+            if n < window:
+                continue
+            values[count] = volume[t - window + 1 : t + 1].mean() if t >= window - 1 else vol_seeds[j]
+            count += 1
+        vdf = np.log(1 + _sample_std(values, count))
+
+        pvdf = pdf * vdf
+        out[0, t] = pvdf
+        out[1, t] = pvdf - prev_pvdf
+        prev_pvdf = pvdf
+
+
+@njit(cache=True)
+def _sample_std(values, count):
+    if count < 2:
+        return np.nan
+    mean = values[:count].mean()
+    return np.sqrt(((values[:count] - mean) ** 2).sum() / (count - 1))
+
+
+def _ema(close: np.ndarray, length: int) -> np.ndarray:
+    """
+    pandas_ta ema (sma seeded, adjust=False) along the last axis with the warm-up bars backfilled,
+    scanned by blocks: a lower triangular matmul inside a block and a carry between blocks.
+    """
+    n = close.shape[-1]
+    ema = np.full(close.shape, np.nan)
+    if n < length:
+        return ema
+    alpha = 2.0 / (length + 1)
+    decay = 1 - alpha
+    seed = close[..., :length].mean(axis=-1)
+    ema[..., :length] = seed[..., None]
+    rest = close[..., length:]
+    num_rest = rest.shape[-1]
+    if num_rest == 0:
+        return ema
+    num_blocks = -(-num_rest // EMA_BLOCK)
+    padded = np.zeros(close.shape[:-1] + (num_blocks * EMA_BLOCK,))
+    padded[..., :num_rest] = rest
+    blocks = padded.reshape(close.shape[:-1] + (num_blocks, EMA_BLOCK))
+    lags = np.subtract.outer(np.arange(EMA_BLOCK), np.arange(EMA_BLOCK))
+    weights = np.where(lags >= 0, alpha * decay ** np.maximum(lags, 0), 0.0)
+    scan = blocks @ weights.T
+    carry_decay = decay ** np.arange(1, EMA_BLOCK + 1)
+    carry = seed
+    for b in range(num_blocks):
+        scan[..., b, :] += carry_decay * carry[..., None]
+        carry = scan[..., b, -1]
+    ema[..., length:] = scan.reshape(padded.shape)[..., :num_rest]
+    return ema
+
+
+def _rolling_mean(volume: np.ndarray, window: int) -> np.ndarray:
+    """rolling mean along the last axis with the warm-up bars backfilled"""
+    n = volume.shape[-1]
+    mean = np.full(volume.shape, np.nan)
+    if n < window:
+        return mean
+    mean[..., window - 1 :] = np.lib.stride_tricks.sliding_window_view(volume, window, axis=-1).mean(axis=-1)
+    mean[..., : window - 1] = mean[..., window - 1 : window]
+    return mean
+
+
+def _sample_std_stack(columns: list) -> np.ndarray:
+    columns = [col for col in columns if not np.isnan(col).all()]
+    if len(columns) < 2:
+        return np.full(columns[0].shape, np.nan) if columns else np.nan
+    return np.std(np.stack(columns), axis=0, ddof=1)
+
+
+def _pvdf_numpy(close: np.ndarray, volume: np.ndarray) -> np.ndarray:
+    pdf = np.log(1 + _sample_std_stack([_ema(close, length) for length in EMA_LENGTHS]))
+    vol_columns = [volume] + [_rolling_mean(volume, window) for window in VOLUME_WINDOWS]
+    vdf = np.log(1 + _sample_std_stack(vol_columns))
+    pvdf = pdf * vdf
+    pvdf_diff = np.full(pvdf.shape, np.nan)
+    pvdf_diff[..., 1:] = pvdf[..., 1:] - pvdf[..., :-1]
+    return np.stack([pvdf, pvdf_diff])
+
+
+def pvdf_arrays(close: np.ndarray, volume: np.ndarray) -> np.ndarray:
+    """
+    pvdf and pvdf_diff of close/volume_U arrays of shape (bars,) or (symbols, bars),
+    returned as an array of shape (2, ...) matching the input
+    """
+    close = np.asarray(close, dtype=np.float64)
+    volume = np.asarray(volume, dtype=np.float64)
+    if not NUMBA_AVAILABLE:
+        return _pvdf_numpy(close, volume)
+    out = np.empty((2,) + close.shape)
+    ema_lengths = np.array(EMA_LENGTHS)
+    volume_windows = np.array(VOLUME_WINDOWS)
+    if close.ndim == 1:
+        _pvdf_kernel(close, volume, ema_lengths, volume_windows, out)
+    else:
+        for i in range(close.shape[0]):
+            _pvdf_kernel(close[i], volume[i], ema_lengths, volume_windows, out[:, i])
+    return out
 
 
 class IdxPvdf:
@@ -11,6 +153,13 @@ class IdxPvdf:
         self.kdf = kdf
 
     def pvdf(self) -> pd.DataFrame:
+        pvdf, pvdf_diff = pvdf_arrays(self.kdf["close"].to_numpy(), self.kdf["volume_U"].to_numpy())
+        return pd.DataFrame({"pvdf": pvdf, "pvdf_diff": pvdf_diff}, index=self.kdf.index)
+
+    def _pvdf_pandas(self) -> pd.DataFrame:
+        # the research-only reference of pvdf, pandas_ta is not a production requirement
+        import pandas_ta as pta
+
         pvdf = self.kdf[["close", "volume_U"]]
         pvdf["em10"] = pta.ema(pvdf["close"], length=10)
         pvdf["ema30"] = pta.ema(pvdf["close"], length=30)
@@ -39,3 +188,95 @@ class IdxPvdf:
         pvdf["pvdf_diff"] = pvdf["pvdf"] - pvdf["pvdf"].shift(1)
 
         return pvdf[["pvdf", "pvdf_diff"]]
+
+
+class PvdfStream:
+    """
+    Incremental pvdf for live candles of several symbols. The first max(EMA_LENGTHS) bars are
+    backfilled in the batch version, so the stream buffers them (or takes a history through
+    warmup) and then updates in O(1) per bar with the same values as pvdf_arrays.
+    Args:
+        num_symbols: int: number of symbols updated together
+    """
+
+    def __init__(self, num_symbols: int = 1) -> None:
+        self.num_symbols = num_symbols
+        self.warm = False
+        self._history = []
+        self._emas = None
+        self._volumes = None
+        self._pvdf = None
+
+    def warmup(self, close: np.ndarray, volume: np.ndarray) -> np.ndarray:
+        """take a (symbols, bars) history, return its pvdf arrays"""
+        close = np.asarray(close, dtype=np.float64).reshape(self.num_symbols, -1)
+        volume = np.asarray(volume, dtype=np.float64).reshape(self.num_symbols, -1)
+        out = pvdf_arrays(close, volume)
+        if close.shape[1] >= max(EMA_LENGTHS):
+            self._emas = np.stack([_ema(close, length)[:, -1] for length in EMA_LENGTHS])
+            self._volumes = volume[:, -max(VOLUME_WINDOWS) :].copy()
+            self._pvdf = out[0, :, -1]
+            self._history = []
+            self.warm = True
+        return out
+
+    def update(self, close: np.ndarray, volume: np.ndarray) -> tuple:
+        """feed one finished candle per symbol, return (pvdf, pvdf_diff) of shape (symbols,)"""
+        close = np.asarray(close, dtype=np.float64).reshape(self.num_symbols)
+        volume = np.asarray(volume, dtype=np.float64).reshape(self.num_symbols)
+        if not self.warm:
+            self._history.append((close, volume))
+            history = np.stack([np.stack(bar) for bar in self._history], axis=-1)
+            out = self.warmup(history[0], history[1])
+            if not self.warm:
+                nan = np.full(self.num_symbols, np.nan)
+                return nan, nan
+            return out[0, :, -1], out[1, :, -1]
+
+        for j, length in enumerate(EMA_LENGTHS):
+            alpha = 2.0 / (length + 1)
+            self._emas[j] = alpha * close + (1 - alpha) * self._emas[j]
+        self._volumes = np.roll(self._volumes, -1, axis=1)
+        self._volumes[:, -1] = volume
+        vol_columns = [volume] + [self._volumes[:, -window:].mean(axis=1) for window in VOLUME_WINDOWS]
+        pdf = np.log(1 + np.std(self._emas, axis=0, ddof=1))
+        vdf = np.log(1 + np.std(np.stack(vol_columns), axis=0, ddof=1))
+        pvdf = pdf * vdf
+        pvdf_diff = pvdf - self._pvdf
+        self._pvdf = pvdf
+        return pvdf, pvdf_diff
+
+
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(0)
+    num_bars = 1_000_000
+    index = pd.date_range("2020-01-01", periods=num_bars, freq="1min", name="opentime")
+    kdf = pd.DataFrame(
+        {
+            "close": 60000 * np.exp(np.cumsum(rng.normal(0, 1e-3, num_bars))),
+            "volume_U": rng.lognormal(15, 1, num_bars),
+        },
+        index=index,
+    )
+    idx = IdxPvdf(kdf)
+    start_time = time.time()
+    expected = idx._pvdf_pandas()
+    print(f"pandas: {time.time() - start_time} seconds")
+    start_time = time.time()
+    result = idx.pvdf()
+    print(f"fused (numba={NUMBA_AVAILABLE}): {time.time() - start_time} seconds")
+    assert np.allclose(result.values, expected.values, rtol=1e-9, equal_nan=True)
+
+    panel_close = np.stack([kdf["close"].to_numpy()[:10_000]] * 100)
+    panel_volume = np.stack([kdf["volume_U"].to_numpy()[:10_000]] * 100)
+    start_time = time.time()
+    batch = pvdf_arrays(panel_close, panel_volume)
+    print(f"batch of {panel_close.shape}: {time.time() - start_time} seconds")
+
+    stream = PvdfStream(100)
+    stream.warmup(panel_close[:, :5000], panel_volume[:, :5000])
+    for t in range(5000, 5100):
+        pvdf, pvdf_diff = stream.update(panel_close[:, t], panel_volume[:, t])
+        assert np.allclose(pvdf, batch[0, :, t]) and np.allclose(pvdf_diff, batch[1, :, t])
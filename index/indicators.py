@@ -1,6 +1,6 @@
 import pandas as pd
-import pandas_ta as pta
 import numpy as np
+from index import ta
 
 
 class Adx:
@@ -11,15 +11,19 @@ class Adx:
         self.adx_len = adx_len
 
     def get_indicator(self) -> pd.DataFrame:
+        # the pandas_ta call took timeperiod=adx_len, which pandas_ta ignores, so the length has
+        # always been its default 14. Kept to leave the tuned alphas unchanged.
         adx = pd.DataFrame(
-            pta.adx(
-                self.kdf["high"],
-                self.kdf["low"],
-                self.kdf["close"],
-                timeperiod=self.adx_len,
-            )
+            np.column_stack(
+                ta.adx(
+                    self.kdf["high"].to_numpy(),
+                    self.kdf["low"].to_numpy(),
+                    self.kdf["close"].to_numpy(),
+                )
+            ),
+            index=self.kdf.index,
+            columns=["adx", "pdi", "mdi"],
         )
-        adx.columns = ["adx", "pdi", "mdi"]
         return adx
 
 
@@ -34,15 +38,18 @@ class StochRsi:
 
     def get_indicator(self) -> pd.DataFrame:
         stochrsi = pd.DataFrame(
-            pta.stochrsi(
-                self.kdf["close"],
-                length=self.stoch_len,
-                rsi_length=self.rsi_len,
-                k=self.kd,
-                d=self.kd,
-            )
+            np.column_stack(
+                ta.stochrsi(
+                    self.kdf["close"].to_numpy(),
+                    length=self.stoch_len,
+                    rsi_length=self.rsi_len,
+                    k=self.kd,
+                    d=self.kd,
+                )
+            ),
+            index=self.kdf.index,
+            columns=["k", "d"],
         )
-        stochrsi.columns = ["k", "d"]
         stochrsi["upcross"] = np.where(
             (stochrsi["k"] > stochrsi["d"]) & (stochrsi["k"].shift(1) <= stochrsi["d"]),
             stochrsi["d"],
@@ -67,10 +74,18 @@ class Macd:
         self.signal = signal
 
     def get_indicator(self) -> pd.DataFrame:
-        macd = pta.macd(
-            self.kdf["close"], fast=self.fast, slow=self.slow, signal=self.signal
+        macd = pd.DataFrame(
+            np.column_stack(
+                ta.macd(
+                    self.kdf["close"].to_numpy(),
+                    fast=self.fast,
+                    slow=self.slow,
+                    signal=self.signal,
+                )
+            ),
+            index=self.kdf.index,
+            columns=["diff", "macd", "dea"],
         )
-        macd.columns = ["diff", "macd", "dea"]
         condition1 = macd["diff"] > macd["dea"]
         condition2 = macd["diff"].shift(1) <= macd["dea"].shift(1)
         macd["GXvalue"] = np.where(condition1 & condition2, macd["dea"], 0)
@@ -89,14 +104,22 @@ class Supertrend:
         self.sptr_k = sptr_k
 
     def get_indicator(self) -> pd.DataFrame:
-        supertrend = pta.supertrend(
-            self.kdf["high"],
-            self.kdf["low"],
-            self.kdf["close"],
+        stop_price, direction, lbound, ubound = ta.supertrend(
+            self.kdf["high"].to_numpy(),
+            self.kdf["low"].to_numpy(),
+            self.kdf["close"].to_numpy(),
             self.sptr_len,
             self.sptr_k,
         )
-        supertrend.columns = ["stop_price", "direction", "lbound", "ubound"]
+        supertrend = pd.DataFrame(
+            {
+                "stop_price": stop_price,
+                "direction": direction,
+                "lbound": lbound,
+                "ubound": ubound,
+            },
+            index=self.kdf.index,
+        )
 
         return supertrend
 
@@ -182,19 +205,21 @@ class Trendline:
         kdf = self.kdf_signal
         if self.calcMethod == "Atr":
             delta_price = (
-                pta.atr(
-                    kdf["high"],
-                    kdf["low"],
-                    kdf["close"],
-                    length=self.swing,
-                    mamode="EMA",
-                ).mean()
+                np.nanmean(
+                    ta.atr(
+                        kdf["high"].to_numpy(),
+                        kdf["low"].to_numpy(),
+                        kdf["close"].to_numpy(),
+                        length=self.swing,
+                        mamode="EMA",
+                    )
+                )
                 / self.swing
                 * self.slope
             )
         elif self.calcMethod == "Stdev":
             delta_price = (
-                pta.stdev(kdf["close"], length=self.swing).mean()
+                np.nanmean(ta.stdev(kdf["close"].to_numpy(), length=self.swing))
                 / self.swing
                 * self.slope
             )
@@ -218,23 +243,22 @@ class Vwap:
         self.vwap_len = vwap_len
 
     def get_indicator(self) -> pd.DataFrame:
-        vwap = pd.DataFrame(
-            pta.vwap(
-                self.kdf["high"],
-                self.kdf["low"],
-                self.kdf["close"],
-                self.kdf["volume_U"],
-                fillna=True,
-            )
+        vwap = ta.vwap(
+            self.kdf["high"].to_numpy(),
+            self.kdf["low"].to_numpy(),
+            self.kdf["close"].to_numpy(),
+            self.kdf["volume_U"].to_numpy(),
+            anchor=self.kdf.index.to_numpy().astype("datetime64[D]"),
         )
-        vwap.columns = ["vwap"]
-        vwap["stdev"] = (
-            self.kdf[["close", "high", "low"]]
-            .rolling(window=self.vwap_len)
-            .std()
-            .mean(axis=1)
+        # fillna=True of the former pandas_ta call
+        vwap = pd.DataFrame({"vwap": np.where(np.isnan(vwap), 1.0, vwap)}, index=self.kdf.index)
+        stdev = np.mean(
+            [ta.stdev(self.kdf[col].to_numpy(), self.vwap_len) for col in ["close", "high", "low"]],
+            axis=0,
         )
-        vwap["stdev"] = vwap["stdev"].fillna(method="bfill")
+        if len(stdev) >= self.vwap_len:
+            stdev[: self.vwap_len - 1] = stdev[self.vwap_len - 1]
+        vwap["stdev"] = stdev
         vwap["vwap_upper"] = vwap["vwap"] + vwap["stdev"]
         vwap["vwap_lower"] = vwap["vwap"] - vwap["stdev"]
         return vwap
@@ -0,0 +1,50 @@
+"""
+optional numba: kernels decorated with njit run compiled when numba is installed and as plain python
+otherwise. numba is imported and the kernel compiled on the first call, not when the module is
+imported, so processes that never run a kernel do not pay the numba import at startup.
+"""
+import functools
+import importlib.util
+
+NUMBA_AVAILABLE = importlib.util.find_spec("numba") is not None
+
+
+class LazyKernel:
+    """
+    njit kernel compiled on its first call
+    Args:
+        func: function: the python kernel
+        options: dict: numba.njit options, e.g. cache=True
+    """
+
+    def __init__(self, func, options: dict) -> None:
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.options = options
+        self._dispatcher = None
+
+    def compile(self):
+        """the numba dispatcher, or the python kernel without numba"""
+        if self._dispatcher is None:
+            if NUMBA_AVAILABLE:
+                import numba
+
+                # kernels calling other kernels need the callees compiled first, numba only calls dispatchers
+                namespace = self.func.__globals__
+                for name in self.func.__code__.co_names:
+                    callee = namespace.get(name)
+                    if isinstance(callee, LazyKernel) and callee is not self:
+                        namespace[name] = callee.compile()
+                self._dispatcher = numba.njit(**self.options)(self.func)
+            else:
+                self._dispatcher = self.func
+        return self._dispatcher
+
+    def __call__(self, *args):
+        return self.compile()(*args)
+
+
+def njit(*args, **kwargs):
+    if len(args) == 1 and callable(args[0]) and not kwargs:
+        return LazyKernel(args[0], {})
+    return lambda func: LazyKernel(func, kwargs)
@@ -1,75 +1,103 @@
 import pandas as pd
-import pandas_ta as pta
 import numpy as np
+from index import ta
+
+# column order of the candle panels fed to the pattern kernels
+OHLC_COLUMNS = ["open", "high", "low", "close"]
+# last axis of the pattern matrix
+PATTERNS = ["pin_bar", "engulfing", "inside_bar", "outside_bar", "oneside_bar"]
+
+
+def _pattern_kernel(prev: np.ndarray, curr: np.ndarray) -> np.ndarray:
+    """patterns of curr given the previous candle, both (..., 4) ohlc arrays, as (..., 5) int8"""
+    open_, high, low, close = (curr[..., i] for i in range(4))
+    prev_open, prev_high, prev_low, prev_close = (prev[..., i] for i in range(4))
+    patterns = np.zeros(curr.shape[:-1] + (len(PATTERNS),), dtype=np.int8)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        body = open_ - close
+        down_wick_ratio = (open_ - low) / body
+        up_wick_ratio = (high - close) / body
+    patterns[..., 0] = np.where(
+        (up_wick_ratio > 2) & (down_wick_ratio < 1),
+        1,
+        np.where((down_wick_ratio > 2) & (up_wick_ratio < 1), -1, 0),
+    )
+    patterns[..., 1] = np.where(
+        (low < prev_low) & (close > prev_high) & (prev_close < prev_open),
+        1,
+        np.where((high > prev_high) & (close < prev_low) & (prev_close > prev_open), -1, 0),
+    )
+    patterns[..., 2] = (high <= prev_high) & (low >= prev_low)
+    patterns[..., 3] = (high > prev_high) & (low < prev_low)
+    patterns[..., 4] = np.where(
+        (high > prev_high) & (low >= prev_low),
+        1,
+        np.where((low < prev_low) & (high <= prev_high), -1, 0),
+    )
+    return patterns
+
+
+def pattern_matrix(panel: np.ndarray) -> np.ndarray:
+    """
+    evaluate every pattern in one pass over a (symbols, bars, 4) ohlc panel (or a (bars, 4) kdf array),
+    return an int8 matrix of shape (..., bars, len(PATTERNS)), the first bar having no previous candle
+    """
+    panel = np.asarray(panel, dtype=np.float64)
+    prev = np.full_like(panel, np.nan)
+    prev[..., 1:, :] = panel[..., :-1, :]
+    return _pattern_kernel(prev, panel)
+
+
+def _swing_levels(high: np.ndarray, sign: int) -> tuple:
+    """running swing high (sign=1) or swing low (sign=-1) along the last axis and bars since its update"""
+    level = sign * high
+    num_bars = level.shape[-1]
+    swing = np.zeros(level.shape, dtype=bool)
+    swing[..., 1:-1] = (level[..., 1:-1] > level[..., :-2]) & (level[..., 1:-1] > level[..., 2:])
+    candidates = np.where(swing, level, -np.inf)
+    candidates[..., 0] = level[..., 0]
+    levels = np.maximum.accumulate(candidates, axis=-1)
+    updated = np.zeros(level.shape, dtype=bool)
+    updated[..., 1:] = swing[..., 1:] & (level[..., 1:] > levels[..., :-1])
+    bars = np.arange(num_bars)
+    last_update = np.maximum.accumulate(np.where(updated, bars, 0), axis=-1)
+    count = (bars - last_update).astype(np.float64)
+    # the last bar is not confirmed as a swing yet and keeps its own extreme
+    levels[..., -1] = level[..., -1]
+    count[..., 0] = np.nan
+    count[..., -1] = np.nan
+    return sign * levels, count
+
+
+def swing_hilo(high: np.ndarray, low: np.ndarray) -> tuple:
+    """highs, lows, highs_count, lows_count of bars along the last axis, e.g. (symbols, bars) arrays"""
+    highs, highs_count = _swing_levels(np.asarray(high, dtype=np.float64), 1)
+    lows, lows_count = _swing_levels(np.asarray(low, dtype=np.float64), -1)
+    return highs, lows, highs_count, lows_count
 
 
 class PatternIdnetifier:
 
-    def __init__(self, kdf) -> None:
+    def __init__(self, kdf, atr_len: int = 14) -> None:
         self.kdf = kdf
+        self.atr_len = atr_len
 
     def identify_hilo(self):
         candle_hilos = self.kdf[["high", "low", "close"]]
-        candle_hilos["atr"] = pta.atr(
-            candle_hilos["high"],
-            candle_hilos["low"],
-            candle_hilos["close"],
+        candle_hilos["atr"] = ta.atr(
+            candle_hilos["high"].to_numpy(),
+            candle_hilos["low"].to_numpy(),
+            candle_hilos["close"].to_numpy(),
             length=self.atr_len,
             mamode="EMA",
         )
-        candle_hilos["highs"] = candle_hilos["high"]
-        candle_hilos["lows"] = candle_hilos["low"]
-        highs_count = 0
-        lows_count = 0
-
-        for i in range(1, len(candle_hilos) - 1):
-            candle_hilos.at[candle_hilos.index[i], "highs"] = candle_hilos.at[
-                candle_hilos.index[i - 1], "highs"
-            ]
-            candle_hilos.at[candle_hilos.index[i], "lows"] = candle_hilos.at[
-                candle_hilos.index[i - 1], "lows"
-            ]
-
-            if (
-                candle_hilos.at[candle_hilos.index[i], "high"]
-                > candle_hilos.at[candle_hilos.index[i - 1], "high"]
-                and candle_hilos.at[candle_hilos.index[i], "high"]
-                > candle_hilos.at[candle_hilos.index[i + 1], "high"]
-            ):
-                if (
-                    candle_hilos.at[candle_hilos.index[i], "highs"]
-                    >= candle_hilos.at[candle_hilos.index[i], "high"]
-                ):
-                    highs_count += 1
-                else:  # 更新高点
-                    highs_count = 0
-                    candle_hilos.at[candle_hilos.index[i], "highs"] = candle_hilos.at[
-                        candle_hilos.index[i], "high"
-                    ]
-            else:
-                highs_count += 1
-
-            if (
-                candle_hilos.at[candle_hilos.index[i], "low"]
-                < candle_hilos.at[candle_hilos.index[i - 1], "low"]
-                and candle_hilos.at[candle_hilos.index[i], "low"]
-                < candle_hilos.at[candle_hilos.index[i + 1], "low"]
-            ):
-                if (
-                    candle_hilos.at[candle_hilos.index[i], "lows"]
-                    <= candle_hilos.at[candle_hilos.index[i], "low"]
-                ):
-                    lows_count += 1
-                else:  # 更新低点
-                    lows_count = 0
-                    candle_hilos.at[candle_hilos.index[i], "lows"] = candle_hilos.at[
-                        candle_hilos.index[i], "low"
-                    ]
-            else:
-                lows_count += 1
-
-            candle_hilos.at[candle_hilos.index[i], "highs_count"] = highs_count
-            candle_hilos.at[candle_hilos.index[i], "lows_count"] = lows_count
+        highs, lows, highs_count, lows_count = swing_hilo(
+            candle_hilos["high"].to_numpy(), candle_hilos["low"].to_numpy()
+        )
+        candle_hilos["highs"] = highs
+        candle_hilos["lows"] = lows
+        candle_hilos["highs_count"] = highs_count
+        candle_hilos["lows_count"] = lows_count
         return candle_hilos[
             [
                 "highs",
@@ -83,69 +111,95 @@ class PatternIdnetifier:
             ]
         ]
 
+    def identify_patterns(self) -> pd.DataFrame:
+        patterns = pattern_matrix(self.kdf[OHLC_COLUMNS].to_numpy())
+        return pd.DataFrame(patterns, index=self.kdf.index, columns=PATTERNS)
+
+    def _identify(self, pattern: str) -> pd.Series:
+        patterns = pattern_matrix(self.kdf[OHLC_COLUMNS].to_numpy())
+        return pd.Series(patterns[:, PATTERNS.index(pattern)], index=self.kdf.index, name=pattern)
+
     def identify_pin_bar(self):
-        pinbar = self.kdf[["open", "close", "high", "low"]]
-        pinbar["body"] = pinbar["open"] - pinbar["close"]
-        pinbar["down_wick_ratio"] = (pinbar["open"] - pinbar["low"]) / (pinbar["body"])
-        pinbar["up_wick_ratio"] = (pinbar["high"] - pinbar["close"]) / (pinbar["body"])
-
-        pinbar["pin_bar"] = np.where(
-            (pinbar["up_wick_ratio"] > 2) & (pinbar["down_wick_ratio"] < 1),
-            1,
-            np.where(
-                (pinbar["down_wick_ratio"] > 2) & (pinbar["up_wick_ratio"] < 1), -1, 0
-            ),
-        )
-        return pinbar["pin_bar"]
+        return self._identify("pin_bar")
 
     def identify_engulfing(self):
-        engulfing = self.kdf[["open", "close", "high", "low"]]
-        engulfing["engulfing"] = np.where(
-            (engulfing["low"] < engulfing["low"].shift(1))
-            & (engulfing["close"] > engulfing["high"].shift(1))
-            & (engulfing["close"].shift(1) < engulfing["open"].shift(1)),
-            1,
-            np.where(
-                (engulfing["high"] > engulfing["high"].shift(1))
-                & (engulfing["close"] < engulfing["low"].shift(1))
-                & (engulfing["close"].shift(1) > engulfing["open"].shift(1)),
-                -1,
-                0,
-            ),
-        )
-        return engulfing["engulfing"]
+        return self._identify("engulfing")
 
     def identify_inside_bar(self):
-        inside_bar = self.kdf[["open", "close", "high", "low"]]
-        inside_bar["inside_bar"] = np.where(
-            (inside_bar["high"] <= inside_bar["high"].shift(1))
-            & (inside_bar["low"] >= inside_bar["low"].shift(1)),
-            1,
-            0,
-        )
-        return inside_bar["inside_bar"]
+        return self._identify("inside_bar")
 
     def indentify_outside_bar(self):
-        outside_bar = self.kdf[["open", "close", "high", "low"]]
-        outside_bar["outside_bar"] = np.where(
-            (outside_bar["high"] > outside_bar["high"].shift(1))
-            & (outside_bar["low"] < outside_bar["low"].shift(1)),
-            1,
-            0,
-        )
-        return outside_bar["outside_bar"]
+        return self._identify("outside_bar")
 
     def indentify_oneside_bar(self):
-        oneside_bar = self.kdf[["open", "close", "high", "low"]]
-        oneside_bar["oneside_bar"] = np.where(
-            (oneside_bar["high"] > oneside_bar["high"].shift(1))
-            & (oneside_bar["low"] >= oneside_bar["low"].shift(1)),
-            1,
-            np.where(
-                (oneside_bar["low"] < oneside_bar["low"].shift(1))
-                & (oneside_bar["high"] <= oneside_bar["high"].shift(1)),
-                -1,
-                0,
-            ),
-        )
-        return oneside_bar["oneside_bar"]
+        return self._identify("oneside_bar")
+
+
+class PatternStream:
+    """
+    Streaming pattern scanner over live candles of several symbols at once, giving the same
+    values as pattern_matrix and swing_hilo on the history.
+    Args:
+        num_symbols: int: number of symbols, e.g. len(MarketUniverse)
+
+    Attributes:
+        highs, lows, highs_count, lows_count: np.ndarray: swing levels of the last confirmed bar,
+            a swing needs the next candle so they lag the last update by one bar
+    """
+
+    def __init__(self, num_symbols: int = 1) -> None:
+        self.num_symbols = num_symbols
+        self.num_bars = 0
+        self._prev = np.full((num_symbols, 4), np.nan)
+        self._prev_high = np.full(num_symbols, np.nan)
+        self._prev_low = np.full(num_symbols, np.nan)
+        self.highs = np.full(num_symbols, np.nan)
+        self.lows = np.full(num_symbols, np.nan)
+        self.highs_count = np.full(num_symbols, np.nan)
+        self.lows_count = np.full(num_symbols, np.nan)
+
+    def update(self, bars: np.ndarray) -> np.ndarray:
+        """feed one finished (symbols, 4) ohlc candle per symbol, return its (symbols, 5) int8 patterns"""
+        bars = np.asarray(bars, dtype=np.float64).reshape(self.num_symbols, 4)
+        patterns = _pattern_kernel(self._prev, bars)
+        high, low = bars[:, 1], bars[:, 2]
+        if self.num_bars == 0:
+            self.highs, self.lows = high.copy(), low.copy()
+            self.highs_count = np.zeros(self.num_symbols)
+            self.lows_count = np.zeros(self.num_symbols)
+        elif self.num_bars >= 2:
+            # the previous candle is confirmed now that its next candle is known
+            curr_high, curr_low = self._prev[:, 1], self._prev[:, 2]
+            swing_high = (curr_high > self._prev_high) & (curr_high > high)
+            swing_low = (curr_low < self._prev_low) & (curr_low < low)
+            update_high = swing_high & (curr_high > self.highs)
+            update_low = swing_low & (curr_low < self.lows)
+            self.highs = np.where(update_high, curr_high, self.highs)
+            self.lows = np.where(update_low, curr_low, self.lows)
+            self.highs_count = np.where(update_high, 0, self.highs_count + 1)
+            self.lows_count = np.where(update_low, 0, self.lows_count + 1)
+        if self.num_bars >= 1:
+            self._prev_high, self._prev_low = self._prev[:, 1].copy(), self._prev[:, 2].copy()
+        self._prev = bars.copy()
+        self.num_bars += 1
+        return patterns
+
+
+if __name__ == "__main__":
+    import os
+    import time
+
+    main_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+    kdf = pd.read_csv(os.path.join(main_path, "production/data/BTCUSDT_1m.csv"), index_col=0)
+    panel = np.stack([kdf[OHLC_COLUMNS].to_numpy()] * 100)
+    start_time = time.time()
+    patterns = pattern_matrix(panel)
+    highs, lows, highs_count, lows_count = swing_hilo(panel[..., 1], panel[..., 2])
+    print(f"Time used to scan {panel.shape[0]} x {panel.shape[1]} candles: {time.time() - start_time} seconds")
+
+    stream = PatternStream(panel.shape[0])
+    for i in range(panel.shape[1]):
+        assert (stream.update(panel[:, i]) == patterns[:, i]).all()
+        if i >= 2:
+            assert np.allclose(stream.highs, highs[:, i - 1]) and np.allclose(stream.lows_count, lows_count[:, i - 1])
+    print(pd.DataFrame(patterns[0], columns=PATTERNS).tail())
@@ -0,0 +1,242 @@
+"""
+signal rules written as expressions over indicator columns, e.g.
+
+    long: adx >= 25 and 0 < upcross < 20
+    short: close < vwap and direction == -1 and prev(direction) == 1
+
+Supported are numbers, column names, + - * / **, comparisons (chained too), and / or / not, abs(x)
+and prev(column, n=1), the column n bars ago. The expressions are parsed with ast and checked
+against this whitelist like contek_pyutils.eval_math, then evaluated over numpy arrays, or with
+numba compiled into one loop over the bars without intermediate arrays. Comparisons with NaN are
+False like the pandas masks they replace.
+"""
+import ast
+import functools
+import operator
+
+import numpy as np
+import yaml
+from contek_pyutils.eval_math import operators
+from index.jit import NUMBA_AVAILABLE, njit
+
+ARITHMETIC = {ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Div: "/", ast.Pow: "**"}
+COMPARISONS = {
+    ast.Lt: ("<", operator.lt),
+    ast.LtE: ("<=", operator.le),
+    ast.Gt: (">", operator.gt),
+    ast.GtE: (">=", operator.ge),
+    ast.Eq: ("==", operator.eq),
+    ast.NotEq: ("!=", operator.ne),
+}
+FUNCTIONS = ("abs", "prev")
+
+
+class SignalSyntaxError(ValueError):
+    pass
+
+
+def parse_rule(expr: str) -> tuple:
+    """(ast of expr, referenced columns, largest prev lag), raising SignalSyntaxError outside the grammar"""
+    try:
+        tree = ast.parse(str(expr), mode="eval").body
+    except SyntaxError as error:
+        raise SignalSyntaxError(f"{expr!r}: {error.msg}") from None
+    columns = {}
+    max_lag = 0
+
+    def check(node):
+        nonlocal max_lag
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                raise SignalSyntaxError(f"{expr!r}: only numeric constants are supported")
+        elif isinstance(node, ast.Name):
+            columns[node.id] = None
+        elif isinstance(node, ast.BinOp) and type(node.op) in ARITHMETIC:
+            check(node.left)
+            check(node.right)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.Not)):
+            check(node.operand)
+        elif isinstance(node, ast.Compare) and all(type(op) in COMPARISONS for op in node.ops):
+            for child in [node.left, *node.comparators]:
+                check(child)
+        elif isinstance(node, ast.BoolOp):
+            for child in node.values:
+                check(child)
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS:
+            if node.keywords:
+                raise SignalSyntaxError(f"{expr!r}: {node.func.id} takes no keywords")
+            if node.func.id == "abs":
+                if len(node.args) != 1:
+                    raise SignalSyntaxError(f"{expr!r}: abs takes one argument")
+                check(node.args[0])
+            else:
+                lag = _prev_lag(node, expr)
+                columns[node.args[0].id] = None
+                max_lag = max(max_lag, lag)
+        else:
+            raise SignalSyntaxError(f"{expr!r}: unsupported {ast.dump(node)}")
+
+    check(tree)
+    return tree, list(columns), max_lag
+
+
+def _prev_lag(node: ast.Call, expr: str) -> int:
+    args = node.args
+    if not 1 <= len(args) <= 2 or not isinstance(args[0], ast.Name):
+        raise SignalSyntaxError(f"{expr!r}: prev takes a column name and an optional lag")
+    if len(args) == 1:
+        return 1
+    lag = args[1]
+    if not (isinstance(lag, ast.Constant) and type(lag.value) is int and lag.value >= 1):
+        raise SignalSyntaxError(f"{expr!r}: the lag of prev must be a positive integer")
+    return lag.value
+
+
+def _shift(values: np.ndarray, lag: int) -> np.ndarray:
+    shifted = np.full(values.shape, np.nan)
+    if lag < len(values):
+        shifted[lag:] = values[:-lag]
+    return shifted
+
+
+def _as_bool(values):
+    return values if getattr(values, "dtype", None) == np.bool_ else values != 0
+
+
+def _evaluate(node, arrays: dict):
+    """tree walk over whole arrays, the numpy backend"""
+    if isinstance(node, ast.Constant):
+        return float(node.value)
+    if isinstance(node, ast.Name):
+        return arrays[node.id]
+    if isinstance(node, ast.BinOp):
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            return operators[type(node.op)](_evaluate(node.left, arrays), _evaluate(node.right, arrays))
+    if isinstance(node, ast.UnaryOp):
+        operand = _evaluate(node.operand, arrays)
+        if isinstance(node.op, ast.Not):
+            return ~_as_bool(operand)
+        return operators[type(node.op)](operand)
+    if isinstance(node, ast.Compare):
+        operands = [_evaluate(child, arrays) for child in [node.left, *node.comparators]]
+        masks = [COMPARISONS[type(op)][1](a, b) for op, a, b in zip(node.ops, operands, operands[1:])]
+        return functools.reduce(operator.and_, masks)
+    if isinstance(node, ast.BoolOp):
+        combine = operator.and_ if isinstance(node.op, ast.And) else operator.or_
+        return functools.reduce(combine, [_as_bool(_evaluate(child, arrays)) for child in node.values])
+    if node.func.id == "abs":
+        return np.abs(_evaluate(node.args[0], arrays))
+    return _shift(arrays[node.args[0].id], _prev_lag(node, ""))
+
+
+def _source(node) -> str:
+    """python source of one bar i, the body of the numba loop"""
+    if isinstance(node, ast.Constant):
+        return repr(float(node.value))
+    if isinstance(node, ast.Name):
+        return f"c_{node.id}[i]"
+    if isinstance(node, ast.BinOp):
+        return f"({_source(node.left)} {ARITHMETIC[type(node.op)]} {_source(node.right)})"
+    if isinstance(node, ast.UnaryOp):
+        return f"(not {_source(node.operand)})" if isinstance(node.op, ast.Not) else f"(-{_source(node.operand)})"
+    if isinstance(node, ast.Compare):
+        operands = [_source(child) for child in [node.left, *node.comparators]]
+        pairs = [f"({a} {COMPARISONS[type(op)][0]} {b})" for op, a, b in zip(node.ops, operands, operands[1:])]
+        return f"({' and '.join(pairs)})"
+    if isinstance(node, ast.BoolOp):
+        joiner = " and " if isinstance(node.op, ast.And) else " or "
+        return f"({joiner.join(_source(child) for child in node.values)})"
+    if node.func.id == "abs":
+        return f"abs({_source(node.args[0])})"
+    lag = _prev_lag(node, "")
+    return f"(c_{node.args[0].id}[i - {lag}] if i >= {lag} else np.nan)"
+
+
+class SignalRule:
+    """
+    Compiled long / short rule of an alpha. The signal is 1 where long holds, -1 where short holds
+    (short wins when both do) and 0 elsewhere, the same as setting the masks with .loc in order.
+    Args:
+        long: str: expression of the long entries
+        short: str: expression of the short entries
+
+    Usage:
+        rule = SignalRule(long="adx >= 25 and 0 < upcross < 20", short="adx >= 25 and downcross > 80")
+        trading_signal["signal"] = rule.evaluate(trading_signal)
+        latest = rule.evaluate(trading_signal, start=len(trading_signal) - 1)[0]
+    """
+
+    def __init__(self, long: str = None, short: str = None) -> None:
+        self.long = long
+        self.short = short
+        self._trees = {}
+        columns = {}
+        self.max_lag = 0
+        for side, expr in (("long", long), ("short", short)):
+            if expr is None:
+                continue
+            tree, side_columns, lag = parse_rule(expr)
+            self._trees[side] = tree
+            columns.update(dict.fromkeys(side_columns))
+            self.max_lag = max(self.max_lag, lag)
+        self.columns = list(columns)
+        if not self.columns:
+            raise SignalSyntaxError(f"{self!r} references no column")
+        self._kernel = self._compile_kernel() if NUMBA_AVAILABLE else None
+
+    @classmethod
+    def from_config(cls, config: dict) -> "SignalRule":
+        return cls(long=config.get("long"), short=config.get("short"))
+
+    def __repr__(self) -> str:
+        return f"SignalRule(long={self.long!r}, short={self.short!r})"
+
+    def _compile_kernel(self):
+        args = ", ".join(f"c_{col}" for col in self.columns)
+        long = _source(self._trees["long"]) if "long" in self._trees else "False"
+        short = _source(self._trees["short"]) if "short" in self._trees else "False"
+        source = (
+            f"def signal_kernel(start, out, {args}):\n"
+            f"    for i in range(start, len(out)):\n"
+            f"        if {short}:\n"
+            f"            out[i] = -1\n"
+            f"        elif {long}:\n"
+            f"            out[i] = 1\n"
+            f"        else:\n"
+            f"            out[i] = 0\n"
+        )
+        namespace = {"np": np}
+        exec(compile(source, f"<signal {self!r}>", "exec"), namespace)
+        # numpy semantics for x / 0 instead of ZeroDivisionError, like the array backend
+        return njit(error_model="numpy")(namespace["signal_kernel"])
+
+    def evaluate(self, columns, start: int = 0) -> np.ndarray:
+        """
+        int64 signal of the bars from start on. columns is a DataFrame or a dict of arrays holding
+        self.columns; only the last max_lag bars before start are read, so live updates may pass
+        start=len - 1 and get the signal of the latest candle alone
+        """
+        missing = [col for col in self.columns if col not in columns]
+        if missing:
+            raise KeyError(f"{self!r} needs columns {missing}")
+        offset = max(start - self.max_lag, 0)
+        arrays = {col: np.asarray(columns[col], dtype=np.float64)[offset:] for col in self.columns}
+        num_bars = len(arrays[self.columns[0]])
+        if self._kernel is not None:
+            out = np.zeros(num_bars, dtype=np.int64)
+            self._kernel(start - offset, out, *arrays.values())
+            return out[start - offset :]
+        signal = np.zeros(num_bars, dtype=np.int64)
+        for side, value in (("long", 1), ("short", -1)):
+            if side in self._trees:
+                mask = np.broadcast_to(_as_bool(_evaluate(self._trees[side], arrays)), (num_bars,))
+                signal[mask] = value
+        return signal[start - offset :]
+
+
+@functools.cache
+def load_signal_rules(path: str) -> dict:
+    """{name: SignalRule} of a yaml file mapping names to {long: expr, short: expr}"""
+    with open(path, "r") as stream:
+        config = yaml.safe_load(stream)
+    return {name: SignalRule.from_config(rule) for name, rule in config.items()}
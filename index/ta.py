@@ -0,0 +1,383 @@
+"""
+numpy implementations of the pandas_ta (0.3.14b) indicators we use, without the Series overhead.
+The recursive and rolling parts replicate the pandas ewm / rolling kernels step by step, so results
+are equal to the last bit and signals on exact ties (e.g. stochrsi k == d) do not flip. The kernels
+are compiled when numba is installed. Inputs are 1-D float arrays of equal length, outputs are
+arrays aligned with them. tests/test_ta.py checks the parity against pandas_ta on recorded data,
+running this module times both.
+"""
+import sys
+
+import numpy as np
+from index.jit import njit
+
+EPSILON = sys.float_info.epsilon
+
+
+def _as_array(values) -> np.ndarray:
+    return np.asarray(values, dtype=np.float64)
+
+
+@njit(cache=True)
+def _ewm_kernel(values, com, adjust, min_periods):
+    """pandas ewm(com=com, adjust=adjust, min_periods=min_periods).mean(), same recursion and rounding"""
+    alpha = 1.0 / (1.0 + com)
+    old_wt_factor = 1.0 - alpha
+    new_wt = 1.0 if adjust else alpha
+    n = len(values)
+    out = np.empty(n)
+    if n == 0:
+        return out
+    weighted = values[0]
+    nobs = 1 if weighted == weighted else 0
+    out[0] = weighted if nobs >= min_periods else np.nan
+    old_wt = 1.0
+    for i in range(1, n):
+        cur = values[i]
+        is_observation = cur == cur
+        if is_observation:
+            nobs += 1
+        if weighted == weighted:
+            old_wt *= old_wt_factor
+            if is_observation:
+                # pandas keeps constant series exact
+                if weighted != cur:
+                    weighted = old_wt * weighted + new_wt * cur
+                    weighted /= old_wt + new_wt
+                if adjust:
+                    old_wt += new_wt
+                else:
+                    old_wt = 1.0
+        elif is_observation:
+            weighted = cur
+        out[i] = weighted if nobs >= min_periods else np.nan
+    return out
+
+
+@njit(cache=True)
+def _rolling_mean_kernel(values, window):
+    """pandas rolling(window).mean(): kahan summation of the adds and the removes"""
+    n = len(values)
+    out = np.empty(n)
+    nobs = 0
+    neg_ct = 0
+    sum_x = 0.0
+    compensation_add = 0.0
+    compensation_remove = 0.0
+    num_same = 0
+    prev_value = values[0] if n > 0 else np.nan
+    for i in range(n):
+        if i >= window:
+            val = values[i - window]
+            if val == val:
+                nobs -= 1
+                y = -val - compensation_remove
+                t = sum_x + y
+                compensation_remove = t - sum_x - y
+                sum_x = t
+                if np.signbit(val):
+                    neg_ct -= 1
+        val = values[i]
+        if val == val:
+            nobs += 1
+            y = val - compensation_add
+            t = sum_x + y
+            compensation_add = t - sum_x - y
+            sum_x = t
+            if np.signbit(val):
+                neg_ct += 1
+            num_same = num_same + 1 if val == prev_value else 1
+            prev_value = val
+        if nobs >= window and nobs > 0:
+            result = sum_x / nobs
+            if num_same >= nobs:
+                result = prev_value
+            elif neg_ct == 0 and result < 0:
+                result = 0.0
+            elif neg_ct == nobs and result > 0:
+                result = 0.0
+        else:
+            result = np.nan
+        out[i] = result
+    return out
+
+
+@njit(cache=True)
+def _rolling_var_kernel(values, window, ddof):
+    """pandas rolling(window).var(ddof): welford updates with kahan compensation"""
+    n = len(values)
+    out = np.empty(n)
+    nobs = 0.0
+    mean_x = 0.0
+    ssqdm_x = 0.0
+    compensation_add = 0.0
+    compensation_remove = 0.0
+    num_same = 0
+    prev_value = values[0] if n > 0 else np.nan
+    for i in range(n):
+        if i >= window:
+            val = values[i - window]
+            if val == val:
+                nobs -= 1
+                if nobs:
+                    prev_mean = mean_x - compensation_remove
+                    y = val - compensation_remove
+                    t = y - mean_x
+                    compensation_remove = t + mean_x - y
+                    mean_x = mean_x - t / nobs
+                    ssqdm_x = ssqdm_x - (val - prev_mean) * (val - mean_x)
+                else:
+                    mean_x = 0.0
+                    ssqdm_x = 0.0
+        val = values[i]
+        if val == val:
+            nobs += 1
+            num_same = num_same + 1 if val == prev_value else 1
+            prev_value = val
+            prev_mean = mean_x - compensation_add
+            y = val - compensation_add
+            t = y - mean_x
+            compensation_add = t + mean_x - y
+            mean_x = mean_x + t / nobs
+            ssqdm_x = ssqdm_x + (val - prev_mean) * (val - mean_x)
+        if nobs >= window and nobs > ddof:
+            if nobs == 1 or num_same >= nobs:
+                result = 0.0
+            else:
+                result = ssqdm_x / (nobs - ddof)
+        else:
+            result = np.nan
+        out[i] = result
+    return out
+
+
+@njit(cache=True)
+def _group_cumsum_kernel(values, starts):
+    """pandas groupby(...).cumsum() of contiguous groups starting at starts, kahan summation, NaN skipped"""
+    out = np.empty(len(values))
+    accum = 0.0
+    compensation = 0.0
+    group = 0
+    for i in range(len(values)):
+        if group < len(starts) and i == starts[group]:
+            accum = 0.0
+            compensation = 0.0
+            group += 1
+        val = values[i]
+        if val == val:
+            y = val - compensation
+            t = accum + y
+            compensation = t - accum - y
+            accum = t
+            out[i] = t
+        else:
+            out[i] = np.nan
+    return out
+
+
+def _rolling(values: np.ndarray, length: int):
+    """sliding windows of length ending at every bar from length - 1"""
+    return np.lib.stride_tricks.sliding_window_view(values, length)
+
+
+def non_zero_range(high: np.ndarray, low: np.ndarray) -> np.ndarray:
+    diff = high - low
+    if (diff == 0).any():
+        diff = diff + EPSILON
+    return diff
+
+
+def sma(close, length: int = 10) -> np.ndarray:
+    return _rolling_mean_kernel(_as_array(close), length)
+
+
+def ema(close, length: int = 10) -> np.ndarray:
+    """sma seeded ema with adjust=False, leading NaN allowed"""
+    close = _as_array(close)
+    out = np.full(close.shape, np.nan)
+    if len(close) < length:
+        return out
+    with np.errstate(invalid="ignore"):
+        seed = np.nanmean(close[:length])
+    out[length - 1] = seed
+    out[length:] = close[length:]
+    return _ewm_kernel(out, (length - 1) / 2.0, False, 1)
+
+
+def rma(close, length: int = 10) -> np.ndarray:
+    """wilder's moving average, ewm(alpha=1 / length, min_periods=length) with adjust=True"""
+    alpha = (1.0 / length) if length > 0 else 0.5
+    # pandas goes through the center of mass, 1 / (1 + com) is not always alpha to the last bit
+    return _ewm_kernel(_as_array(close), 1.0 / alpha - 1.0, True, max(length, 1))
+
+
+def dema(close, length: int = 10) -> np.ndarray:
+    ema1 = ema(close, length)
+    ema2 = ema(ema1, length)
+    return 2 * ema1 - ema2
+
+
+def stdev(close, length: int = 30, ddof: int = 1) -> np.ndarray:
+    close = _as_array(close)
+    ddof = ddof if 0 <= ddof < length else 1
+    return np.sqrt(_rolling_var_kernel(close, length, ddof))
+
+
+def true_range(high, low, close, drift: int = 1) -> np.ndarray:
+    high, low, close = _as_array(high), _as_array(low), _as_array(close)
+    prev_close = np.full(close.shape, np.nan)
+    prev_close[drift:] = close[:-drift]
+    ranges = np.stack([non_zero_range(high, low), high - prev_close, prev_close - low])
+    out = np.nanmax(np.abs(ranges), axis=0)
+    out[:drift] = np.nan
+    return out
+
+
+def atr(high, low, close, length: int = 14, mamode: str = "rma") -> np.ndarray:
+    tr = true_range(high, low, close)
+    mamode = mamode.lower() if mamode else "rma"
+    if mamode == "ema":
+        return ema(tr, length)
+    if mamode == "sma":
+        return sma(tr, length)
+    return rma(tr, length)
+
+
+def rsi(close, length: int = 14, scalar: float = 100) -> np.ndarray:
+    close = _as_array(close)
+    change = np.full(close.shape, np.nan)
+    change[1:] = np.diff(close)
+    positive_avg = rma(np.where(change < 0, 0.0, change), length)
+    negative_avg = rma(np.where(change > 0, 0.0, change), length)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return scalar * positive_avg / (positive_avg + np.abs(negative_avg))
+
+
+def stochrsi(close, length: int = 14, rsi_length: int = 14, k: int = 3, d: int = 3) -> tuple:
+    """returns (k, d)"""
+    rsi_ = rsi(close, rsi_length)
+    lowest = np.full(rsi_.shape, np.nan)
+    highest = np.full(rsi_.shape, np.nan)
+    if len(rsi_) >= length:
+        windows = _rolling(rsi_, length)
+        lowest[length - 1 :] = windows.min(axis=-1)
+        highest[length - 1 :] = windows.max(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        stoch = 100 * (rsi_ - lowest) / non_zero_range(highest, lowest)
+    stochrsi_k = sma(stoch, k)
+    return stochrsi_k, sma(stochrsi_k, d)
+
+
+def adx(high, low, close, length: int = 14, lensig: int = None, scalar: float = 100) -> tuple:
+    """returns (adx, dmp, dmn)"""
+    high, low, close = _as_array(high), _as_array(low), _as_array(close)
+    lensig = lensig if lensig and lensig > 0 else length
+    atr_ = atr(high, low, close, length)
+    up = np.full(high.shape, np.nan)
+    dn = np.full(low.shape, np.nan)
+    up[1:] = high[1:] - high[:-1]
+    dn[1:] = low[:-1] - low[1:]
+    pos = np.where((up > dn) & (up > 0), up, np.where(np.isnan(up), np.nan, 0.0))
+    neg = np.where((dn > up) & (dn > 0), dn, np.where(np.isnan(dn), np.nan, 0.0))
+    pos[np.abs(pos) < EPSILON] = 0.0
+    neg[np.abs(neg) < EPSILON] = 0.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        k = scalar / atr_
+        dmp = k * rma(pos, length)
+        dmn = k * rma(neg, length)
+        dx = scalar * np.abs(dmp - dmn) / (dmp + dmn)
+    return rma(dx, lensig), dmp, dmn
+
+
+def macd(close, fast: int = 12, slow: int = 26, signal: int = 9) -> tuple:
+    """returns (macd, histogram, signal)"""
+    if slow < fast:
+        fast, slow = slow, fast
+    macd_ = ema(close, fast) - ema(close, slow)
+    signal_ = np.full(macd_.shape, np.nan)
+    valid = np.flatnonzero(~np.isnan(macd_))
+    if len(valid) > 0:
+        signal_[valid[0] :] = ema(macd_[valid[0] :], signal)
+    return macd_, macd_ - signal_, signal_
+
+
+@njit(cache=True)
+def _supertrend_kernel(close, upperband, lowerband, trend, direction, long, short):
+    direction[0] = 1
+    trend[0] = 0.0
+    for i in range(1, len(close)):
+        if close[i] > upperband[i - 1]:
+            direction[i] = 1
+        elif close[i] < lowerband[i - 1]:
+            direction[i] = -1
+        else:
+            direction[i] = direction[i - 1]
+            if direction[i] > 0 and lowerband[i] < lowerband[i - 1]:
+                lowerband[i] = lowerband[i - 1]
+            if direction[i] < 0 and upperband[i] > upperband[i - 1]:
+                upperband[i] = upperband[i - 1]
+        if direction[i] > 0:
+            trend[i] = long[i] = lowerband[i]
+        else:
+            trend[i] = short[i] = upperband[i]
+
+
+def supertrend(high, low, close, length: int = 7, multiplier: float = 3.0) -> tuple:
+    """returns (trend, direction, long, short)"""
+    high, low, close = _as_array(high), _as_array(low), _as_array(close)
+    hl2 = 0.5 * (high + low)
+    matr = multiplier * atr(high, low, close, length)
+    upperband = hl2 + matr
+    lowerband = hl2 - matr
+    n = len(close)
+    trend = np.zeros(n)
+    direction = np.ones(n, dtype=np.int64)
+    long = np.full(n, np.nan)
+    short = np.full(n, np.nan)
+    if n > 0:
+        _supertrend_kernel(close, upperband, lowerband, trend, direction, long, short)
+    return trend, direction, long, short
+
+
+def vwap(high, low, close, volume, anchor) -> np.ndarray:
+    """vwap reset whenever the anchor period id changes, e.g. opentime days"""
+    high, low, close, volume = _as_array(high), _as_array(low), _as_array(close), _as_array(volume)
+    anchor = np.asarray(anchor)
+    if len(anchor) == 0:
+        return np.empty(0)
+    weighted = (high + low + close) / 3.0 * volume
+    starts = np.r_[0, np.flatnonzero(anchor[1:] != anchor[:-1]) + 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return _group_cumsum_kernel(weighted, starts) / _group_cumsum_kernel(volume, starts)
+
+
+if __name__ == "__main__":
+    import os
+    import time
+
+    import pandas as pd
+    import pandas_ta as pta
+
+    main_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+    kdf = pd.read_csv(os.path.join(main_path, "production/data/BTCUSDT_1m.csv"), index_col=0)
+    kdf.index = pd.to_datetime(kdf.index)
+    num_bars = 20_000
+    repeat = num_bars // len(kdf) + 1
+    long_kdf = pd.concat([kdf] * repeat).iloc[:num_bars].reset_index(drop=True)
+    high, low, close = (long_kdf[col].to_numpy() for col in ["high", "low", "close"])
+    for name, native, reference in [
+        ("ema", lambda: ema(close, 20), lambda: pta.ema(long_kdf["close"], 20)),
+        ("rsi", lambda: rsi(close, 14), lambda: pta.rsi(long_kdf["close"], 14)),
+        ("adx", lambda: adx(high, low, close, 14), lambda: pta.adx(long_kdf["high"], long_kdf["low"], long_kdf["close"])),
+        (
+            "supertrend",
+            lambda: supertrend(high, low, close, 10, 3.0),
+            lambda: pta.supertrend(long_kdf["high"], long_kdf["low"], long_kdf["close"], 10, 3.0),
+        ),
+    ]:
+        start_time = time.time()
+        reference()
+        reference_time = time.time() - start_time
+        start_time = time.time()
+        native()
+        print(f"{name} on {num_bars} bars: pandas_ta {reference_time:.4f}s, native {time.time() - start_time:.4f}s")
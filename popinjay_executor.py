@@ -6,10 +6,12 @@ main_path = "/Users/rivachol/Desktop/Rivachol_v2"
 sys.path.append(main_path)
 from production.binance_execution.traders import Traders
 from production.kline import KlineGenerator
+from index import ta
+from index.indicators import Supertrend
 import contek_timbersaw as timbersaw
 import time 
 import pandas as pd
-import pandas_ta as pta
+import numpy as np
 from datetime import datetime
 from retry import retry
 
@@ -50,10 +52,7 @@ class ExecPopinjay(Traders):
 
     def _supertrend(self) -> pd.DataFrame:
         kdf = self.candle.kdf
-        supertrend = pta.supertrend(
-            kdf["high"], kdf["low"], kdf["close"],  self.params['sptr_len'],  self.params['sptr_k']
-        )
-        supertrend.columns = ["stop_price", "direction", "lbound", "ubound"]
+        supertrend = Supertrend(kdf, self.params['sptr_len'], self.params['sptr_k']).get_indicator()
 
         return supertrend[["stop_price", "direction"]]
     
@@ -72,7 +71,7 @@ class ExecPopinjay(Traders):
             if datetime.utcnow() -  self.candle.kdf.closetime[-1] > pd.Timedelta(minutes=timeframe_int):
                 return False
             else:
-                self.logger.info(f"New candle data is refreshed.")吧  
+                self.logger.info(f"New candle data is refreshed.")
                 if self.over_boundary():
                     self.restart_program()
                 return True
@@ -80,7 +79,7 @@ class ExecPopinjay(Traders):
     def calc_levels(self) -> dict:
         kdf = self.candle.kdf
         supertrend = self._supertrend()
-        kdf['atr'] = pta.atr(kdf["high"], kdf["low"], kdf["close"], length = self.params['atr_len'], mamode = "EMA")
+        kdf['atr'] = ta.atr(kdf["high"].to_numpy(), kdf["low"].to_numpy(), kdf["close"].to_numpy(), length = self.params['atr_len'], mamode = "EMA")
         kdf = pd.concat([kdf, supertrend], axis=1)
 
         current_price = kdf["close"][-1]
@@ -154,8 +153,8 @@ class ExecPopinjay(Traders):
     @retry(tries=3, delay=1)
     def calc_grid(self) -> float:
         kdf = self.latest_kdf   
-        atr = pta.atr(kdf["high"], kdf["low"], kdf["close"], length = self.params['atr_len'], mamode = "EMA")
-        grid = atr.mean()
+        atr = ta.atr(kdf["high"].to_numpy(), kdf["low"].to_numpy(), kdf["close"].to_numpy(), length = self.params['atr_len'], mamode = "EMA")
+        grid = np.nanmean(atr)
         return grid
         
     def over_boundary(self) -> bool:
@@ -0,0 +1,828 @@
+import sys
+import os
+
+main_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+sys.path.append(main_path)
+import warnings
+
+warnings.filterwarnings("ignore")
+
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+from aiohttp import WSMsgType, web
+from contek_pyutils import metrics
+from contek_pyutils.time import interval_to_millis
+from research.Market.synthetic import KLINE_COLUMNS, SyntheticMarket
+
+# price path of a bar, four ticks: open, the first extreme, the second extreme, close
+TICKS_PER_BAR = 4
+
+
+class SimError(Exception):
+    """binance error response, code and msg like the api"""
+
+    def __init__(self, code: int, msg: str, status: int = 400) -> None:
+        super().__init__(msg)
+        self.code = code
+        self.msg = msg
+        self.status = status
+
+
+class SimOrder:
+    __slots__ = (
+        "order_id", "client_order_id", "symbol", "side", "type", "time_in_force", "price", "orig_qty",
+        "executed_qty", "cum_quote", "reduce_only", "status", "time", "update_time",
+    )
+
+    def __init__(self, order_id, client_order_id, symbol, side, type, time_in_force, price, qty, reduce_only, now):
+        self.order_id = order_id
+        self.client_order_id = client_order_id
+        self.symbol = symbol
+        self.side = side
+        self.type = type
+        self.time_in_force = time_in_force
+        self.price = price
+        self.orig_qty = qty
+        self.executed_qty = 0.0
+        self.cum_quote = 0.0
+        self.reduce_only = reduce_only
+        self.status = "NEW"
+        self.time = now
+        self.update_time = now
+
+    def to_dict(self) -> dict:
+        avg_price = self.cum_quote / self.executed_qty if self.executed_qty else 0.0
+        return {
+            "orderId": self.order_id,
+            "symbol": self.symbol,
+            "status": self.status,
+            "clientOrderId": self.client_order_id,
+            "price": _fmt(self.price),
+            "avgPrice": _fmt(avg_price),
+            "origQty": _fmt(self.orig_qty),
+            "executedQty": _fmt(self.executed_qty),
+            "cumQty": _fmt(self.executed_qty),
+            "cumQuote": _fmt(self.cum_quote),
+            "timeInForce": self.time_in_force,
+            "type": self.type,
+            "reduceOnly": self.reduce_only,
+            "closePosition": False,
+            "side": self.side,
+            "positionSide": "BOTH",
+            "stopPrice": "0",
+            "workingType": "CONTRACT_PRICE",
+            "priceProtect": False,
+            "origType": self.type,
+            "time": self.time,
+            "updateTime": self.update_time,
+        }
+
+
+class SimSymbol:
+    """
+    Market and account state of one symbol: the klines replayed, the resting orders of the account
+    in price-time heaps (cancelled orders are dropped lazily) and the one-way position.
+    """
+
+    def __init__(self, symbol: str, klines: dict, tick_size: float, depth_levels: int, depth_qty: float) -> None:
+        self.symbol = symbol
+        self.klines = {col: np.asarray(klines[col]) for col in KLINE_COLUMNS}
+        self.tick_size = tick_size
+        self.depth_levels = depth_levels
+        self.depth_qty = depth_qty
+        self.bar = 0
+        self.tick = 0
+        self.price = float(self.klines["open"][0])
+        self.update_id = 1
+        self.bids = []  # (-price, order_id)
+        self.asks = []  # (price, order_id)
+        self.position = 0.0
+        self.entry_price = 0.0
+        self.realized_pnl = 0.0
+        self.update_time = 0
+
+    @property
+    def bid(self) -> float:
+        return round(np.floor(self.price / self.tick_size + 1e-9) * self.tick_size, 10)
+
+    @property
+    def ask(self) -> float:
+        return round(self.bid + self.tick_size, 10)
+
+    def tick_price(self, bar: int, tick: int) -> float:
+        o, h, l, c = (float(self.klines[col][bar]) for col in ("open", "high", "low", "close"))
+        path = (o, l, h, c) if c >= o else (o, h, l, c)
+        return path[tick]
+
+    def kline_row(self, bar: int, partial: bool) -> list:
+        """binance kline row of a bar, the bar in progress only up to the current tick"""
+        row = [self.klines[col][bar] for col in KLINE_COLUMNS]
+        if partial:
+            path = [self.tick_price(bar, tick) for tick in range(self.tick + 1)]
+            share = (self.tick + 1) / TICKS_PER_BAR
+            row[2], row[3], row[4] = max(path), min(path), path[-1]
+            for i in (5, 7, 9, 10):
+                row[i] = row[i] * share
+            row[8] = int(row[8] * share)
+        return [
+            int(row[0]), _fmt(row[1]), _fmt(row[2]), _fmt(row[3]), _fmt(row[4]), _fmt(row[5]), int(row[6]),
+            _fmt(row[7]), int(row[8]), _fmt(row[9]), _fmt(row[10]), "0",
+        ]
+
+    def depth(self, levels: int = None) -> tuple:
+        levels = self.depth_levels if levels is None else levels
+        bid, ask = self.bid, self.ask
+        bids = [[_fmt(bid - i * self.tick_size), _fmt(self.depth_qty * (1 + i))] for i in range(levels)]
+        asks = [[_fmt(ask + i * self.tick_size), _fmt(self.depth_qty * (1 + i))] for i in range(levels)]
+        return bids, asks
+
+    def fill(self, qty: float, price: float) -> float:
+        """apply a signed fill to the position, return its realized pnl"""
+        realized = 0.0
+        if self.position == 0 or (self.position > 0) == (qty > 0):
+            total = abs(self.position) + abs(qty)
+            self.entry_price = (self.entry_price * abs(self.position) + price * abs(qty)) / total
+        else:
+            closing = min(abs(qty), abs(self.position))
+            realized = closing * (price - self.entry_price) * (1 if self.position > 0 else -1)
+            if abs(qty) > abs(self.position):
+                self.entry_price = price
+        self.position = round(self.position + qty, 10)
+        if self.position == 0:
+            self.entry_price = 0.0
+        self.realized_pnl += realized
+        return realized
+
+    def position_risk(self, leverage: int) -> dict:
+        unrealized = (self.price - self.entry_price) * self.position if self.position else 0.0
+        return {
+            "symbol": self.symbol,
+            "positionAmt": _fmt(self.position),
+            "entryPrice": _fmt(self.entry_price),
+            "breakEvenPrice": _fmt(self.entry_price),
+            "markPrice": _fmt(self.price),
+            "unRealizedProfit": _fmt(unrealized),
+            "liquidationPrice": "0",
+            "leverage": str(leverage),
+            "maxNotionalValue": "10000000",
+            "marginType": "cross",
+            "isolatedMargin": "0.00000000",
+            "isAutoAddMargin": "false",
+            "positionSide": "BOTH",
+            "notional": _fmt(self.position * self.price),
+            "isolatedWallet": "0",
+            "updateTime": self.update_time,
+        }
+
+
+def _fmt(value) -> str:
+    return f"{float(value) + 0.0:.8f}".rstrip("0").rstrip(".")
+
+
+def _bool_param(value) -> bool:
+    return str(value).lower() == "true"
+
+
+class ExchangeSimulator:
+    """
+    Local binance usd-m futures exchange for executor tests and load tests, serving the subset of the
+    rest api and websocket streams used by Traders, ExecBest and KlineGenerator from replayed klines.
+
+    Every bar is replayed as four ticks (open, extremes in the likely order, close), the book is one
+    tick wide around the tick price with a fixed depth profile. Market orders and crossing limit
+    orders fill at once at the touch, resting limit orders fill at their price once the market trades
+    through it, GTX orders that would cross are rejected like binance does. The account is one-way
+    mode with one position per symbol. Times are shifted so the replay starts at the current minute
+    when align_now is set, so candle to order latencies measured against the wall clock are real.
+    Args:
+        klines: dict: {symbol: {column: array}} of KLINE_COLUMNS arrays, e.g. from SyntheticMarket
+        timeframe: str: interval of the klines
+        speed: float: simulated seconds per wall second, 0 only advances on POST /sim/advance
+        start_bar: int: first bar replayed, the bars before it are the kline history
+        align_now: bool: shift the kline times so start_bar opens at the current timeframe boundary
+        latency: float: seconds added to every rest response, a network round trip
+        tick_sizes: dict: {symbol: tick size}, 0.1 otherwise
+        balance: float: initial wallet balance
+        maker_fee: float: commission rate of resting fills
+        taker_fee: float: commission rate of crossing fills
+        leverage: int: leverage reported by the position risk
+
+    Usage:
+        simulator = ExchangeSimulator.from_synthetic(["BTCUSDT", "BTCUSDC"], speed=1)
+        await simulator.start("127.0.0.1", 8765)
+        # config.yaml: bn_api: {key: x, secret: y, base_url: http://127.0.0.1:8765, stream_url: ws://127.0.0.1:8765}
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(
+        self,
+        klines: dict,
+        timeframe: str = "1m",
+        speed: float = 1.0,
+        start_bar: int = 1500,
+        align_now: bool = True,
+        latency: float = 0.0,
+        tick_sizes: dict = None,
+        balance: float = 10000.0,
+        maker_fee: float = 2e-4,
+        taker_fee: float = 5e-4,
+        leverage: int = 5,
+        depth_levels: int = 20,
+        depth_qty: float = 0.5,
+    ) -> None:
+        self.timeframe = timeframe
+        self.tf_ms = int(interval_to_millis(timeframe))
+        self.tick_ms = self.tf_ms // TICKS_PER_BAR
+        self.speed = speed
+        self.latency = latency
+        self.balance = balance
+        self.maker_fee = maker_fee
+        self.taker_fee = taker_fee
+        self.leverage = leverage
+        tick_sizes = tick_sizes or {}
+        self.symbols = {
+            symbol: SimSymbol(symbol, arrays, tick_sizes.get(symbol, 0.1), depth_levels, depth_qty)
+            for symbol, arrays in klines.items()
+        }
+        first = max(int(book.klines["opentime"][0]) for book in self.symbols.values())
+        start = first + start_bar * self.tf_ms
+        offset = 0
+        if align_now:
+            now = int(time.time() * 1000)
+            offset = now - now % self.tf_ms - start
+        for book in self.symbols.values():
+            book.klines["opentime"] = book.klines["opentime"] + offset
+            book.klines["closetime"] = book.klines["closetime"] + offset
+        self.end_ms = min(int(book.klines["opentime"][-1]) for book in self.symbols.values()) + self.tf_ms
+        self.now_ms = start + offset - self.tick_ms
+        self.orders = {}
+        self.open_orders = {}
+        self.client_orders = {}
+        self._order_ids = itertools.count(1)
+        self._trade_ids = itertools.count(1)
+        self.listen_keys = set()
+        self._subscribers = {}  # stream -> {ws: combined}
+        self.stats = {"requests": 0, "orders": 0, "fills": 0, "rejects": 0, "cancels": 0, "ticks": 0}
+        self._started = time.perf_counter()
+        self._runner = None
+        self._clock = None
+        self.app = self._build_app()
+        self._move_to(self.now_ms + self.tick_ms)
+
+    @classmethod
+    def from_synthetic(cls, symbols: list, num_bars: int = 20_000, seed: int = 0, **kwargs) -> "ExchangeSimulator":
+        """one SyntheticMarket per symbol, seeded from seed and the symbol's position"""
+        kwargs.setdefault("start_bar", min(1500, num_bars // 2))
+        klines = {
+            symbol: SyntheticMarket(seed=seed + i, price=60000.0 / (i + 1)).kline_arrays(num_bars)
+            for i, symbol in enumerate(symbols)
+        }
+        return cls(klines, **kwargs)
+
+    @classmethod
+    def from_csv(cls, paths: dict, **kwargs) -> "ExchangeSimulator":
+        """{symbol: csv path} of klines exported by production.kline"""
+        klines = {}
+        for symbol, path in paths.items():
+            kdf = pd.read_csv(path)
+            arrays = {col: kdf[col].to_numpy() for col in KLINE_COLUMNS if col in kdf}
+            for col in ("opentime", "closetime"):
+                arrays[col] = pd.to_datetime(kdf[col]).to_numpy().astype("datetime64[ms]").astype(np.int64)
+            # the csv floors closetime to the second, binance rows end a millisecond before the next bar
+            arrays["closetime"] = arrays["opentime"] + (arrays["opentime"][1] - arrays["opentime"][0]) - 1
+            arrays.setdefault("ignore", np.zeros(len(kdf)))
+            klines[symbol] = arrays
+        kwargs.setdefault("start_bar", len(next(iter(klines.values()))["opentime"]) // 2)
+        return cls(klines, **kwargs)
+
+    # clock
+
+    def _move_to(self, now_ms: int) -> None:
+        """advance the replay to now_ms one tick at a time, matching resting orders on every tick"""
+        while self.now_ms + self.tick_ms <= now_ms:
+            self.now_ms += self.tick_ms
+            self.stats["ticks"] += 1
+            for book in self.symbols.values():
+                self._tick(book)
+
+    def _tick(self, book: SimSymbol) -> None:
+        opentime = book.klines["opentime"]
+        bar = int(np.searchsorted(opentime, self.now_ms, side="right")) - 1
+        if bar < 0:
+            return
+        tick = min((self.now_ms - int(opentime[bar])) // self.tick_ms, TICKS_PER_BAR - 1)
+        if self.now_ms >= int(opentime[bar]) + self.tf_ms:
+            # a gap in the klines, the market stands at the last close
+            tick = TICKS_PER_BAR - 1
+        previous = book.price
+        book.bar, book.tick = bar, tick
+        book.price = book.tick_price(bar, tick)
+        book.update_id += 1
+        self._match_resting(book, min(previous, book.price), max(previous, book.price))
+        self._publish_market(book, closed=tick == TICKS_PER_BAR - 1)
+
+    async def _run_clock(self) -> None:
+        wall_start = time.time()
+        sim_start = self.now_ms
+        while self.now_ms + self.tick_ms < self.end_ms:
+            target = sim_start + (time.time() - wall_start) * 1000 * self.speed
+            self._move_to(min(int(target), self.end_ms - self.tick_ms))
+            next_tick = (self.now_ms + self.tick_ms - sim_start) / 1000 / self.speed + wall_start
+            await asyncio.sleep(max(next_tick - time.time(), 0.001))
+        self.logger.info("Simulator replay finished")
+
+    def advance(self, ticks: int = 1) -> int:
+        self._move_to(min(self.now_ms + ticks * self.tick_ms, self.end_ms - self.tick_ms))
+        return self.now_ms
+
+    # matching
+
+    def _book(self, symbol: str) -> SimSymbol:
+        book = self.symbols.get(symbol)
+        if book is None:
+            raise SimError(-1121, "Invalid symbol.")
+        return book
+
+    def new_order(self, params: dict) -> dict:
+        book = self._book(params.get("symbol"))
+        side = params.get("side")
+        order_type = params.get("type")
+        if side not in ("BUY", "SELL"):
+            raise SimError(-1102, "Mandatory parameter 'side' was not sent, was empty/null, or malformed.")
+        if order_type not in ("LIMIT", "MARKET"):
+            raise SimError(-1116, "Invalid orderType.")
+        qty = float(params.get("quantity", 0))
+        if qty <= 0:
+            raise SimError(-4003, "Quantity less than or equal to zero.")
+        price = float(params.get("price", 0)) if order_type == "LIMIT" else 0.0
+        if order_type == "LIMIT" and price <= 0:
+            raise SimError(-4001, "Price less than 0.")
+        time_in_force = params.get("timeInForce", "GTC") if order_type == "LIMIT" else "GTC"
+        reduce_only = _bool_param(params.get("reduceOnly", "false"))
+        signed = qty if side == "BUY" else -qty
+        if reduce_only and (book.position == 0 or (book.position > 0) == (signed > 0)):
+            raise SimError(-2022, "ReduceOnly Order is rejected.")
+        client_order_id = params.get("newClientOrderId") or uuid.uuid4().hex[:22]
+
+        crossing = order_type == "MARKET" or (price >= book.ask if side == "BUY" else price <= book.bid)
+        if time_in_force == "GTX" and crossing:
+            raise SimError(
+                -5022, "Due to the order could not be executed as maker, the Post Only order will be rejected."
+            )
+        order = SimOrder(
+            next(self._order_ids), client_order_id, book.symbol, side, order_type, time_in_force, price, qty,
+            reduce_only, self.now_ms,
+        )
+        self.orders[order.order_id] = order
+        self.client_orders[client_order_id] = order
+        self.stats["orders"] += 1
+        self._user_order_update(order, "NEW")
+        if crossing:
+            self._fill(book, order, book.ask if side == "BUY" else book.bid, maker=False)
+        elif time_in_force in ("IOC", "FOK"):
+            self._close(order, "EXPIRED")
+        else:
+            self.open_orders[order.order_id] = order
+            if side == "BUY":
+                heapq.heappush(book.bids, (-price, order.order_id))
+            else:
+                heapq.heappush(book.asks, (price, order.order_id))
+        return order.to_dict()
+
+    def _close(self, order: SimOrder, status: str) -> None:
+        order.status = status
+        order.update_time = self.now_ms
+        self.open_orders.pop(order.order_id, None)
+        if status != "FILLED":
+            self._user_order_update(order, status)
+
+    def _match_resting(self, book: SimSymbol, low: float, high: float) -> None:
+        """fill the resting orders the market traded through between two ticks"""
+        while book.bids and -book.bids[0][0] > low:
+            price, order_id = heapq.heappop(book.bids)
+            order = self.orders[order_id]
+            if order.status == "NEW":
+                self._fill(book, order, -price, maker=True)
+        while book.asks and book.asks[0][0] < high:
+            price, order_id = heapq.heappop(book.asks)
+            order = self.orders[order_id]
+            if order.status == "NEW":
+                self._fill(book, order, price, maker=True)
+
+    def _fill(self, book: SimSymbol, order: SimOrder, price: float, maker: bool) -> None:
+        qty = order.orig_qty
+        if order.reduce_only:
+            qty = min(qty, abs(book.position))
+            if qty == 0:
+                self._close(order, "EXPIRED")
+                return
+        commission = price * qty * (self.maker_fee if maker else self.taker_fee)
+        realized = book.fill(qty if order.side == "BUY" else -qty, price)
+        self.balance += realized - commission
+        order.executed_qty = qty
+        order.cum_quote = qty * price
+        self._close(order, "FILLED")
+        # strictly increasing like exchange update times, several fills may share a simulated tick
+        book.update_time = max(self.now_ms, book.update_time + 1)
+        self.stats["fills"] += 1
+        self._user_order_update(order, "TRADE", price, qty, commission, realized, maker, book.update_time)
+        self._user_account_update(book)
+
+    def cancel_order(self, params: dict) -> dict:
+        order = self._find_order(params, unknown=SimError(-2011, "Unknown order sent."))
+        if order.status != "NEW":
+            raise SimError(-2011, "Unknown order sent.")
+        self._close(order, "CANCELED")
+        self.stats["cancels"] += 1
+        self._compact(self.symbols[order.symbol])
+        return order.to_dict()
+
+    def cancel_open_orders(self, params: dict) -> dict:
+        symbol = self._book(params.get("symbol")).symbol
+        for order in [order for order in self.open_orders.values() if order.symbol == symbol]:
+            self._close(order, "CANCELED")
+            self.stats["cancels"] += 1
+        self._compact(self.symbols[symbol])
+        return {"code": 200, "msg": "The operation of cancel all open order is done."}
+
+    def _compact(self, book: SimSymbol) -> None:
+        """rebuild the heaps of a symbol once they are mostly cancelled orders"""
+        if len(book.bids) + len(book.asks) < 2 * len(self.open_orders) + 1024:
+            return
+        book.bids = [(-order.price, order.order_id) for order in self.open_orders.values()
+                     if order.symbol == book.symbol and order.side == "BUY"]
+        book.asks = [(order.price, order.order_id) for order in self.open_orders.values()
+                     if order.symbol == book.symbol and order.side == "SELL"]
+        heapq.heapify(book.bids)
+        heapq.heapify(book.asks)
+
+    def _find_order(self, params: dict, unknown: SimError) -> SimOrder:
+        if "orderId" in params:
+            order = self.orders.get(int(params["orderId"]))
+        else:
+            order = self.client_orders.get(params.get("origClientOrderId"))
+        if order is None or order.symbol != params.get("symbol"):
+            raise unknown
+        return order
+
+    # streams
+
+    def _publish(self, stream: str, data: dict) -> None:
+        subscribers = self._subscribers.get(stream)
+        if not subscribers:
+            return
+        raw = json.dumps(data)
+        combined = None
+        for ws, is_combined in list(subscribers.items()):
+            if ws.closed:
+                del subscribers[ws]
+                continue
+            if is_combined:
+                combined = combined or json.dumps({"stream": stream, "data": data})
+                asyncio.ensure_future(ws.send_str(combined))
+            else:
+                asyncio.ensure_future(ws.send_str(raw))
+
+    def _publish_market(self, book: SimSymbol, closed: bool) -> None:
+        if not self._subscribers:
+            return
+        name = book.symbol.lower()
+        self._publish(
+            f"{name}@bookTicker",
+            {
+                "e": "bookTicker", "u": book.update_id, "s": book.symbol, "b": _fmt(book.bid),
+                "B": _fmt(book.depth_qty), "a": _fmt(book.ask), "A": _fmt(book.depth_qty),
+                "T": self.now_ms, "E": self.now_ms,
+            },
+        )
+        for stream in (f"{name}@depth", f"{name}@depth@100ms"):
+            if self._subscribers.get(stream):
+                bids, asks = book.depth()
+                self._publish(
+                    stream,
+                    {
+                        "e": "depthUpdate", "E": self.now_ms, "T": self.now_ms, "s": book.symbol,
+                        "U": book.update_id, "u": book.update_id, "pu": book.update_id - 1, "b": bids, "a": asks,
+                    },
+                )
+        stream = f"{name}_perpetual@continuousKline_{self.timeframe}"
+        if self._subscribers.get(stream):
+            row = book.kline_row(book.bar, partial=not closed)
+            self._publish(
+                stream,
+                {
+                    "e": "continuous_kline", "E": self.now_ms, "ps": book.symbol, "ct": "PERPETUAL",
+                    "k": {
+                        "t": row[0], "T": row[6], "i": self.timeframe, "f": 0, "L": 0, "o": row[1], "c": row[4],
+                        "h": row[2], "l": row[3], "v": row[5], "n": row[8], "x": closed, "q": row[7],
+                        "V": row[9], "Q": row[10], "B": "0",
+                    },
+                },
+            )
+
+    def _user_order_update(
+        self, order, execution, price=0.0, qty=0.0, commission=0.0, realized=0.0, maker=False, transact_time=None
+    ):
+        if not self.listen_keys:
+            return
+        update = order.to_dict()
+        transact_time = self.now_ms if transact_time is None else transact_time
+        event = {
+            "e": "ORDER_TRADE_UPDATE",
+            "E": self.now_ms,
+            "T": transact_time,
+            "o": {
+                "s": order.symbol, "c": order.client_order_id, "S": order.side, "o": order.type,
+                "f": order.time_in_force, "q": update["origQty"], "p": update["price"], "ap": update["avgPrice"],
+                "sp": "0", "x": execution, "X": order.status, "i": order.order_id, "l": _fmt(qty),
+                "z": update["executedQty"], "L": _fmt(price), "n": _fmt(commission), "N": "USDT",
+                "T": transact_time, "t": next(self._trade_ids) if qty else 0, "b": "0", "a": "0", "m": maker,
+                "R": order.reduce_only, "wt": "CONTRACT_PRICE", "ot": order.type, "ps": "BOTH", "cp": False,
+                "rp": _fmt(realized),
+            },
+        }
+        for listen_key in self.listen_keys:
+            self._publish(listen_key, event)
+
+    def _user_account_update(self, book: SimSymbol) -> None:
+        if not self.listen_keys:
+            return
+        unrealized = (book.price - book.entry_price) * book.position if book.position else 0.0
+        event = {
+            "e": "ACCOUNT_UPDATE",
+            "E": self.now_ms,
+            "T": book.update_time,
+            "a": {
+                "m": "ORDER",
+                "B": [{"a": "USDT", "wb": _fmt(self.balance), "cw": _fmt(self.balance), "bc": "0"}],
+                "P": [
+                    {
+                        "s": book.symbol, "pa": _fmt(book.position), "ep": _fmt(book.entry_price),
+                        "cr": _fmt(book.realized_pnl), "up": _fmt(unrealized), "mt": "cross", "iw": "0",
+                        "ps": "BOTH",
+                    }
+                ],
+            },
+        }
+        for listen_key in self.listen_keys:
+            self._publish(listen_key, event)
+
+    # http
+
+    def _build_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        routes = [
+            ("GET", "/fapi/v1/ping", lambda params: {}),
+            ("GET", "/fapi/v1/time", lambda params: {"serverTime": self.now_ms}),
+            ("POST", "/fapi/v1/order", self.new_order),
+            ("DELETE", "/fapi/v1/order", self.cancel_order),
+            ("GET", "/fapi/v1/order", self._query_order),
+            ("POST", "/fapi/v1/batchOrders", self._batch_orders),
+            ("DELETE", "/fapi/v1/allOpenOrders", self.cancel_open_orders),
+            ("GET", "/fapi/v1/openOrders", self._open_orders),
+            ("GET", "/fapi/v2/positionRisk", self._position_risk),
+            ("GET", "/fapi/v2/balance", self._balance),
+            ("GET", "/fapi/v1/ticker/bookTicker", self._book_ticker),
+            ("GET", "/fapi/v1/depth", self._depth),
+            ("GET", "/fapi/v1/continuousKlines", self._continuous_klines),
+            ("GET", "/fapi/v1/klines", self._klines),
+            ("POST", "/fapi/v1/listenKey", self._new_listen_key),
+            ("PUT", "/fapi/v1/listenKey", lambda params: {}),
+            ("DELETE", "/fapi/v1/listenKey", self._close_listen_key),
+            ("POST", "/sim/advance", self._advance),
+            ("GET", "/sim/stats", lambda params: self.summary()),
+        ]
+        for method, path, handler in routes:
+            app.router.add_route(method, path, self._endpoint(handler, path))
+        app.router.add_get("/ws/{streams:.*}", self._websocket)
+        app.router.add_get("/stream", self._websocket)
+        return app
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        self.stats["requests"] += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        return await handler(request)
+
+    def _endpoint(self, handler, path: str):
+        async def endpoint(request: web.Request) -> web.Response:
+            params = dict(request.query)
+            if request.can_read_body:
+                params.update(await request.post())
+            with metrics.timer("sim_request_seconds", endpoint=path):
+                try:
+                    return web.json_response(handler(params))
+                except SimError as error:
+                    self.stats["rejects"] += 1
+                    return web.json_response({"code": error.code, "msg": error.msg}, status=error.status)
+                except (KeyError, ValueError) as error:
+                    self.stats["rejects"] += 1
+                    return web.json_response({"code": -1102, "msg": f"Malformed parameter {error}."}, status=400)
+
+        return endpoint
+
+    def _query_order(self, params: dict) -> dict:
+        return self._find_order(params, unknown=SimError(-2013, "Order does not exist.")).to_dict()
+
+    def _batch_orders(self, params: dict) -> list:
+        orders = json.loads(params["batchOrders"])
+        if not 0 < len(orders) <= 5:
+            raise SimError(-1130, "Data sent for parameter 'batchOrders' is not valid.")
+        responses = []
+        for order in orders:
+            try:
+                responses.append(self.new_order(order))
+            except SimError as error:
+                self.stats["rejects"] += 1
+                responses.append({"code": error.code, "msg": error.msg})
+        return responses
+
+    def _open_orders(self, params: dict) -> list:
+        symbol = params.get("symbol")
+        return [
+            order.to_dict()
+            for order in self.open_orders.values()
+            if symbol is None or order.symbol == symbol
+        ]
+
+    def _position_risk(self, params: dict) -> list:
+        symbol = params.get("symbol")
+        return [
+            book.position_risk(self.leverage)
+            for book in self.symbols.values()
+            if symbol is None or book.symbol == symbol
+        ]
+
+    def _balance(self, params: dict) -> list:
+        unrealized = sum(
+            (book.price - book.entry_price) * book.position for book in self.symbols.values() if book.position
+        )
+        return [
+            {
+                "accountAlias": "sim", "asset": "USDT", "balance": _fmt(self.balance),
+                "crossWalletBalance": _fmt(self.balance), "crossUnPnl": _fmt(unrealized),
+                "availableBalance": _fmt(self.balance + unrealized), "maxWithdrawAmount": _fmt(self.balance),
+                "marginAvailable": True, "updateTime": self.now_ms,
+            }
+        ]
+
+    def _book_ticker(self, params: dict):
+        def ticker(book):
+            return {
+                "symbol": book.symbol, "bidPrice": _fmt(book.bid), "bidQty": _fmt(book.depth_qty),
+                "askPrice": _fmt(book.ask), "askQty": _fmt(book.depth_qty), "time": self.now_ms,
+                "lastUpdateId": book.update_id,
+            }
+
+        if "symbol" in params:
+            return ticker(self._book(params["symbol"]))
+        return [ticker(book) for book in self.symbols.values()]
+
+    def _depth(self, params: dict) -> dict:
+        book = self._book(params.get("symbol"))
+        bids, asks = book.depth(min(int(params.get("limit", 500)), book.depth_levels))
+        return {"lastUpdateId": book.update_id, "E": self.now_ms, "T": self.now_ms, "bids": bids, "asks": asks}
+
+    def _continuous_klines(self, params: dict) -> list:
+        if params.get("contractType", "PERPETUAL") != "PERPETUAL":
+            raise SimError(-1121, "Invalid contractType.")
+        return self._klines({**params, "symbol": params.get("pair")})
+
+    def _klines(self, params: dict) -> list:
+        book = self._book(params.get("symbol"))
+        if params.get("interval", self.timeframe) != self.timeframe:
+            raise SimError(-1120, f"Invalid interval, the simulator replays {self.timeframe}.")
+        limit = min(int(params.get("limit", 500)), 1500)
+        last = book.bar
+        if "endTime" in params:
+            last = min(last, int(np.searchsorted(book.klines["opentime"], int(params["endTime"]), side="right")) - 1)
+        first = max(last - limit + 1, 0)
+        if "startTime" in params:
+            first = max(first, int(np.searchsorted(book.klines["opentime"], int(params["startTime"]))))
+        in_progress = book.tick < TICKS_PER_BAR - 1
+        return [book.kline_row(bar, partial=in_progress and bar == book.bar) for bar in range(first, last + 1)]
+
+    def _new_listen_key(self, params: dict) -> dict:
+        listen_key = uuid.uuid4().hex
+        self.listen_keys.add(listen_key)
+        return {"listenKey": listen_key}
+
+    def _close_listen_key(self, params: dict) -> dict:
+        self.listen_keys.discard(params.get("listenKey"))
+        return {}
+
+    def _advance(self, params: dict) -> dict:
+        return {"time": self.advance(int(params.get("ticks", 1)))}
+
+    async def _websocket(self, request: web.Request) -> web.WebSocketResponse:
+        combined = "streams" in request.query
+        raw = request.query["streams"] if combined else request.match_info["streams"]
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        streams = [stream for stream in raw.split("/") if stream]
+        for stream in streams:
+            self._subscribers.setdefault(stream, {})[ws] = combined
+        try:
+            async for message in ws:
+                if message.type == WSMsgType.TEXT:
+                    self._ws_request(ws, combined, json.loads(message.data))
+                elif message.type == WSMsgType.ERROR:
+                    break
+        finally:
+            for subscribers in self._subscribers.values():
+                subscribers.pop(ws, None)
+        return ws
+
+    def _ws_request(self, ws, combined: bool, request: dict) -> None:
+        """SUBSCRIBE / UNSUBSCRIBE / LIST_SUBSCRIPTIONS messages of the market streams"""
+        method = request.get("method")
+        if method == "SUBSCRIBE":
+            for stream in request.get("params", []):
+                self._subscribers.setdefault(stream, {})[ws] = combined
+            result = None
+        elif method == "UNSUBSCRIBE":
+            for stream in request.get("params", []):
+                self._subscribers.get(stream, {}).pop(ws, None)
+            result = None
+        else:
+            result = [stream for stream, subscribers in self._subscribers.items() if ws in subscribers]
+        asyncio.ensure_future(ws.send_str(json.dumps({"result": result, "id": request.get("id")})))
+
+    def summary(self) -> dict:
+        elapsed = time.perf_counter() - self._started
+        return {
+            **self.stats,
+            "time": self.now_ms,
+            "seconds": elapsed,
+            "orders_per_sec": self.stats["orders"] / max(elapsed, 1e-9),
+            "open_orders": len(self.open_orders),
+            "balance": self.balance,
+            "positions": {symbol: book.position for symbol, book in self.symbols.items()},
+        }
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765) -> None:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        if self.speed > 0:
+            self._clock = asyncio.ensure_future(self._run_clock())
+        self.logger.info(f"Exchange simulator on http://{host}:{port}, {len(self.symbols)} symbols")
+
+    async def stop(self) -> None:
+        if self._clock is not None:
+            self._clock.cancel()
+            self._clock = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+if __name__ == "__main__":
+    # load test: concurrent post-only orders and cancels against a simulator in this process
+    import aiohttp
+
+    async def load_test(num_orders: int = 20_000, concurrency: int = 64, port: int = 8765) -> None:
+        simulator = ExchangeSimulator.from_synthetic(["BTCUSDT"], num_bars=5_000, speed=0)
+        await simulator.start(port=port)
+        base_url = f"http://127.0.0.1:{port}"
+        latencies = []
+        counter = itertools.count()
+
+        async def worker(session):
+            while next(counter) < num_orders:
+                bid = float((await (await session.get(f"{base_url}/fapi/v1/ticker/bookTicker",
+                                                      params={"symbol": "BTCUSDT"})).json())["bidPrice"])
+                start = time.perf_counter()
+                async with session.post(f"{base_url}/fapi/v1/order", params={
+                    "symbol": "BTCUSDT", "side": "BUY", "type": "LIMIT", "timeInForce": "GTX",
+                    "quantity": "0.001", "price": _fmt(bid - 10),
+                }) as response:
+                    order = await response.json()
+                latencies.append(time.perf_counter() - start)
+                await session.delete(f"{base_url}/fapi/v1/order",
+                                     params={"symbol": "BTCUSDT", "orderId": order["orderId"]})
+
+        start = time.perf_counter()
+        async with aiohttp.ClientSession() as session:
+            await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        await simulator.stop()
+        latencies = np.array(latencies) * 1e3
+        print(
+            f"{len(latencies)} orders in {elapsed:.1f}s, {len(latencies) / elapsed:.0f} orders/s "
+            f"(plus a ticker and a cancel each), order latency p50 {np.percentile(latencies, 50):.2f}ms "
+            f"p99 {np.percentile(latencies, 99):.2f}ms"
+        )
+        print(simulator.summary())
+
+    asyncio.run(load_test())
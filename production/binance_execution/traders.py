@@ -8,11 +8,20 @@ import warnings
 warnings.filterwarnings("ignore")
 # -*- coding: utf-8 -*-
 
+import asyncio
+import json
 import logging
-from binance.um_futures import UMFutures
+from typing import TYPE_CHECKING
+from contek_pyutils import metrics
+from production.binance_execution.reconcile import PositionBook
+from research.Market.universe import MarketUniverse
+import numpy as np
 import pandas as pd
 import yaml
 
+if TYPE_CHECKING:
+    from binance.um_futures import UMFutures
+
 
 class Traders:
     columns = [
@@ -30,17 +39,30 @@ class Traders:
         "ignore",
     ]
 
+    report_table = "execution_report"
+    report_tags = ["interval", "c_symbol", "order_id"]
+    report_fields = ["side", "type", "status", "orig_qty", "executed_qty", "avg_price", "price"]
+
+    stream_url = "wss://fstream.binance.com"
+    # binance expires a listen key an hour after the last keepalive
+    listen_key_keepalive = 30 * 60
+
     logger = logging.getLogger(__name__)
+    sink = None
+    journal = None
 
     def __init__(self, pairs) -> None:
         self.config = self._read_config()
         self.client = self.get_client()
-        self.symbols = self.convert_to_circle(pairs)
+        # e.g. ws://127.0.0.1:8765 of the local ExchangeSimulator
+        self.stream_url = self.config["bn_api"].get("stream_url") or self.stream_url
+        self.universe = MarketUniverse(pairs, quote="USDC")
+        self.symbols = self.universe.exchange_symbols()
+        self.positions = PositionBook(
+            self.symbols, aliases=[str(self.universe.canonical(symbol)) for symbol in self.symbols]
+        )
         self.try_count = 0
 
-    def convert_to_circle(self, symbols) -> list:
-        return [(symbol + "C") for symbol in symbols]
-
     def _read_config(self) -> dict:
         rel_path = "/production/config.yaml"
         try:
@@ -51,9 +73,16 @@ class Traders:
             sys.exit(1)
         return config
 
-    def get_client(self) -> UMFutures:
+    def get_client(self) -> "UMFutures":
+        # the binance connector pulls in requests, only import it when a client is built
+        from binance.um_futures import UMFutures
+
         key = self.config["bn_api"]["key"]
         secret = self.config["bn_api"]["secret"]
+        # e.g. the local ExchangeSimulator
+        base_url = self.config["bn_api"].get("base_url")
+        if base_url:
+            return UMFutures(key, secret, base_url=base_url)
         return UMFutures(key, secret)
 
     def _order_settings(self, market: str) -> tuple:
@@ -68,6 +97,7 @@ class Traders:
             digit = 3
         return slippage, digit
 
+    @metrics.timed("order_seconds", side="BUY", type="LIMIT")
     def maker_buy(self, amount: float, ticker: float, symbol: str) -> dict:
         """send post-only buy order"""
         slippage, digit = self._order_settings(symbol)
@@ -83,11 +113,14 @@ class Traders:
                 timeInForce="GTX",
                 price=price,
             )
+            self._sink_execution_report(response)
+            self._journal_order(response)
             return response
 
         except Exception as error:
             self.logger.error(error)
 
+    @metrics.timed("order_seconds", side="SELL", type="LIMIT")
     def maker_sell(self, amount: float, ticker: float, symbol: str) -> dict:
         """send post-only sell order"""
         slippage, digit = self._order_settings(symbol)
@@ -103,32 +136,83 @@ class Traders:
                 timeInForce="GTX",
                 price=price,
             )
+            self._sink_execution_report(response)
+            self._journal_order(response)
             return response
 
         except Exception as error:
             self.logger.error(error)
 
+    @metrics.timed("order_seconds", side="BUY", type="MARKET")
     def taker_buy(self, amount: float, symbol: str) -> dict:
         """send market buy order"""
         amount = round(amount, 3)
         try:
-            self.client.new_order(
+            response = self.client.new_order(
                 symbol=symbol, side="BUY", type="MARKET", quantity=amount
             )
+            self._sink_execution_report(response)
+            self._journal_order(response)
+            return response
 
         except Exception as error:
             self.logger.error(error)
 
+    @metrics.timed("order_seconds", side="SELL", type="MARKET")
     def taker_sell(self, amount: float, symbol: str) -> dict:
         """send market sell order"""
         amount = round(amount, 3)
         try:
-            self.client.new_order(
+            response = self.client.new_order(
                 symbol=symbol, side="SELL", type="MARKET", quantity=amount
             )
+            self._sink_execution_report(response)
+            self._journal_order(response)
+            return response
         except Exception as error:
             self.logger.error(error)
 
+    def _sink_execution_report(self, response: dict) -> None:
+        """hand the order response to the tsdb sink if the executor has one"""
+        if self.sink is None or not response:
+            return
+        columns = ["time", *self.report_tags, *self.report_fields]
+        record = [
+            int(response["updateTime"]),
+            "order",
+            str(self.universe.canonical(response["symbol"])),
+            str(response["orderId"]),
+            response["side"],
+            response["type"],
+            response["status"],
+            float(response["origQty"]),
+            float(response["executedQty"]),
+            float(response.get("avgPrice", 0)),
+            float(response.get("price", 0)),
+        ]
+        self.sink.put(self.report_table, self.report_tags, columns, record)
+
+    def _journal_order(self, response: dict) -> None:
+        """record the order response in the event journal, as a fill once anything is executed"""
+        if self.journal is None or not response:
+            return
+        executed_qty = float(response["executedQty"])
+        values = [
+            1.0 if response["side"] == "BUY" else -1.0,
+            float(response["origQty"]),
+            float(response.get("price", 0)),
+            executed_qty,
+            float(response.get("avgPrice", 0)),
+        ]
+        self.journal.order(
+            str(self.universe.canonical(response["symbol"])),
+            int(response["updateTime"]) * 1_000_000,
+            str(response["orderId"]),
+            values,
+            filled=executed_qty > 0,
+        )
+        self.journal.flush()
+
     def send_batch_order(self, orders_df: pd.DataFrame) -> list:
         """send buy and sell orders based on the maker price dataframe
         Args:
@@ -205,17 +289,52 @@ class Traders:
 
     def fetch_positions(self) -> tuple:
         try:
-            positions = pd.DataFrame(self.client.get_position_risk(recvWindow=6000))
-            unpnl = positions.query("symbol == @self.symbols").loc[
-                :, "unRealizedProfit"
-            ]
-            unpnl_float = float(unpnl)
-            notional = positions.query("symbol == @self.symbols").loc[:, "notional"]
-            abs_notional = abs(float(notional))
+            self.positions.apply_position_risk(self.client.get_position_risk(recvWindow=6000))
+            unpnl_float = self.positions.total(self.positions.unrealized)
+            abs_notional = self.positions.total(np.abs(self.positions.notional))
             return unpnl_float, abs_notional
         except Exception as error:
             self.logger.error(error)
 
+    async def user_stream(self) -> None:
+        """
+        apply the ACCOUNT_UPDATE and ORDER_TRADE_UPDATE events of the user data stream to the
+        position book as they arrive, reconnecting with a new listen key when the stream drops
+        """
+        import aiohttp
+
+        while True:
+            try:
+                listen_key = (await asyncio.to_thread(self.client.new_listen_key))["listenKey"]
+                keepalive = asyncio.create_task(self._keep_listen_key_alive(listen_key))
+                try:
+                    async with aiohttp.ClientSession() as session:
+                        async with session.ws_connect(f"{self.stream_url}/ws/{listen_key}", heartbeat=60) as ws:
+                            self.logger.info("User data stream connected")
+                            async for message in ws:
+                                if message.type != aiohttp.WSMsgType.TEXT:
+                                    break
+                                event = json.loads(message.data)
+                                if event.get("e") == "listenKeyExpired":
+                                    break
+                                self.positions.apply_user_event(event)
+                finally:
+                    keepalive.cancel()
+                self.logger.warning("User data stream closed, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                self.logger.error(error)
+            await asyncio.sleep(5)
+
+    async def _keep_listen_key_alive(self, listen_key: str) -> None:
+        while True:
+            await asyncio.sleep(self.listen_key_keepalive)
+            try:
+                await asyncio.to_thread(self.client.renew_listen_key, listen_key)
+            except Exception as error:
+                self.logger.error(error)
+
     def close_position(self) -> None:
         try:
             positions = pd.DataFrame(
@@ -12,13 +12,13 @@ from datetime import datetime
 import time
 import logging
 import pandas as pd
-import requests
 import contek_timbersaw as timbersaw
+from contek_pyutils.notifier import DiscordNotifier
+from contek_pyutils import metrics
+from research.Market.resampler import KlineResampler
+from research.Market.universe import MarketUniverse
 import yaml
-import requests
-import json
 import asyncio
-import aiohttp
 
 
 class KlineGenerator:
@@ -39,10 +39,37 @@ class KlineGenerator:
         "taker_buy_volume_U",
         "ignore",
     ]
+    sink_table = "kline"
+    sink_tags = ["interval", "c_symbol"]
+    sink_fields = [
+        "open",
+        "high",
+        "low",
+        "close",
+        "volume",
+        "volume_U",
+        "num_trade",
+        "taker_buy",
+        "taker_buy_volume_U",
+    ]
 
-    def __init__(self, pairs, timeframe) -> None:
+    def __init__(
+        self, pairs, timeframe, sink=None, resample_timeframes=None, notifier=None, journal=None, base_url=None
+    ) -> None:
         self.limit = 300
-        self.symbols = [pair + "T" for pair in pairs]
+        if base_url:
+            # e.g. the local ExchangeSimulator instead of binance
+            self.base_url = base_url
+        self.sink = sink
+        self.notifier = notifier
+        self.journal = journal
+        # higher timeframes derived from this one instead of fetched separately
+        self.resampler = (
+            KlineResampler(resample_timeframes, timeframe) if resample_timeframes else None
+        )
+        self.universe = MarketUniverse(pairs)
+        self.universe.base_url = self.base_url
+        self.symbols = self.universe.exchange_symbols()
         self.timeframe = timeframe
         self.timeframe_int = {"1m": 1, "5m": 5, "15m": 15, "1h": 60}.get(
             self.timeframe, 1
@@ -50,61 +77,20 @@ class KlineGenerator:
         self._export_kline_csv()
 
     def get_24h_ticker(self) -> pd.DataFrame:
-        url = f"{self.base_url}/fapi/v1/ticker/24hr"
-        res = requests.get(url)
-        ticker = pd.DataFrame(res.json())
-        ticker.columns = [
-            "symbol",
-            "price_change",
-            "price_change_percent",
-            "weighted_avg_price",
-            "last_price",
-            "last_qty",
-            "open_price",
-            "high_price",
-            "low_price",
-            "volume",
-            "quote_volume",
-            "open_time",
-            "close_time",
-            "first_id",
-            "last_id",
-            "count",
-        ]
-        ticker = ticker.astype(
-            {
-                "price_change": float,
-                "price_change_percent": float,
-                "weighted_avg_price": float,
-                "last_price": float,
-                "last_qty": float,
-                "open_price": float,
-                "high_price": float,
-                "low_price": float,
-                "volume": float,
-                "quote_volume": float,
-                "open_time": lambda x: datetime.utcfromtimestamp(int(x) / 1000.0),
-                "close_time": lambda x: datetime.utcfromtimestamp(int(x) / 1000.0),
-                "first_id": int,
-                "last_id": int,
-                "count": int,
-            }
-        )
-
-        return ticker
+        return self.universe.get_24h_ticker()
 
     def get_qulified_symbols(self) -> list:
         ticker = self.get_24h_ticker()
-        v5_ticker = ticker.sort_values("quote_volume", ascending=False).head(5)
-        p5_ticker = ticker.sort_values("price_change_percent", ascending=False).head(5)
-        qulified_ticker = pd.merge(v5_ticker, p5_ticker, on="symbol")
-        if len(qulified_ticker) == 0:
+        qulified_symbols = self.universe.qualified_symbols(ticker)
+        if len(qulified_symbols) == 0:
             self.logger.warning("No qulified ticker found.")
             return None
-        self.logger.info(f"Qulified ticker found: {qulified_ticker['symbol'].tolist()}")
-        return qulified_ticker["symbol"].tolist()
+        self.logger.info(f"Qulified ticker found: {qulified_symbols}")
+        return qulified_symbols
 
     def _export_kline_csv(self) -> None:
+        import requests
+
         url = f"{self.base_url}/fapi/v1/continuousKlines"
         export_dir = main_path + "/production/data/"
         if not os.path.exists(export_dir):
@@ -124,14 +110,13 @@ class KlineGenerator:
                 kdf = self._format_candle(ohlcv)
                 update_time = kdf.closetime[-1]
                 kdf.to_csv(export_path)
+                self._sink_klines(symbol, kdf)
+                self._journal_klines(symbol, kdf)
+                self._export_resampled(symbol, kdf, append=False)
                 self.logger.info(
                     f"{symbol}:{self.limit} candles time to {update_time} exported.\n------------------"
                 )
-                self.push_discord(
-                    {
-                        "content": f"{symbol}:{self.limit} candles time to {update_time} exported.\n------------------"
-                    }
-                )
+                self.notify(f"{symbol}:{self.limit} candles time to {update_time} exported.\n------------------")
             except Exception as e:
                 self.logger.error(e)
                 sys.exit(1)
@@ -164,7 +149,10 @@ class KlineGenerator:
 
         return kdf
 
+    @metrics.timed("kline_update_seconds")
     async def update_klines(self) -> None:
+        import aiohttp
+
         url = f"{self.base_url}/fapi/v1/continuousKlines"
         for symbol in self.symbols:
             self.export_path = (
@@ -196,37 +184,74 @@ class KlineGenerator:
 
                         if len(latest_kdf) >= 2:
                             latest_kdf.to_csv(self.export_path, mode="a", header=False)
+                            self._sink_klines(symbol, latest_kdf)
+                            self._journal_klines(symbol, latest_kdf)
+                            # closetime is floored to the second, the candle closes a second later
+                            metrics.latency_since(
+                                "candle_to_kline_seconds", latest_kdf.closetime[-1].timestamp() + 1, symbol=symbol
+                            )
+                            self._export_resampled(symbol, latest_kdf)
                             self.logger.info(
                                 f"{symbol}:{len(latest_kdf)} canlde to {latest_kdf.closetime[-1]} added."
                             )
-                            await self.push_discord(
-                                {
-                                    "content": f"{symbol}:{len(latest_kdf)} canlde to {latest_kdf.closetime[-1]} added.\n------------------"
-                                }
+                            self.notify(
+                                f"{symbol}:{len(latest_kdf)} canlde to {latest_kdf.closetime[-1]} added.\n------------------"
                             )
                 except Exception as e:
                     self.logger.error(e)
                     return False
 
-    async def push_discord(self, payload: dict, rel_path="/production/config.yaml"):
-        try:
-            with open(main_path + rel_path, "r") as stream:
-                config_dict = yaml.safe_load(stream)
-                url = config_dict["discord_webhook"]["url"]
-                headers = {"Content-Type": "application/json"}
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(
-                        url, data=json.dumps(payload), headers=headers
-                    ) as response:
-                        pass
-        except Exception as e:
-            self.logger.exception(e)
+    def _export_resampled(self, symbol: str, kdf: pd.DataFrame, append=True) -> None:
+        """derive the higher timeframe candles closed by the new candles and export them"""
+        if self.resampler is None:
+            return
+        if not append:
+            # the csv is rewritten from a full refresh, start the buckets over
+            self.resampler.reset(symbol)
+        for timeframe, rdf in self.resampler.update(symbol, kdf).items():
+            export_path = main_path + f"/production/data/{symbol}_{timeframe}.csv"
+            if append and os.path.exists(export_path):
+                rdf.to_csv(export_path, mode="a", header=False)
+            else:
+                rdf.to_csv(export_path)
+            self._sink_klines(symbol, rdf, timeframe)
+            self.logger.info(f"{symbol}:{len(rdf)} {timeframe} canlde to {rdf.closetime[-1]} resampled.")
+
+    def _sink_klines(self, symbol: str, kdf: pd.DataFrame, timeframe=None) -> None:
+        """hand finished candles to the tsdb sink, the write happens off the trading path"""
+        if self.sink is None:
+            return
+        c_symbol = str(self.universe.canonical(symbol))
+        columns = ["time", *self.sink_tags, *self.sink_fields]
+        opentimes = (kdf.index.asi8 // 1_000_000).tolist()
+        for opentime, values in zip(opentimes, kdf[self.sink_fields].to_numpy().tolist()):
+            record = [opentime, timeframe or self.timeframe, c_symbol, *values]
+            self.sink.put(self.sink_table, self.sink_tags, columns, record)
+
+    def _journal_klines(self, symbol: str, kdf: pd.DataFrame) -> None:
+        """record the candles the models will read, so their decisions can be replayed"""
+        if self.journal is None:
+            return
+        self.journal.candles(str(self.universe.canonical(symbol)), self.timeframe, kdf)
+        self.journal.flush()
+
+    def notify(self, content: str) -> None:
+        """hand an alert to the notifier, it is posted by the notifier's background task"""
+        if self.notifier is None:
+            return
+        self.notifier.notify(content)
 
 
 if __name__ == "__main__":
     timbersaw.setup()
-    test = KlineGenerator(["BTCUSD", "ETHUSD", "SOLUSD"], "1m")
+    with open(main_path + "/production/config.yaml", "r") as stream:
+        notifier = DiscordNotifier.from_config(yaml.safe_load(stream))
     loop = asyncio.get_event_loop()
+    if notifier is not None:
+        loop.run_until_complete(notifier.start())
+    test = KlineGenerator(
+        ["BTCUSD", "ETHUSD", "SOLUSD"], "1m", resample_timeframes=["5m", "15m", "1h"], notifier=notifier
+    )
     while True:
         if loop.run_until_complete(test.update_klines()):
             time.sleep(20)
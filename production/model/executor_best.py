@@ -11,11 +11,14 @@ sys.path.append(main_path)
 import logging
 import psutil
 from production.binance_execution.traders import Traders
+from contek_pyutils.tsdb_sink import AsyncTsdbSink
+from contek_pyutils.notifier import DiscordNotifier
+from contek_pyutils import metrics
+from contek_timbersaw.event_journal import EventJournal
 import contek_timbersaw as timbersaw
 import pandas as pd
 import json
 import asyncio
-import aiohttp
 
 
 class ExecBest(Traders):
@@ -33,6 +36,9 @@ class ExecBest(Traders):
 
     def __init__(self) -> None:
         super().__init__(self.traded_pairs)
+        self.sink = AsyncTsdbSink.from_config(self.config)
+        self.notifier = DiscordNotifier.from_config(self.config)
+        self.journal = EventJournal.from_config(self.config, self.executor)
         self.position = {}
         self.process = psutil.Process()
         self.interval = 20
@@ -48,61 +54,59 @@ class ExecBest(Traders):
             self.logger.error("Signal position file not found")
             return None
 
-    async def push_discord(self, payload: dict) -> None:
-        try:
-            headers = {"Content-Type": "application/json"}
-            discord_url = self.config["discord_webhook"]["url"]
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    discord_url, data=json.dumps(payload), headers=headers
-                ) as response:
-                    pass
-        except Exception as e:
-            self.logger.warning(e)
-        finally:
-            response.close()
+    def notify(self, content: str) -> None:
+        if self.notifier is not None:
+            self.notifier.notify(content)
 
-    def get_actual_positions(self) -> pd.DataFrame:
+    def get_actual_positions(self) -> bool:
+        """apply the position risk of the account to the position book"""
         try:
             response = self.client.get_position_risk(recvWindow=5000)
-            positions = pd.DataFrame(response).query("symbol == @self.symbols")
-            return positions
         except Exception as e:
             self.logger.error(e)
+            return False
+        self.positions.apply_position_risk(response)
+        return True
 
     async def check_position_diff(self, c_symbol_position: dict) -> None:
         """compare actual position and signal position & fill the gap if there is one"""
-        positions = self.get_actual_positions()
-        if positions is not None:
-            for _, row in positions.iterrows():
-                symbol = row["symbol"]
-                actual_position = float(row["positionAmt"])
-                c_symbol = symbol.replace("USDC", "USD")
-                merged_position = c_symbol_position[c_symbol]["merged_position"]
-                self.logger.info(
-                    f"{symbol} target position is {merged_position} | actual position is {actual_position}"
-                )
-                updated_time = c_symbol_position[c_symbol]["updated_time"]
-                await self.push_discord(
-                    {
-                        "content": f"Retrieve {symbol} position: {merged_position} updated_time:{updated_time} | actual position: {actual_position}"
-                    }
-                )
-                if abs(actual_position - merged_position) < 0.0001:
-                    self.logger.info(
-                        f"Position & signals are cross checked.\n-- -- -- -- -- -- -- -- --"
-                    )
-
-                else:
-                    self.logger.warning(f"Gap to match!\n-- -- -- -- -- -- -- -- -- ")
-                    position_diff = merged_position - actual_position
-                    # book_ticker = self.client.book_ticker(symbol)
-                    # bid_price = float(book_ticker["bidPrice"])
-                    # ask_price = float(book_ticker["askPrice"])
-                    if position_diff > 0:
-                        self.taker_buy(position_diff, symbol)
-                    else:
-                        self.taker_sell(-position_diff, symbol)
+        if c_symbol_position is None or not self.get_actual_positions():
+            return
+        self.positions.set_targets(
+            {c_symbol: position["merged_position"] for c_symbol, position in c_symbol_position.items()},
+            {c_symbol: position["updated_time"] for c_symbol, position in c_symbol_position.items()},
+        )
+        for symbol in self.positions.changed():
+            i = self.positions.index[symbol]
+            merged_position = self.positions.target[i]
+            actual_position = self.positions.actual[i]
+            updated_time = self.positions.target_time[i]
+            self.logger.info(
+                f"{symbol} target position is {merged_position} | actual position is {actual_position}"
+            )
+            self.notify(
+                f"Retrieve {symbol} position: {merged_position} updated_time:{updated_time} | actual position: {actual_position}"
+            )
+        orders = self.positions.orders()
+        if not orders:
+            self.logger.info(f"Position & signals are cross checked.\n-- -- -- -- -- -- -- -- --")
+            return
+
+        for symbol, position_diff in orders:
+            self.logger.warning(f"{symbol} gap to match: {position_diff}\n-- -- -- -- -- -- -- -- -- ")
+            c_symbol = str(self.universe.canonical(symbol))
+            # updated_time is the closetime floored to the second, the candle closes a second later
+            updated_time = self.positions.target_time[self.positions.index[symbol]]
+            candle_close = pd.Timestamp(updated_time).timestamp() + 1
+            if position_diff > 0:
+                response = self.taker_buy(position_diff, symbol)
+            else:
+                response = self.taker_sell(-position_diff, symbol)
+            if response is None:
+                self.positions.cancel_pending(symbol)
+            metrics.latency_since(
+                "candle_to_order_seconds", candle_close, model=self.model_name, pair=c_symbol
+            )
 
     async def task(self) -> None:
         """main task of the executor"""
@@ -111,14 +115,33 @@ class ExecBest(Traders):
         await self.check_position_diff(symbol_position)
 
     async def run(self) -> None:
-        while True:
-            try:
-                await self.task()
-                await asyncio.sleep(self.interval)
-
-            except Exception as e:
-                self.logger.critical(e)
-                await asyncio.sleep(self.interval)
+        if self.sink is not None:
+            await self.sink.start()
+        if self.notifier is not None:
+            await self.notifier.start()
+        writer = await metrics.start_from_config(self.config, self.executor)
+        # fills and position updates reach the book between the position risk polls of task
+        user_stream = asyncio.create_task(self.user_stream())
+        try:
+            while True:
+                try:
+                    await self.task()
+                    await asyncio.sleep(self.interval)
+
+                except Exception as e:
+                    self.logger.critical(e)
+                    await asyncio.sleep(self.interval)
+        finally:
+            user_stream.cancel()
+            # flush the buffered rows, alerts and events on shutdown or error
+            if self.sink is not None:
+                await self.sink.close()
+            if self.notifier is not None:
+                await self.notifier.close()
+            if self.journal is not None:
+                self.journal.close()
+            if writer is not None:
+                writer.stop()
 
 
 if __name__ == "__main__":
@@ -10,11 +10,10 @@ import logging
 import psutil
 from production.binance_execution.traders import Traders
 import contek_timbersaw as timbersaw
+from contek_pyutils.notifier import DiscordNotifier
 import pandas as pd
 import yaml
-import json
 import asyncio
-import aiohttp
 
 
 class ExecPostmodern(Traders):
@@ -39,6 +38,7 @@ class ExecPostmodern(Traders):
 
     def __init__(self, market) -> None:
         super().__init__(market)
+        self.notifier = DiscordNotifier.from_config(self.config)
         self.position = {}
         self.process = psutil.Process()
         self.interval = 20
@@ -60,17 +60,9 @@ class ExecPostmodern(Traders):
         except FileNotFoundError:
             self.logger.error('Position is not read from the file.')
      
-    async def push_discord(self, payload: dict) -> None:
-        try:
-            headers = {'Content-Type': 'application/json'}
-            discord_url = self.config["discord_webhook"]["url"]
-            async with aiohttp.ClientSession() as session:
-                async with session.post(discord_url, data=json.dumps(payload), headers=headers) as response:
-                    pass
-        except Exception as e:
-            self.logger.warning(e)
-        finally:
-            response.close()
+    def notify(self, content: str) -> None:
+        if self.notifier is not None:
+            self.notifier.notify(content)
 
     async def check_position_diff(self, signal_position: float) -> bool:
         """compare actual position and signal position & fill the gap if there is one"""
@@ -79,7 +71,7 @@ class ExecPostmodern(Traders):
             positionAmt = positions.query("symbol == @self.market").loc[:, "positionAmt"]
             actual_position = float(positionAmt)
             self.logger.info(f"actual position is {actual_position}")
-            await self.push_discord({"content": f"Retrieve signal position: {signal_position} update_time:{self.update_time}"})
+            self.notify(f"Retrieve signal position: {signal_position} update_time:{self.update_time}")
             if abs(actual_position - signal_position) < 0.00001:
                 self.logger.info(f"Position & signals are cross checked.\n-- -- -- -- -- -- -- -- --")
                 return True
@@ -112,16 +104,23 @@ class ExecPostmodern(Traders):
         return compelete
         
     async def run(self) -> None:
-        while True:
-            try:
-                complete = await self.task()
-                if complete:
+        if self.notifier is not None:
+            await self.notifier.start()
+        try:
+            while True:
+                try:
+                    complete = await self.task()
+                    if complete:
+                        await asyncio.sleep(self.interval)
+                    else:
+                        await asyncio.sleep(self.interval / 2)
+                except Exception as e:
+                    self.logger.critical(e)
                     await asyncio.sleep(self.interval)
-                else:
-                    await asyncio.sleep(self.interval / 2)
-            except Exception as e:
-                self.logger.critical(e)
-                await asyncio.sleep(self.interval)    
+        finally:
+            # send the alerts still buffered
+            if self.notifier is not None:
+                await self.notifier.close()
 
 if __name__ == "__main__":
     timbersaw.setup()
@@ -12,11 +12,16 @@ import yaml
 import logging
 import pandas as pd
 import json
-import aiohttp
 import asyncio
 import contek_timbersaw as timbersaw
-from research.Alpha.alp_adx_stochrsi_demastd import AlpAdxStochRsiMultiple
+import research.Alpha.alp_adx_stochrsi_demastd  # registers alp_adx_stochrsi_multiple
+from research.Alpha.registry import AlphaGraph, create_alpha
 from production.kline import KlineGenerator
+from research.Market.universe import MarketUniverse
+from contek_pyutils.tsdb_sink import AsyncTsdbSink
+from contek_pyutils.notifier import DiscordNotifier
+from contek_pyutils import metrics
+from contek_timbersaw.event_journal import EventJournal
 
 
 class ModeLBest:
@@ -27,11 +32,19 @@ class ModeLBest:
     model_name = "model_best"
     alpha_names = ["alp_adx_stochrsi_multiple"]
     traded_pairs = ["BTCUSD"]
+    sink_table = "alpha_position"
+    sink_tags = ["interval", "c_symbol", "alpha"]
+    merged_sink_table = "model_position"
+    merged_sink_tags = ["interval", "c_symbol", "model"]
     logger = logging.getLogger(model_name)
 
     def __init__(self) -> None:
         config = self._read_config()
-        self.discord_url = config["discord_webhook"]["url"]
+        self.config = config
+        self.notifier = DiscordNotifier.from_config(config)
+        self.universe = MarketUniverse(self.traded_pairs)
+        self.sink = AsyncTsdbSink.from_config(config)
+        self.journal = EventJournal.from_config(config, self.model_name)
         self._init_alpha()
         self.interval = 20
 
@@ -45,34 +58,26 @@ class ModeLBest:
             sys.exit(1)
 
     def _init_alpha(self) -> None:
-        self.alphas = []
-        for name in self.alpha_names:
-            if name == "alp_adx_stochrsi_multiple":
-                self.alphas.append(
-                    AlpAdxStochRsiMultiple(money=1800, leverage=5, mode=1)
-                )
-
+        try:
+            self.alphas = [
+                create_alpha(name, money=1800, leverage=5, mode=1) for name in self.alpha_names
+            ]
+        except KeyError as error:
+            self.logger.error(error)
+            sys.exit(1)
         if len(self.alphas) == 0:
             self.logger.error("Alpha not found")
             sys.exit(1)
+        self.graph = AlphaGraph(self.alphas)
 
-    async def push_discord(self, payload: dict) -> None:
-        try:
-            headers = {"Content-Type": "application/json"}
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    self.discord_url, data=json.dumps(payload), headers=headers
-                ) as response:
-                    pass
-        except Exception as e:
-            self.logger.warning(e)
-        finally:
-            response.close()
+    def notify(self, content: str) -> None:
+        if self.notifier is not None:
+            self.notifier.notify(content)
 
     def read_market(self, timeframe: str) -> dict:
         market = {}
         for pair in self.traded_pairs:
-            symbol = pair.replace("USD", "USDT")
+            symbol = self.universe.exchange_symbol(pair)
             try:
                 with open(
                     main_path + f"/production/data/{symbol}_{timeframe}.csv", "r"
@@ -98,27 +103,54 @@ class ModeLBest:
         for pair in market.keys():
             kdf = market[pair]
             updated_time = kdf.closetime[-1].strftime("%Y-%m-%d %H:%M:%S")
-            alpha_positions = {}
-            for alpha in self.alphas:
-                alpha_name = alpha.alpha_name
-                alpha_position = alpha.generate_portfolio(pair, kdf)
-                alpha_positions[alpha_name] = alpha_position
-            merged_position = sum(
-                alpha_positions[alpha_name] for alpha_name in alpha_positions.keys()
-            )
-            alpha_positions["merged_position"] = round(merged_position, 3)
+            snapshot = {}
+            alpha_positions = self.graph.run(pair, kdf, snapshot)
+            merged_position = alpha_positions["merged_position"]
+            self._sink_positions(pair, kdf, alpha_positions)
+            self._journal_decision(pair, kdf, alpha_positions, snapshot)
             alpha_positions["updated_time"] = updated_time
             pair_position[pair] = alpha_positions
             self.logger.info(
                 f"{self.model_name} {pair} Position:{merged_position}\n-- -- -- -- -- -- -- -- --"
             )
-            await self.push_discord(
-                {
-                    "content": f"{self.model_name} {pair} Position:{merged_position}, update_time: {updated_time}\n-- -- -- -- -- -- -- -- --"
-                }
+            self.notify(
+                f"{self.model_name} {pair} Position:{merged_position}, update_time: {updated_time}\n-- -- -- -- -- -- -- -- --"
             )
         await self._export_symbol_position(pair_position)
+        for pair, alpha_positions in pair_position.items():
+            # updated_time is the closetime floored to the second, the candle closes a second later
+            metrics.latency_since(
+                "candle_to_signal_seconds",
+                pd.Timestamp(alpha_positions["updated_time"]).timestamp() + 1,
+                model=self.model_name,
+                pair=pair,
+            )
 
+    def _sink_positions(self, pair: str, kdf: pd.DataFrame, alpha_positions: dict) -> None:
+        if self.sink is None:
+            return
+        columns = ["time", *self.sink_tags, "position"]
+        opentime = int(kdf.index[-1].timestamp() * 1000)
+        for alpha_name, position in alpha_positions.items():
+            if alpha_name == "merged_position":
+                continue
+            record = [opentime, self.timeframe, pair, alpha_name, float(position)]
+            self.sink.put(self.sink_table, self.sink_tags, columns, record)
+        # the merged position is the model's, not an alpha's
+        merged_columns = ["time", *self.merged_sink_tags, "position"]
+        record = [opentime, self.timeframe, pair, self.model_name, float(alpha_positions["merged_position"])]
+        self.sink.put(self.merged_sink_table, self.merged_sink_tags, merged_columns, record)
+
+    def _journal_decision(self, pair: str, kdf: pd.DataFrame, alpha_positions: dict, snapshot: dict) -> None:
+        """record the indicators and positions of the candle, replayed by production.replay"""
+        if self.journal is None:
+            return
+        self.journal.indicators(pair, kdf.index[-1], snapshot)
+        for name, position in alpha_positions.items():
+            self.journal.position(pair, name, kdf.index[-1], float(position), len(kdf))
+        self.journal.flush()
+
+    @metrics.timed("signal_export_seconds", model=model_name)
     async def _export_symbol_position(self, symbol_position: dict) -> None:
         """export signal position to a yaml file"""
         export_dir = os.path.join(main_path, "production", "signal_position")
@@ -137,12 +169,36 @@ class ModeLBest:
         self.logger.info(f"Signal position exported successfully")
 
     async def run(self, timeframe: str) -> None:
-        market = KlineGenerator(self.traded_pairs, timeframe)
-        while True:
-            await market.update_klines()
-            data_dict = self.read_market(timeframe)
-            await self.merging_alpha(data_dict)
-            await asyncio.sleep(self.interval)
+        self.timeframe = timeframe
+        if self.sink is not None:
+            await self.sink.start()
+        if self.notifier is not None:
+            await self.notifier.start()
+        writer = await metrics.start_from_config(self.config, self.model_name)
+        market = KlineGenerator(
+            self.traded_pairs,
+            timeframe,
+            sink=self.sink,
+            notifier=self.notifier,
+            journal=self.journal,
+            base_url=(self.config.get("bn_api") or {}).get("base_url"),
+        )
+        try:
+            while True:
+                await market.update_klines()
+                data_dict = self.read_market(timeframe)
+                await self.merging_alpha(data_dict)
+                await asyncio.sleep(self.interval)
+        finally:
+            # flush the buffered rows, alerts and events on shutdown or error
+            if self.sink is not None:
+                await self.sink.close()
+            if self.notifier is not None:
+                await self.notifier.close()
+            if self.journal is not None:
+                self.journal.close()
+            if writer is not None:
+                writer.stop()
 
 
 if __name__ == "__main__":
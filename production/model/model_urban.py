@@ -9,10 +9,9 @@ warnings.filterwarnings("ignore")
 import yaml
 import logging
 import pandas as pd
-import json
-import aiohttp
 import asyncio
 import contek_timbersaw as timbersaw
+from contek_pyutils.notifier import DiscordNotifier
 from production.alpha.alp_adx_stochrsi_openatr import AlpAdxStochrsiOpenatr
 from production.alpha.alp_super_openatr  import AlpSuperOpenatr
 from production.alpha.alp_linbo_dempact import AlpLinboDempact
@@ -36,7 +35,7 @@ class ModelUrban:
 
     def __init__(self) -> None:
         config = self._read_config()
-        self.discord_url = config['discord_webhook']["url"]
+        self.notifier = DiscordNotifier.from_config(config)
         self._init_alpha(self.alpha_name, config)
         self.interval = 20
     
@@ -65,16 +64,9 @@ class ModelUrban:
             self.logger.error("Alpha not found")
             sys.exit(1)
 
-    async def push_discord(self, payload: dict) -> None:
-        try:
-            headers = {'Content-Type': 'application/json'}
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.discord_url, data=json.dumps(payload), headers=headers) as response:
-                    pass
-        except Exception as e:
-            self.logger.warning(e)
-        finally:
-            response.close()
+    def notify(self, content: str) -> None:
+        if self.notifier is not None:
+            self.notifier.notify(content)
 
     def read_market(self, symbols:list, timeframe:str) -> dict:
         market = {}
@@ -104,7 +96,9 @@ class ModelUrban:
                 await self._export_signal_position(symbol, kdf, merged_position)
             except Exception as error:
                 self.logger.error(error)
-                await self.push_discord({"content": f"Terminated with Error: {error}"})
+                self.notify(f"Terminated with Error: {error}")
+                if self.notifier is not None:
+                    await self.notifier.close()
                 raise
 
 
@@ -119,10 +113,12 @@ class ModelUrban:
                     {"update_time": str(kdf.index[-1]),
                     "model_position": str(round(merged_position, 3)), },
             }
-            await self.push_discord({"content": f"{symbol} signal position: {merged_position}, update_time: {kdf.closetime[-1]}\n-- -- -- -- -- -- -- -- --"})
+            self.notify(f"{symbol} signal position: {merged_position}, update_time: {kdf.closetime[-1]}\n-- -- -- -- -- -- -- -- --")
             yaml.dump(model_signal, file)
 
     async def run(self, timeframe: str) -> None:
+        if self.notifier is not None:
+            await self.notifier.start()
         market = KlineGenerator(timeframe)
         while True:
             await market.update_klines()
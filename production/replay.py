@@ -0,0 +1,101 @@
+import sys
+import os
+
+main_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+sys.path.append(main_path)
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# -*- coding: utf-8 -*-
+import argparse
+import logging
+import time
+import numpy as np
+import pandas as pd
+import contek_timbersaw as timbersaw
+from contek_timbersaw.event_journal import EventKind, JournalReader
+from research.Alpha.registry import AlphaGraph, create_alpha
+from production.kline import KlineGenerator
+
+
+class DecisionReplay:
+    """
+    Replays the event journal of a model through an AlphaGraph to reproduce its live decisions.
+    Every journaled position is recomputed on the same window of journaled candles the model read,
+    so with the same alpha params the replayed positions match the recorded ones exactly.
+    Args:
+        journal_dirs: list: journal directories, e.g. of the model and of its executor
+        graph: AlphaGraph: alphas of the model, with the params it ran with
+        timeframe: str: timeframe of the model candles
+
+    Usage:
+        replay = DecisionReplay(["logs/journal/model_best"], graph, "1m")
+        decisions = replay.run()
+        mismatches = decisions.query("~match")
+    """
+
+    logger = logging.getLogger("decision_replay")
+
+    def __init__(self, journal_dirs: list, graph: AlphaGraph, timeframe: str) -> None:
+        self.reader = JournalReader(journal_dirs)
+        self.graph = graph
+        self.timeframe = timeframe
+
+    def decisions(self, pair: str) -> pd.DataFrame:
+        """recorded positions of a pair, one row per (candle, window) the model decided on"""
+        positions = self.reader.frame(EventKind.POSITION, ("position", "window_len")).query("pair == @pair")
+        decisions = positions.pivot_table(
+            index=["time", "window_len"], columns="name", values="position", aggfunc="last", sort=False
+        )
+        return decisions.reset_index()
+
+    def candles(self, pair: str) -> pd.DataFrame:
+        """journaled candles in the column layout of the csv the model reads"""
+        kdf = self.reader.candles(pair, self.timeframe)
+        return kdf.reindex(columns=KlineGenerator.kline_columns[1:], fill_value=0.0)
+
+    def run(self, pairs: list = None) -> pd.DataFrame:
+        """recorded and replayed merged position of every decision"""
+        if pairs is None:
+            pairs = sorted(set(self.reader.select(EventKind.POSITION)["pair"].astype(str)))
+        results = []
+        for pair in pairs:
+            kdf = self.candles(pair)
+            decisions = self.decisions(pair)
+            ends = kdf.index.searchsorted(decisions["time"], side="right")
+            start = time.perf_counter()
+            replayed = []
+            for end, window_len in zip(ends, decisions["window_len"].astype(int)):
+                window = kdf.iloc[max(end - window_len, 0) : end]
+                replayed.append(self.graph.run(pair, window)["merged_position"])
+            self.logger.info(
+                f"{pair}: {len(decisions)} decisions replayed in {time.perf_counter() - start:.3f}s"
+            )
+            result = pd.DataFrame(
+                {
+                    "time": decisions["time"],
+                    "pair": pair,
+                    "recorded": decisions["merged_position"].to_numpy(),
+                    "replayed": replayed,
+                }
+            )
+            result["match"] = np.isclose(result["recorded"], result["replayed"], rtol=0, atol=1e-9)
+            results.append(result)
+        return pd.concat(results, ignore_index=True) if results else pd.DataFrame()
+
+
+if __name__ == "__main__":
+    import research.Alpha.alp_adx_stochrsi_demastd  # registers alp_adx_stochrsi_multiple
+
+    parser = argparse.ArgumentParser(description="replay the journaled decisions of a model")
+    parser.add_argument("journal_dirs", nargs="+")
+    parser.add_argument("--alphas", nargs="+", default=["alp_adx_stochrsi_multiple"])
+    parser.add_argument("--timeframe", default="1m")
+    args = parser.parse_args()
+
+    timbersaw.setup()
+    graph = AlphaGraph([create_alpha(name, money=1800, leverage=5, mode=1) for name in args.alphas])
+    decisions = DecisionReplay(args.journal_dirs, graph, args.timeframe).run()
+    print(decisions)
+    print(f"{decisions['match'].sum()} of {len(decisions)} decisions reproduced")
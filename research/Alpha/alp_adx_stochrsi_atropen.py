@@ -1,27 +1,52 @@
 import os
 import logging
 import operator
-import optuna
 import pandas as pd
 import numpy as np
-import pandas_ta as pta
-import matplotlib.pyplot as plt
 import sys
 
 main_path = "/Users/rivachol/Desktop/Rivachol_v2/"
 sys.path.append(main_path)
 from research.backtest import BacktestFramework
+from research.result_book import ResultBook, dataset_hash
+from research.pruning import TrialReporter, make_pruner
+from research.Market.kline_store import KlineStore
+from index import ta
 from index.indicators import Adx, StochRsi
 from strategy.stringent import AtrOpen
+from research.Alpha.registry import (
+    SIGNALS_PATH,
+    IndicatorNode,
+    compute_indicators,
+    register_alpha,
+    suggest_params,
+)
+from index.signal_dsl import load_signal_rules
 import warnings
 
 warnings.filterwarnings("ignore")
 
 
+@register_alpha
 class AlpAdxStochRsi(BacktestFramework):
     alpha_name = "alp_adx_stochrsi"
     symbols = ["BTCUSDT"]
     timeframe = "1m"
+    # {param: (low, high, step)}, the grid varies the last signal param fastest, so adx_len last
+    # keeps its few Adx and atr in the indicator cache of research.grid
+    search_space = {
+        "stoch_len": (9, 99, 3),
+        "rsi_len": (9, 99, 3),
+        "kd": (3, 6, 1),
+        "adx_len": (9, 99, 3),
+        "tp_atr": (3, 12, 1),
+        "sl_atr": (2, 8, 1),
+    }
+    exit_params = ("tp_atr", "sl_atr")
+    signal_rule = load_signal_rules(SIGNALS_PATH)[alpha_name]
+    # optuna pruner of optimize_params and the reports per backtest it decides on, see research.pruning
+    pruner = {"name": "MedianPruner", "n_startup_trials": 10, "n_warmup_steps": 3}
+    checkpoints = 10
     logger = logging.getLogger(alpha_name)
 
     def __init__(self, money, leverage, params: dict):
@@ -33,10 +58,9 @@ class AlpAdxStochRsi(BacktestFramework):
 
     def _read_kdf_from_csv(self, symbol: str) -> pd.DataFrame:
         try:
-            kdf = pd.read_csv(
-                f"{main_path}test_data/{symbol}_{self.timeframe}.csv", index_col=0
+            kdf = KlineStore(f"{main_path}kline_store").load_or_ingest_csv(
+                symbol, self.timeframe, f"{main_path}test_data/{symbol}_{self.timeframe}.csv"
             )
-            kdf.index = pd.to_datetime(kdf.index)
             return kdf
         except:
             print(f"{symbol} testset not found")
@@ -60,7 +84,6 @@ class AlpAdxStochRsi(BacktestFramework):
             portfolio = self.generate_portfolio(
                 kdf, adx_len, stoch_len, rsi_len, kd, tp_atr, sl_atr
             )
-            # self.output_result(portfolio, symbol)
             if "value" not in merged_portfolio:
                 merged_portfolio = pd.DataFrame(
                     0,
@@ -77,37 +100,23 @@ class AlpAdxStochRsi(BacktestFramework):
     def objective(self, trial):
         kwargs = {}
         for symbol in self.symbols:
-            kwargs.update(
-                {
-                    f"{symbol}_adx_len": trial.suggest_int(
-                        f"{symbol}_adx_len", 9, 99, step=3
-                    ),
-                    f"{symbol}_rsi_len": trial.suggest_int(
-                        f"{symbol}_rsi_len", 9, 99, step=3
-                    ),
-                    f"{symbol}_stoch_len": trial.suggest_int(
-                        f"{symbol}_stoch_len", 9, 99, step=3
-                    ),
-                    f"{symbol}_kd": trial.suggest_int(f"{symbol}_kd", 3, 6),
-                    f"{symbol}_tp_atr": trial.suggest_int(
-                        f"{symbol}_tp_atr",
-                        3,
-                        12,
-                    ),
-                    f"{symbol}_sl_atr": trial.suggest_int(
-                        f"{symbol}_sl_atr",
-                        2,
-                        8,
-                    ),
-                }
-            )
-        result = self.get_backtest_result(kwargs)
-        performance = self.calculate_performance(result)
+            kwargs.update(suggest_params(trial, symbol, self.search_space))
+        performance = self.result_book.get(self.alpha_name, self.dataset_hash, kwargs)
+        if performance is None:
+            self.reporter = TrialReporter(trial, self.target, self.checkpoints)
+            try:
+                result = self.get_backtest_result(kwargs)
+            finally:
+                self.reporter = None
+            performance = self.calculate_performance(result)
+            self.result_book.add(self.alpha_name, self.dataset_hash, kwargs, performance, result["value"])
 
         return performance[self.target]
 
     def _init_optimizer(self) -> None:
         self._init_logger()
+        self.result_book = ResultBook("result_book")
+        self.dataset_hash = dataset_hash([self._read_kdf_from_csv(symbol) for symbol in self.symbols])
         self._log(
             f"Start optimizing {self.alpha_name} for goal {self.target} on {self.timeframe}"
         )
@@ -127,9 +136,12 @@ class AlpAdxStochRsi(BacktestFramework):
         self.logger.info(string)
 
     def optimize_params(self):
+        import optuna
+
         self._init_optimizer()
-        study = optuna.create_study(direction="maximize")
+        study = optuna.create_study(direction="maximize", pruner=make_pruner(self.pruner))
         study.optimize(self.objective, n_trials=self.num_evals)
+        self.result_book.flush()
         sorted_trials = sorted(
             [trial for trial in study.trials if trial.value is not None],
             key=operator.attrgetter("value"),
@@ -143,22 +155,13 @@ class AlpAdxStochRsi(BacktestFramework):
     def _write_to_log(self, trials):
         log_message = "Top 3 results:\n"
         for i, trial in enumerate(trials):
-            log_message += f"Rank {i+1}:\n"
-            log_message += f"  Params: {trial.params}\n"
-            log_message += f"  Value: {trial.value}\n"
-            result = self.get_backtest_result(trial.params)
-            performance = self.calculate_performance(result)
-            self.output_result(result, f"rank_{i+1}")
-            log_message += f"  Performance: {performance}\n\n"
-
+            log_message += f"Rank {i+1}: {self.target} {trial.value}, params {trial.params}\n"
+        log_message += f"performance and equity curves in {self.result_book.root}, dataset {self.dataset_hash}"
         self._log(log_message)
 
-    def output_result(self, result: pd.DataFrame, tag: str) -> None:
-        os.makedirs("result_book", exist_ok=True)
-        result.to_csv(f"result_book/{self.alpha_name}_{tag}.csv")
-        # self._save_curve(result, number)
-
     def _save_curve(self, result: pd.DataFrame, number) -> None:
+        import matplotlib.pyplot as plt
+
         plt.figure(figsize=(12, 6))
         plt.plot(result["value"], label="equity_curve")
         plt.legend()
@@ -168,6 +171,21 @@ class AlpAdxStochRsi(BacktestFramework):
         plt.ylabel("Equity")
         plt.savefig(f"result_book/{self.alpha_name}_{number}.png")
 
+    def _indicator_nodes(self, adx_len, stoch_len, rsi_len, kd) -> dict:
+        return {
+            "adx": IndicatorNode(Adx, (adx_len,)),
+            "stochrsi": IndicatorNode(StochRsi, (stoch_len, rsi_len, kd)),
+            "atr": IndicatorNode(ta.atr, (adx_len, "EMA"), ("high", "low", "close")),
+        }
+
+    def indicators(self, symbol: str) -> dict:
+        adx_len, stoch_len, rsi_len, kd, _, _ = self._get_params(symbol)
+        return self._indicator_nodes(adx_len, stoch_len, rsi_len, kd)
+
+    def alpha_position(self, symbol: str, kdf: pd.DataFrame, indicators: dict = None) -> float:
+        portfolio = self.generate_portfolio(kdf, *self._get_params(symbol), indicators=indicators)
+        return round(portfolio["position"][-1], 3)
+
     def generate_portfolio(
         self,
         kdf: pd.DataFrame,
@@ -177,31 +195,13 @@ class AlpAdxStochRsi(BacktestFramework):
         kd,
         tp_atr,
         sl_atr,
+        indicators: dict = None,
     ) -> pd.DataFrame:
-        adx = Adx(kdf, adx_len)
-        adx_df = adx.get_indicator()
-        stoch_rsi = StochRsi(kdf, stoch_len, rsi_len, kd)
-        stoch_rsi_df = stoch_rsi.get_indicator()
-        signal = pd.concat([kdf, adx_df, stoch_rsi_df], axis=1)
-        signal["atr"] = pta.atr(
-            signal["high"],
-            signal["low"],
-            signal["close"],
-            length=adx_len,
-            mamode="EMA",
-        )
-
-        signal["signal"] = 0
-
-        signal.loc[
-            (signal["adx"] >= 25) & (signal["upcross"] < 20) & (signal["upcross"] > 0),
-            "signal",
-        ] = 1
-        signal.loc[
-            (signal["adx"] >= 25) & (signal["downcross"] > 80),
-            "signal",
-        ] = -1
+        if indicators is None:
+            indicators = compute_indicators(self._indicator_nodes(adx_len, stoch_len, rsi_len, kd), kdf)
+        signal = self.signal_frame(kdf, indicators)
         strategy = AtrOpen(tp_atr, sl_atr, self.money, self.leverage)
+        strategy.reporter = self.reporter
         portfolio = strategy.get_result(signal)
 
         # position = portfolio[f"position"][-1]
@@ -221,6 +221,16 @@ class AlpAdxStochRsi(BacktestFramework):
         # self.logger.info(f"{signal_position}")
         return portfolio
 
+    def signal_frame(self, kdf: pd.DataFrame, indicators: dict) -> pd.DataFrame:
+        signal = pd.concat([kdf, indicators["adx"], indicators["stochrsi"]], axis=1)
+        signal["atr"] = indicators["atr"]
+        signal["signal"] = self.signal_rule.evaluate(signal)
+        return signal
+
+    def grid_performance(self, signal: pd.DataFrame, tp_atr, sl_atr) -> dict:
+        """performance of every (tp_atr, sl_atr) pair on one signal frame, see research.grid"""
+        return AtrOpen.grid_performance(signal, self.money, tp_atr, sl_atr)
+
 
 if __name__ == "__main__":
     params = {
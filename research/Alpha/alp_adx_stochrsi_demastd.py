@@ -5,29 +5,56 @@ main_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
 sys.path.append(main_path)
 import logging
 import operator
-import optuna
 import pandas as pd
-import pandas_ta as pta
 import yaml
-import matplotlib.pyplot as plt
 from research.backtest import BacktestFramework
+from research.result_book import ResultBook, dataset_hash
+from research.pruning import TrialReporter, make_pruner
+from index import ta
 from index.indicators import Adx, StochRsi
 from strategy.multiple import DemaStd
+from research.Market.kline_store import KlineStore
+from research.Market.universe import MarketUniverse
+from research.Alpha.registry import (
+    SIGNALS_PATH,
+    IndicatorNode,
+    compute_indicators,
+    register_alpha,
+    suggest_params,
+)
+from index.signal_dsl import load_signal_rules
 import warnings
 
 warnings.filterwarnings("ignore")
 
 
+@register_alpha
 class AlpAdxStochRsiMultiple(BacktestFramework):
     alpha_name = "alp_adx_stochrsi_multiple"
     pairs = ["BTCUSD"]
     timeframe = "1m"
+    data_source = "csv"  # csv or tsdb
+    # {param: (low, high, step)} suggested per pair by optimize_params
+    search_space = {
+        "adx_len": (9, 99, 3),
+        "rsi_len": (9, 99, 3),
+        "stoch_len": (9, 99, 3),
+        "kd": (3, 6, 1),
+        "tp_std": (3, 12, 1),
+        "sl_std": (2, 8, 1),
+        "dema_len": (9, 99, 3),
+    }
+    signal_rule = load_signal_rules(SIGNALS_PATH)[alpha_name]
+    # optuna pruner of optimize_params and the reports per backtest it decides on, see research.pruning
+    pruner = {"name": "MedianPruner", "n_startup_trials": 10, "n_warmup_steps": 3}
+    checkpoints = 10
     logger = logging.getLogger(alpha_name)
 
     def __init__(self, money, leverage, mode=0) -> None:
         self.mode = mode
         self.money = money
         self.leverage = leverage
+        self.universe = MarketUniverse(self.pairs)
         if mode == 0:  # 0 for backtest, 1 for production
             self.num_evals = 100
             self.target = "t_sharpe"
@@ -44,13 +71,24 @@ class AlpAdxStochRsiMultiple(BacktestFramework):
             self.logger.error("Config file not found")
             sys.exit(1)
 
+    def _read_kdf(self, pair: str) -> pd.DataFrame:
+        if self.data_source == "tsdb":
+            return self._read_kdf_from_tsdb(pair)
+        return self._read_kdf_from_csv(pair)
+
+    def _read_kdf_from_tsdb(self, pair: str) -> pd.DataFrame:
+        if not hasattr(self, "tsdb_reader"):
+            from research.Market.tsdb_kline import TsdbKlineReader
+
+            self.tsdb_reader = TsdbKlineReader.from_config()
+        return self.tsdb_reader.load(pair, self.timeframe)
+
     def _read_kdf_from_csv(self, pair: str) -> pd.DataFrame:
-        symbol = pair.replace("USD", "USDT")
+        symbol = self.universe.exchange_symbol(pair)
         try:
-            kdf = pd.read_csv(
-                f"{main_path}test_data/{symbol}_{self.timeframe}.csv", index_col=0
+            kdf = KlineStore(os.path.join(main_path, "kline_store")).load_or_ingest_csv(
+                symbol, self.timeframe, os.path.join(main_path, f"test_data/{symbol}_{self.timeframe}.csv")
             )
-            kdf.index = pd.to_datetime(kdf.index)
             return kdf
         except:
             print(f"{symbol} testset not found")
@@ -59,9 +97,8 @@ class AlpAdxStochRsiMultiple(BacktestFramework):
         merged_portfolio = pd.DataFrame()
         self.params = params
         for pair in self.pairs:
-            kdf = self._read_kdf_from_csv(pair)
+            kdf = self._read_kdf(pair)
             portfolio = self.generate_portfolio(pair, kdf)
-            # self.output_result(portfolio, symbol)
             if "value" not in merged_portfolio:
                 merged_portfolio = pd.DataFrame(
                     0,
@@ -78,35 +115,24 @@ class AlpAdxStochRsiMultiple(BacktestFramework):
     def objective(self, trial):
         kwargs = {}
         for pair in self.pairs:
-            kwargs.update(
-                {
-                    f"{pair}_adx_len": trial.suggest_int(
-                        f"{pair}_adx_len", 9, 99, step=3
-                    ),
-                    f"{pair}_rsi_len": trial.suggest_int(
-                        f"{pair}_rsi_len", 9, 99, step=3
-                    ),
-                    f"{pair}_stoch_len": trial.suggest_int(
-                        f"{pair}_stoch_len", 9, 99, step=3
-                    ),
-                    f"{pair}_kd": trial.suggest_int(f"{pair}_kd", 3, 6),
-                    f"{pair}_tp_std": trial.suggest_int(
-                        f"{pair}_tp_std", 3, 12, step=1
-                    ),
-                    f"{pair}_sl_std": trial.suggest_int(f"{pair}_sl_std", 2, 8, step=1),
-                    f"{pair}_dema_len": trial.suggest_int(
-                        f"{pair}_dema_len", 9, 99, step=3
-                    ),
-                }
-            )
+            kwargs.update(suggest_params(trial, pair, self.search_space))
 
-        result = self.get_backtest_result(kwargs)
-        performance = self.calculate_performance(result)
+        performance = self.result_book.get(self.alpha_name, self.dataset_hash, kwargs)
+        if performance is None:
+            self.reporter = TrialReporter(trial, self.target, self.checkpoints)
+            try:
+                result = self.get_backtest_result(kwargs)
+            finally:
+                self.reporter = None
+            performance = self.calculate_performance(result)
+            self.result_book.add(self.alpha_name, self.dataset_hash, kwargs, performance, result["value"])
 
         return performance[self.target]
 
     def _init_optimizer(self) -> None:
         self._init_logger()
+        self.result_book = ResultBook("result_book")
+        self.dataset_hash = dataset_hash([self._read_kdf(pair) for pair in self.pairs])
         self._log(
             f"Start optimizing {self.alpha_name} for goal {self.target} on {self.timeframe}"
         )
@@ -126,9 +152,12 @@ class AlpAdxStochRsiMultiple(BacktestFramework):
         self.logger.info(string)
 
     def optimize_params(self):
+        import optuna
+
         self._init_optimizer()
-        study = optuna.create_study(direction="maximize")
+        study = optuna.create_study(direction="maximize", pruner=make_pruner(self.pruner))
         study.optimize(self.objective, n_trials=self.num_evals)
+        self.result_book.flush()
         sorted_trials = sorted(
             [trial for trial in study.trials if trial.value is not None],
             key=operator.attrgetter("value"),
@@ -142,22 +171,13 @@ class AlpAdxStochRsiMultiple(BacktestFramework):
     def _write_to_log(self, trials):
         log_message = "Top 3 results:\n"
         for i, trial in enumerate(trials):
-            log_message += f"Rank {i+1}:\n"
-            log_message += f"  Params: {trial.params}\n"
-            log_message += f"  Value: {trial.value}\n"
-            result = self.get_backtest_result(trial.params)
-            performance = self.calculate_performance(result)
-            self.output_result(result, f"rank_{i+1}")
-            log_message += f"  Performance: {performance}\n\n"
-
+            log_message += f"Rank {i+1}: {self.target} {trial.value}, params {trial.params}\n"
+        log_message += f"performance and equity curves in {self.result_book.root}, dataset {self.dataset_hash}"
         self._log(log_message)
 
-    def output_result(self, result: pd.DataFrame, tag: str) -> None:
-        os.makedirs("result_book", exist_ok=True)
-        result.to_csv(f"result_book/{self.alpha_name}_{tag}.csv")
-        # self._save_curve(result, number)
-
     def _save_curve(self, result: pd.DataFrame, number) -> None:
+        import matplotlib.pyplot as plt
+
         plt.figure(figsize=(12, 6))
         plt.plot(result["value"], label="equity_curve")
         plt.legend()
@@ -178,36 +198,40 @@ class AlpAdxStochRsiMultiple(BacktestFramework):
 
         return adx_len, stoch_len, rsi_len, kd, dema_len, tp_std, sl_std
 
-    def generate_portfolio(self, pair: str, kdf: pd.DataFrame) -> pd.DataFrame | float:
-        adx_len, stoch_len, rsi_len, kd, dema_len, tp_std, sl_std = self._get_params(
-            pair
-        )
-        adx = Adx(kdf, adx_len)
-        adx_df = adx.get_indicator()
-        stoch_rsi = StochRsi(kdf, stoch_len, rsi_len, kd)
-        stoch_rsi_df = stoch_rsi.get_indicator()
-        trading_signal = pd.concat([kdf, adx_df, stoch_rsi_df], axis=1)
-        trading_signal["std"] = pta.stdev(kdf["close"], length=dema_len)
-        trading_signal["dema"] = pta.dema(kdf["close"], length=dema_len)
-        trading_signal["signal"] = 0
-
-        trading_signal.loc[
-            (trading_signal["adx"] >= 25)
-            & (trading_signal["upcross"] < 20)
-            & (trading_signal["upcross"] > 0),
-            "signal",
-        ] = 1
-        trading_signal.loc[
-            (trading_signal["adx"] >= 25) & (trading_signal["downcross"] > 80),
-            "signal",
-        ] = -1
-        strategy = DemaStd(tp_std, sl_std, self.money, self.leverage)
-        portfolio = strategy.get_result(trading_signal)
+    def indicators(self, pair: str) -> dict:
+        adx_len, stoch_len, rsi_len, kd, dema_len, _, _ = self._get_params(pair)
+        return {
+            "adx": IndicatorNode(Adx, (adx_len,)),
+            "stochrsi": IndicatorNode(StochRsi, (stoch_len, rsi_len, kd)),
+            "std": IndicatorNode(ta.stdev, (dema_len,), ("close",)),
+            "dema": IndicatorNode(ta.dema, (dema_len,), ("close",)),
+        }
+
+    def alpha_position(self, pair: str, kdf: pd.DataFrame, indicators: dict = None) -> float:
+        portfolio, trading_signal = self._portfolio(pair, kdf, indicators)
+        return self._alpha_position(portfolio, trading_signal)
+
+    def generate_portfolio(self, pair: str, kdf: pd.DataFrame, indicators: dict = None) -> pd.DataFrame | float:
+        portfolio, trading_signal = self._portfolio(pair, kdf, indicators)
         if self.mode == 1:
             alpha_position = self._alpha_position(portfolio, trading_signal)
             return alpha_position
         return portfolio
 
+    def _portfolio(self, pair: str, kdf: pd.DataFrame, indicators: dict = None) -> tuple:
+        """portfolio and trading signal, indicators computed here unless given by AlphaGraph"""
+        if indicators is None:
+            indicators = compute_indicators(self.indicators(pair), kdf)
+        _, _, _, _, _, tp_std, sl_std = self._get_params(pair)
+        trading_signal = pd.concat([kdf, indicators["adx"], indicators["stochrsi"]], axis=1)
+        trading_signal["std"] = indicators["std"]
+        trading_signal["dema"] = indicators["dema"]
+        trading_signal["signal"] = self.signal_rule.evaluate(trading_signal)
+        strategy = DemaStd(tp_std, sl_std, self.money, self.leverage)
+        strategy.reporter = self.reporter
+        portfolio = strategy.get_result(trading_signal)
+        return portfolio, trading_signal
+
     def _alpha_position(
         self, portfolio: pd.DataFrame, trading_signal: pd.DataFrame
     ) -> float:
@@ -259,7 +283,5 @@ if __name__ == "__main__":
     backtest()
     # alp_backtest = AlpAdxStochRsiMultiple(money=2000, leverage=5, params=params)
     # result = alp_backtest.get_backtest_result(params)
-    # # 输出result成csv文件
-    # alp_backtest.output_result(result, 1)
     # performance = alp_backtest.calculate_performance(result)
     # print(performance)
@@ -1,14 +1,13 @@
 import os
 import logging
 import operator
-import optuna
 import pandas as pd
-import matplotlib.pyplot as plt
 import sys
 
 main_path = "/Users/rivachol/Desktop/Rivachol_v2/"
 sys.path.append(main_path)
 from research.backtest import BacktestFramework
+from research.Market.kline_store import KlineStore
 
 import warnings
 
@@ -43,10 +42,9 @@ class AlpLinboDempct(BacktestFramework):
 
     def _read_kdf_from_csv(self, symbol: str) -> pd.DataFrame:
         try:
-            kdf = pd.read_csv(
-                f"{main_path}test_data/{symbol}_{self.timeframe}.csv", index_col=0
+            kdf = KlineStore(f"{main_path}kline_store").load_or_ingest_csv(
+                symbol, self.timeframe, f"{main_path}test_data/{symbol}_{self.timeframe}.csv"
             )
-            kdf.index = pd.to_datetime(kdf.index)
             return kdf
         except:
             print(f"{symbol} testset not found")
@@ -146,6 +144,8 @@ class AlpLinboDempct(BacktestFramework):
         self.logger.info(string)
 
     def optimize_params(self):
+        import optuna
+
         self._init_optimizer()
         study = optuna.create_study(direction="maximize")
         study.optimize(self.objective, n_trials=self.num_evals)
@@ -178,6 +178,8 @@ class AlpLinboDempct(BacktestFramework):
         # self._save_curve(result, number)
 
     def _save_curve(self, result: pd.DataFrame, number) -> None:
+        import matplotlib.pyplot as plt
+
         plt.figure(figsize=(12, 6))
         plt.plot(result["value"], label="equity_curve")
         plt.legend()
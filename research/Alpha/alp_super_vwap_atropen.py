@@ -1,26 +1,49 @@
 import os
 import logging
 import operator
-import optuna
 import pandas as pd
-import pandas_ta as pta
-import matplotlib.pyplot as plt
 import sys
 
 main_path = "/Users/rivachol/Desktop/Rivachol_v2/"
 sys.path.append(main_path)
 from research.backtest import BacktestFramework
+from research.result_book import ResultBook, dataset_hash
+from research.pruning import TrialReporter, make_pruner
+from research.Market.kline_store import KlineStore
+from index import ta
 from index.indicators import Supertrend, Vwap
 from strategy.stringent import AtrOpen
+from research.Alpha.registry import (
+    SIGNALS_PATH,
+    IndicatorNode,
+    compute_indicators,
+    register_alpha,
+    suggest_params,
+)
+from index.signal_dsl import load_signal_rules
 import warnings
 
 warnings.filterwarnings("ignore")
 
 
+@register_alpha
 class AlpSuperVwap(BacktestFramework):
     alpha_name = "alp_super_vwap_atropen"
     symbols = ["BTCUSDT"]
     timeframe = "1m"
+    # {param: (low, high, step)}, vwap_len last keeps its Vwap and atr in the grid indicator cache
+    search_space = {
+        "sptr_len": (9, 99, 3),
+        "sptr_k": (2.0, 4.0, 0.5),
+        "vwap_len": (9, 99, 3),
+        "tp_atr": (3, 12, 1),
+        "sl_atr": (2, 8, 1),
+    }
+    exit_params = ("tp_atr", "sl_atr")
+    signal_rule = load_signal_rules(SIGNALS_PATH)[alpha_name]
+    # optuna pruner of optimize_params and the reports per backtest it decides on, see research.pruning
+    pruner = {"name": "MedianPruner", "n_startup_trials": 10, "n_warmup_steps": 3}
+    checkpoints = 10
     logger = logging.getLogger(alpha_name)
 
     def __init__(self, money, leverage, params: dict):
@@ -32,10 +55,9 @@ class AlpSuperVwap(BacktestFramework):
 
     def _read_kdf_from_csv(self, symbol: str) -> pd.DataFrame:
         try:
-            kdf = pd.read_csv(
-                f"{main_path}test_data/{symbol}_{self.timeframe}.csv", index_col=0
+            kdf = KlineStore(f"{main_path}kline_store").load_or_ingest_csv(
+                symbol, self.timeframe, f"{main_path}test_data/{symbol}_{self.timeframe}.csv"
             )
-            kdf.index = pd.to_datetime(kdf.index)
             return kdf
         except:
             print(f"{symbol} testset not found")
@@ -58,7 +80,6 @@ class AlpSuperVwap(BacktestFramework):
             portfolio = self.generate_portfolio(
                 kdf, sptr_len, sptr_k, vwap_len, tp_atr, sl_atr
             )
-            # self.output_result(portfolio, symbol)
             if "value" not in merged_portfolio:
                 merged_portfolio = pd.DataFrame(
                     0,
@@ -75,28 +96,23 @@ class AlpSuperVwap(BacktestFramework):
     def objective(self, trial):
         kwargs = {}
         for symbol in self.symbols:
-            kwargs.update(
-                {
-                    f"{symbol}_sptr_len": trial.suggest_int(
-                        f"{symbol}_sptr_len", 9, 99, step=3
-                    ),
-                    f"{symbol}_sptr_k": trial.suggest_float(
-                        f"{symbol}_sptr_k", 2, 4, step=0.5
-                    ),
-                    f"{symbol}_vwap_len": trial.suggest_int(
-                        f"{symbol}_vwap_len", 9, 99, step=3
-                    ),
-                    f"{symbol}_tp_atr": trial.suggest_int(f"{symbol}_tp_atr", 3, 12),
-                    f"{symbol}_sl_atr": trial.suggest_int(f"{symbol}_sl_atr", 2, 8),
-                }
-            )
-        result = self.get_backtest_result(kwargs)
-        performance = self.calculate_performance(result)
+            kwargs.update(suggest_params(trial, symbol, self.search_space))
+        performance = self.result_book.get(self.alpha_name, self.dataset_hash, kwargs)
+        if performance is None:
+            self.reporter = TrialReporter(trial, self.target, self.checkpoints)
+            try:
+                result = self.get_backtest_result(kwargs)
+            finally:
+                self.reporter = None
+            performance = self.calculate_performance(result)
+            self.result_book.add(self.alpha_name, self.dataset_hash, kwargs, performance, result["value"])
 
         return performance[self.target]
 
     def _init_optimizer(self) -> None:
         self._init_logger()
+        self.result_book = ResultBook("result_book")
+        self.dataset_hash = dataset_hash([self._read_kdf_from_csv(symbol) for symbol in self.symbols])
         self._log(
             f"Start optimizing {self.alpha_name} for goal {self.target} on {self.timeframe}"
         )
@@ -116,9 +132,12 @@ class AlpSuperVwap(BacktestFramework):
         self.logger.info(string)
 
     def optimize_params(self):
+        import optuna
+
         self._init_optimizer()
-        study = optuna.create_study(direction="maximize")
+        study = optuna.create_study(direction="maximize", pruner=make_pruner(self.pruner))
         study.optimize(self.objective, n_trials=self.num_evals)
+        self.result_book.flush()
         sorted_trials = sorted(
             [trial for trial in study.trials if trial.value is not None],
             key=operator.attrgetter("value"),
@@ -132,22 +151,13 @@ class AlpSuperVwap(BacktestFramework):
     def _write_to_log(self, trials):
         log_message = "Top 3 results:\n"
         for i, trial in enumerate(trials):
-            log_message += f"Rank {i+1}:\n"
-            log_message += f"  Params: {trial.params}\n"
-            log_message += f"  Value: {trial.value}\n"
-            result = self.get_backtest_result(trial.params)
-            performance = self.calculate_performance(result)
-            self.output_result(result, f"rank_{i+1}")
-            log_message += f"  Performance: {performance}\n\n"
-
+            log_message += f"Rank {i+1}: {self.target} {trial.value}, params {trial.params}\n"
+        log_message += f"performance and equity curves in {self.result_book.root}, dataset {self.dataset_hash}"
         self._log(log_message)
 
-    def output_result(self, result: pd.DataFrame, tag: str) -> None:
-        os.makedirs("result_book", exist_ok=True)
-        result.to_csv(f"result_book/{self.alpha_name}_{tag}.csv")
-        # self._save_curve(result, number)
-
     def _save_curve(self, result: pd.DataFrame, number) -> None:
+        import matplotlib.pyplot as plt
+
         plt.figure(figsize=(12, 6))
         plt.plot(result["value"], label="equity_curve")
         plt.legend()
@@ -157,30 +167,29 @@ class AlpSuperVwap(BacktestFramework):
         plt.ylabel("Equity")
         plt.savefig(f"result_book/{self.alpha_name}_{number}.png")
 
+    def _indicator_nodes(self, sptr_len, sptr_k, vwap_len) -> dict:
+        return {
+            "supertrend": IndicatorNode(Supertrend, (sptr_len, sptr_k)),
+            "vwap": IndicatorNode(Vwap, (vwap_len,)),
+            "atr": IndicatorNode(ta.atr, (vwap_len,), ("high", "low", "close")),
+        }
+
+    def indicators(self, symbol: str) -> dict:
+        sptr_len, sptr_k, vwap_len, _, _ = self._get_params(symbol)
+        return self._indicator_nodes(sptr_len, sptr_k, vwap_len)
+
+    def alpha_position(self, symbol: str, kdf: pd.DataFrame, indicators: dict = None) -> float:
+        portfolio = self.generate_portfolio(kdf, *self._get_params(symbol), indicators=indicators)
+        return round(portfolio["position"][-1], 3)
+
     def generate_portfolio(
-        self, kdf: pd.DataFrame, sptr_len, sptr_k, vwap_len, tp_atr, sl_atr
+        self, kdf: pd.DataFrame, sptr_len, sptr_k, vwap_len, tp_atr, sl_atr, indicators: dict = None
     ) -> pd.DataFrame:
-        supertrend = Supertrend(kdf, sptr_len, sptr_k)
-        supertrend_df = supertrend.get_indicator()
-        vwap = Vwap(kdf, vwap_len)
-        vwap_df = vwap.get_indicator()
-        signal = pd.concat([kdf, supertrend_df, vwap_df], axis=1)
-        signal["atr"] = pta.atr(kdf["high"], kdf["low"], kdf["close"], vwap_len)
-        signal["signal"] = 0
-
-        signal.loc[
-            (signal["close"] > signal["vwap"])
-            & (signal["direction"] == 1)
-            & (signal["direction"].shift(1) == -1),
-            "signal",
-        ] = 1
-        signal.loc[
-            (signal["close"] < signal["vwap"])
-            & (signal["direction"] == -1)
-            & (signal["direction"].shift(1) == 1),
-            "signal",
-        ] = -1
+        if indicators is None:
+            indicators = compute_indicators(self._indicator_nodes(sptr_len, sptr_k, vwap_len), kdf)
+        signal = self.signal_frame(kdf, indicators)
         strategy = AtrOpen(tp_atr, sl_atr, self.money, self.leverage)
+        strategy.reporter = self.reporter
         portfolio = strategy.get_result(signal)
         # position = portfolio[f"position"][-1]
         # signal = portfolio[f"signal"][-1]
@@ -199,6 +208,16 @@ class AlpSuperVwap(BacktestFramework):
         # self.logger.info(f"{signal_position}")
         return portfolio
 
+    def signal_frame(self, kdf: pd.DataFrame, indicators: dict) -> pd.DataFrame:
+        signal = pd.concat([kdf, indicators["supertrend"], indicators["vwap"]], axis=1)
+        signal["atr"] = indicators["atr"]
+        signal["signal"] = self.signal_rule.evaluate(signal)
+        return signal
+
+    def grid_performance(self, signal: pd.DataFrame, tp_atr, sl_atr) -> dict:
+        """performance of every (tp_atr, sl_atr) pair on one signal frame, see research.grid"""
+        return AtrOpen.grid_performance(signal, self.money, tp_atr, sl_atr)
+
 
 if __name__ == "__main__":
     params = {
@@ -218,7 +237,5 @@ if __name__ == "__main__":
     backtest(params)
     # alp_backtest = AlpAdxStochrsiOpenatr(money = 2000, leverage = 5, params = params)
     # result = alp_backtest.get_backtest_result(params)
-    # #输出result成csv文件
-    # alp_backtest.output_result(result, 1)
     # performance = alp_backtest.evaluate_performance(result)
     # print(performance)
@@ -0,0 +1,147 @@
+import logging
+import os
+from dataclasses import dataclass
+
+import pandas as pd
+
+from contek_pyutils import metrics
+
+# alpha_name -> alpha class, filled by register_alpha when the alpha modules are imported
+ALPHAS = {}
+# long / short rules of the alphas, see index.signal_dsl
+SIGNALS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "signals.yaml")
+
+
+def register_alpha(cls):
+    """
+    class decorator adding an alpha to ALPHAS. A registered alpha declares its indicators with
+    indicators(pair) -> {name: IndicatorNode} and turns them into a position with
+    alpha_position(pair, kdf, indicators) -> float, so AlphaGraph can share them between alphas.
+    """
+    for method in ("indicators", "alpha_position"):
+        if not callable(getattr(cls, method, None)):
+            raise TypeError(f"{cls.__name__} does not implement {method}")
+    if cls.alpha_name in ALPHAS and ALPHAS[cls.alpha_name] is not cls:
+        raise ValueError(f"alpha {cls.alpha_name} is already registered by {ALPHAS[cls.alpha_name].__name__}")
+    ALPHAS[cls.alpha_name] = cls
+    return cls
+
+
+def create_alpha(name: str, **kwargs):
+    try:
+        return ALPHAS[name](**kwargs)
+    except KeyError:
+        raise KeyError(f"alpha {name} is not registered, registered alphas: {sorted(ALPHAS)}") from None
+
+
+def suggest_params(trial, symbol: str, search_space: dict) -> dict:
+    """
+    {symbol_param: value} suggested by an optuna trial for a search space {param: (low, high, step)},
+    integer params when low, high and step are all ints, float params otherwise
+    """
+    params = {}
+    for name, (low, high, step) in search_space.items():
+        key = f"{symbol}_{name}"
+        if all(isinstance(bound, int) for bound in (low, high, step)):
+            params[key] = trial.suggest_int(key, low, high, step=step)
+        else:
+            params[key] = trial.suggest_float(key, low, high, step=step)
+    return params
+
+
+@dataclass(frozen=True)
+class IndicatorNode:
+    """
+    One indicator computed on a kdf. Nodes with the same indicator, params and inputs are equal and
+    are computed once per kdf by AlphaGraph.
+    Args:
+        indicator: an index.indicators class, computed as indicator(kdf, *params).get_indicator(),
+            or an index.ta function, computed as indicator(*kdf[inputs] arrays, *params)
+        params: tuple: indicator parameters
+        inputs: tuple: kdf columns passed to an index.ta function
+    """
+
+    indicator: object
+    params: tuple = ()
+    inputs: tuple = ()
+
+    def compute(self, kdf: pd.DataFrame):
+        if isinstance(self.indicator, type):
+            return self.indicator(kdf, *self.params).get_indicator()
+        return self.indicator(*(kdf[col].to_numpy() for col in self.inputs), *self.params)
+
+
+def compute_indicators(nodes: dict, kdf: pd.DataFrame, cache: dict = None) -> dict:
+    """{name: value} of the {name: IndicatorNode} declared by an alpha, reusing the values in cache"""
+    cache = {} if cache is None else cache
+    indicators = {}
+    for name, node in nodes.items():
+        if node not in cache:
+            cache[node] = node.compute(kdf)
+        indicators[name] = cache[node]
+    return indicators
+
+
+def last_values(name: str, value) -> dict:
+    """{name: float} of the latest candle of an indicator value, one entry per column of a frame"""
+    if isinstance(value, pd.DataFrame):
+        return {f"{name}.{column}": float(v) for column, v in value.iloc[-1].items()}
+    if isinstance(value, pd.Series):
+        return {name: float(value.iloc[-1])}
+    if isinstance(value, tuple):
+        return {f"{name}.{i}": float(v[-1]) for i, v in enumerate(value)}
+    return {name: float(value[-1])}
+
+
+class AlphaGraph:
+    """
+    Compiled composition of alphas: kdf -> unique indicator nodes -> alpha positions -> merged
+    position. The indicator nodes of every pair are collected once, then each candle computes every
+    distinct node a single time and hands the values to all alphas depending on it.
+    Args:
+        alphas: list: registered alpha instances
+
+    Usage:
+        graph = AlphaGraph([create_alpha("alp_adx_stochrsi_multiple", money=1800, leverage=5, mode=1)])
+        positions = graph.run("BTCUSD", kdf)
+    """
+
+    logger = logging.getLogger("alpha_graph")
+
+    def __init__(self, alphas: list) -> None:
+        self.alphas = alphas
+        self._compiled = {}
+
+    def compile(self, pair: str) -> tuple:
+        """(unique nodes, [(alpha, its nodes)]) of the pair, cached as alpha params are fixed"""
+        if pair not in self._compiled:
+            alpha_nodes = [(alpha, alpha.indicators(pair)) for alpha in self.alphas]
+            unique_nodes = list(dict.fromkeys(node for _, nodes in alpha_nodes for node in nodes.values()))
+            num_nodes = sum(len(nodes) for _, nodes in alpha_nodes)
+            self.logger.info(f"{pair}: {len(self.alphas)} alphas, {len(unique_nodes)} unique of {num_nodes} indicators")
+            self._compiled[pair] = (unique_nodes, alpha_nodes)
+        return self._compiled[pair]
+
+    def recompile(self) -> None:
+        """drop the compiled nodes, e.g. after the alpha params are reloaded"""
+        self._compiled = {}
+
+    def run(self, pair: str, kdf: pd.DataFrame, snapshot: dict = None) -> dict:
+        """
+        {alpha_name: position} of the latest candle plus merged_position, a snapshot dict is filled
+        with the {alpha.indicator: value} of the latest candle
+        """
+        unique_nodes, alpha_nodes = self.compile(pair)
+        with metrics.timer("indicator_seconds", pair=pair):
+            cache = {node: node.compute(kdf) for node in unique_nodes}
+        positions = {}
+        for alpha, nodes in alpha_nodes:
+            indicators = compute_indicators(nodes, kdf, cache)
+            # the alpha steps its strategy over the candles
+            with metrics.timer("alpha_position_seconds", alpha=alpha.alpha_name):
+                positions[alpha.alpha_name] = alpha.alpha_position(pair, kdf, indicators)
+            if snapshot is not None:
+                for name, value in indicators.items():
+                    snapshot.update(last_values(f"{alpha.alpha_name}.{name}", value))
+        positions["merged_position"] = round(sum(positions.values()), 3)
+        return positions
@@ -7,6 +7,8 @@ import os
 import sys
 
 sys.path.append("/Users/rivachol/Desktop/Rivachol_v2/")
+from research.Market.kline_store import KlineStore
+from research.Market.universe import MarketUniverse
 import warnings
 
 warnings.filterwarnings("ignore")
@@ -31,7 +33,8 @@ class KlineGenerator:
     logger = logging.getLogger(__name__)
 
     def __init__(self, pairs: list, timeframe, start=None, window_days=None) -> None:
-        self.symbols = [(pair + "T") for pair in pairs]
+        self.universe = MarketUniverse(pairs)
+        self.symbols = self.universe.exchange_symbols()
         self.timeframe = timeframe
         self.window_days = window_days
         self.start = start
@@ -58,6 +61,7 @@ class KlineGenerator:
                 symbol_data.extend(ohlcv)
             kdf = self._format_candle(symbol_data)
             self._dump_df_to_csv(kdf, symbol)
+            KlineStore("kline_store").ingest(symbol, self.timeframe, kdf)
         print(f"Time used to generate test data: {time.time() - start_time} seconds")
 
     def _dump_df_to_csv(self, kdf: pd.DataFrame, symbol) -> None:
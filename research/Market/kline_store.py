@@ -0,0 +1,258 @@
+import json
+import logging
+import os
+import sys
+from collections import OrderedDict
+
+main_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+sys.path.append(main_path)
+import warnings
+
+warnings.filterwarnings("ignore")
+
+import numpy as np
+import pandas as pd
+from contek_pyutils.singleton import Memoized
+from research.Market.universe import MarketUniverse
+
+DAY_MILLIS = 24 * 60 * 60 * 1000
+
+
+class KlineStore(metaclass=Memoized):
+    """
+    Kline store partitioned by symbol/timeframe/day on disk, one .npy file per column, so a
+    load only reads the day partitions overlapping [start, end) and the projected columns.
+    Partition columns are memory mapped and kept in an LRU cache bounded by bytes, shared by
+    every alpha of the process since the store is memoized by its root.
+    Args:
+        root: str: directory of the store
+        max_cache_bytes: int: byte budget of the partition cache
+
+    Layout:
+        {root}/{c_symbol}/{timeframe}/columns.json
+        {root}/{c_symbol}/{timeframe}/sources.json, mtime of every csv ingested by load_or_ingest_csv
+        {root}/{c_symbol}/{timeframe}/{yyyymmdd}/{column}.npy, times stored as epoch millis
+    """
+
+    time_columns = ("opentime", "closetime")
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, root: str, max_cache_bytes: int = 1 << 30) -> None:
+        self.root = root
+        self.max_cache_bytes = max_cache_bytes
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+
+    def _dir(self, symbol: str, timeframe: str) -> str:
+        return os.path.join(self.root, str(MarketUniverse.canonical(symbol)), timeframe)
+
+    def columns(self, symbol: str, timeframe: str) -> list:
+        try:
+            with open(os.path.join(self._dir(symbol, timeframe), "columns.json"), "r") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return []
+
+    def days(self, symbol: str, timeframe: str) -> list:
+        """sorted day partitions (yyyymmdd) available for a symbol"""
+        try:
+            entries = os.listdir(self._dir(symbol, timeframe))
+        except FileNotFoundError:
+            return []
+        return sorted(entry for entry in entries if entry.isdigit())
+
+    def last_opentime(self, symbol: str, timeframe: str) -> int:
+        """epoch millis of the last candle stored, None when empty"""
+        days = self.days(symbol, timeframe)
+        if not days:
+            return None
+        opentime = self._read_column(os.path.join(self._dir(symbol, timeframe), days[-1]), "opentime")
+        return int(opentime[-1]) if len(opentime) else None
+
+    def _cache_get(self, key):
+        array = self._cache.get(key)
+        if array is not None:
+            self._cache.move_to_end(key)
+        return array
+
+    def _cache_put(self, key, array: np.ndarray) -> None:
+        self._cache[key] = array
+        self._cache_bytes += array.nbytes
+        while self._cache_bytes > self.max_cache_bytes and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= evicted.nbytes
+
+    def _invalidate(self, partition_dir: str) -> None:
+        for key in [key for key in self._cache if key[0] == partition_dir]:
+            self._cache_bytes -= self._cache.pop(key).nbytes
+
+    def _read_column(self, partition_dir: str, column: str) -> np.ndarray:
+        key = (partition_dir, column)
+        array = self._cache_get(key)
+        if array is None:
+            array = np.load(os.path.join(partition_dir, f"{column}.npy"), mmap_mode="r")
+            self._cache_put(key, array)
+        return array
+
+    def _write_partition(self, partition_dir: str, arrays: dict) -> None:
+        os.makedirs(partition_dir, exist_ok=True)
+        for column, array in arrays.items():
+            path = os.path.join(partition_dir, f"{column}.npy")
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as file:
+                np.save(file, array)
+            os.replace(tmp_path, path)
+        self._invalidate(partition_dir)
+
+    def _missing(self, column: str, num_rows: int) -> np.ndarray:
+        """values of a column for rows stored without it, NaT millis for time columns"""
+        if column in self.time_columns:
+            return np.full(num_rows, np.iinfo(np.int64).min)
+        return np.full(num_rows, np.nan)
+
+    def _read_or_missing(self, partition_dir: str, column: str, num_rows: int) -> np.ndarray:
+        """a column of a partition written before the column was added to the store is missing"""
+        try:
+            return self._read_column(partition_dir, column)
+        except FileNotFoundError:
+            return self._missing(column, num_rows)
+
+    @staticmethod
+    def _to_millis(times) -> np.ndarray:
+        return pd.to_datetime(times).to_numpy().astype("datetime64[ms]").astype(np.int64)
+
+    def ingest(self, symbol: str, timeframe: str, kdf: pd.DataFrame) -> None:
+        """
+        write a kdf indexed by opentime, merging with the partitions already stored. A column new to
+        the store is NaN (NaT) for the rows stored before it, a stored column missing in kdf is rejected
+        """
+        symbol_dir = self._dir(symbol, timeframe)
+        columns = [col for col in kdf.columns if col in self.time_columns or pd.api.types.is_numeric_dtype(kdf[col])]
+        stored_columns = self.columns(symbol, timeframe)
+        missing = [col for col in stored_columns if col not in columns]
+        if missing:
+            raise ValueError(f"{symbol} {timeframe}: kdf lacks the stored columns {missing}")
+        columns = [*stored_columns, *[col for col in columns if col not in stored_columns]]
+        arrays = {"opentime": self._to_millis(kdf.index)}
+        for col in columns:
+            if col in self.time_columns:
+                arrays[col] = self._to_millis(kdf[col])
+            else:
+                arrays[col] = kdf[col].to_numpy()
+        order = np.argsort(arrays["opentime"], kind="stable")
+        arrays = {col: array[order] for col, array in arrays.items()}
+
+        day_ids = arrays["opentime"] // DAY_MILLIS
+        bounds = np.flatnonzero(np.diff(day_ids)) + 1
+        for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(day_ids)]):
+            day = pd.Timestamp(int(day_ids[lo]) * DAY_MILLIS, unit="ms").strftime("%Y%m%d")
+            partition_dir = os.path.join(symbol_dir, day)
+            part = {col: array[lo:hi] for col, array in arrays.items()}
+            if os.path.exists(os.path.join(partition_dir, "opentime.npy")):
+                num_stored = len(self._read_column(partition_dir, "opentime"))
+                stored = {col: self._read_or_missing(partition_dir, col, num_stored) for col in part}
+                merged = {col: np.concatenate([stored[col], part[col]]) for col in part}
+                # keep the latest write of every opentime
+                _, last = np.unique(merged["opentime"][::-1], return_index=True)
+                keep = len(merged["opentime"]) - 1 - last
+                part = {col: array[keep] for col, array in merged.items()}
+            self._write_partition(partition_dir, part)
+
+        os.makedirs(symbol_dir, exist_ok=True)
+        with open(os.path.join(symbol_dir, "columns.json"), "w") as file:
+            json.dump(columns, file)
+        self.logger.info(f"{symbol} {timeframe}: {len(day_ids)} candles ingested")
+
+    def ingest_csv(self, symbol: str, timeframe: str, csv_path: str) -> None:
+        kdf = pd.read_csv(csv_path, index_col=0)
+        kdf.index = pd.to_datetime(kdf.index)
+        self.ingest(symbol, timeframe, kdf)
+
+    def load(
+        self,
+        symbol: str,
+        timeframe: str,
+        start: pd.Timestamp = None,
+        end: pd.Timestamp = None,
+        columns: list = None,
+    ) -> pd.DataFrame:
+        """load candles with opentime in [start, end), only reading the projected columns"""
+        columns = list(columns) if columns is not None else self.columns(symbol, timeframe)
+        start_ms = int(self._to_millis([start])[0]) if start is not None else None
+        end_ms = int(self._to_millis([end])[0]) if end is not None else None
+        days = self.days(symbol, timeframe)
+        if start_ms is not None:
+            first_day = pd.Timestamp(start_ms - start_ms % DAY_MILLIS, unit="ms").strftime("%Y%m%d")
+            days = [day for day in days if day >= first_day]
+        if end_ms is not None:
+            last_day = pd.Timestamp(end_ms - 1 - (end_ms - 1) % DAY_MILLIS, unit="ms").strftime("%Y%m%d")
+            days = [day for day in days if day <= last_day]
+
+        symbol_dir = self._dir(symbol, timeframe)
+        parts = {col: [] for col in ["opentime", *columns]}
+        for day in days:
+            partition_dir = os.path.join(symbol_dir, day)
+            opentime = self._read_column(partition_dir, "opentime")
+            lo = np.searchsorted(opentime, start_ms) if start_ms is not None else 0
+            hi = np.searchsorted(opentime, end_ms) if end_ms is not None else len(opentime)
+            if lo >= hi:
+                continue
+            for col in parts:
+                parts[col].append(self._read_or_missing(partition_dir, col, len(opentime))[lo:hi])
+
+        arrays = {
+            col: np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int64) for col, chunks in parts.items()
+        }
+        index = pd.DatetimeIndex(arrays.pop("opentime").astype("datetime64[ms]"), name="opentime")
+        for col in self.time_columns:
+            if col in arrays:
+                arrays[col] = arrays[col].astype("datetime64[ms]")
+        return pd.DataFrame(arrays, index=index, columns=columns)
+
+    def load_or_ingest_csv(
+        self,
+        symbol: str,
+        timeframe: str,
+        csv_path: str,
+        start: pd.Timestamp = None,
+        end: pd.Timestamp = None,
+        columns: list = None,
+    ) -> pd.DataFrame:
+        """
+        load from the store, first ingesting the rows of csv_path from the last stored candle on
+        whenever the csv was modified since it was last ingested, so an updated csv is picked up
+        """
+        sources_path = os.path.join(self._dir(symbol, timeframe), "sources.json")
+        try:
+            with open(sources_path, "r") as file:
+                sources = json.load(file)
+        except FileNotFoundError:
+            sources = {}
+        source = os.path.abspath(csv_path)
+        mtime_ns = os.stat(source).st_mtime_ns
+        if sources.get(source) != mtime_ns or not self.days(symbol, timeframe):
+            kdf = pd.read_csv(source, index_col=0)
+            kdf.index = pd.to_datetime(kdf.index)
+            last_opentime = self.last_opentime(symbol, timeframe)
+            if last_opentime is not None:
+                # the last stored candle is rewritten too, it may have been unfinished
+                kdf = kdf[kdf.index >= pd.Timestamp(last_opentime, unit="ms")]
+            if len(kdf) > 0:
+                self.ingest(symbol, timeframe, kdf)
+            sources[source] = mtime_ns
+            os.makedirs(os.path.dirname(sources_path), exist_ok=True)
+            with open(sources_path, "w") as file:
+                json.dump(sources, file)
+        return self.load(symbol, timeframe, start, end, columns)
+
+
+if __name__ == "__main__":
+    import time
+
+    store = KlineStore(os.path.join(main_path, "kline_store"))
+    store.ingest_csv("BTCUSDT", "1m", os.path.join(main_path, "production/data/BTCUSDT_1m.csv"))
+    for _ in range(2):
+        start_time = time.time()
+        kdf = store.load("BTCUSD", "1m", start=pd.Timestamp("2024-06-15"), columns=["high", "low", "close"])
+        print(f"{len(kdf)} candles loaded in {(time.time() - start_time) * 1000:.2f} ms")
+    print(kdf.tail())
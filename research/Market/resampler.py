@@ -0,0 +1,135 @@
+import os
+import sys
+
+main_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+sys.path.append(main_path)
+import warnings
+
+warnings.filterwarnings("ignore")
+
+import numpy as np
+import pandas as pd
+from contek_pyutils.time import interval_to_millis
+
+FIRST_COLUMNS = ["open"]
+MAX_COLUMNS = ["high"]
+MIN_COLUMNS = ["low"]
+LAST_COLUMNS = ["close"]
+SUM_COLUMNS = ["volume", "volume_U", "num_trade", "taker_buy", "taker_buy_volume_U"]
+
+
+def resample_klines(
+    kdf: pd.DataFrame, timeframe: str, base_timeframe: str = "1m", complete_only: bool = True
+) -> pd.DataFrame:
+    """
+    aggregate a kdf indexed by opentime into a higher timeframe, buckets aligned to epoch like binance
+    opentimes. With complete_only, buckets missing base candles (e.g. the head and the unfinished
+    tail) are dropped so every candle matches the one fetched from binance.
+    """
+    tf_ms = int(interval_to_millis(timeframe))
+    base_ms = int(interval_to_millis(base_timeframe))
+    if tf_ms % base_ms != 0:
+        raise ValueError(f"{timeframe} is not a multiple of {base_timeframe}")
+    aggregatable = (*FIRST_COLUMNS, *MAX_COLUMNS, *MIN_COLUMNS, *LAST_COLUMNS, *SUM_COLUMNS)
+    columns = [col for col in kdf.columns if col in aggregatable]
+    if len(kdf) == 0:
+        return pd.DataFrame(columns=[*columns, "closetime"], index=pd.DatetimeIndex([], name="opentime"))
+
+    opentime = kdf.index.to_numpy().astype("datetime64[ms]").astype(np.int64)
+    bucket = opentime // tf_ms
+    starts = np.r_[0, np.flatnonzero(np.diff(bucket)) + 1]
+    ends = np.r_[starts[1:], len(bucket)]
+    aggregated = {}
+    for col in columns:
+        values = kdf[col].to_numpy()
+        if col in FIRST_COLUMNS:
+            aggregated[col] = values[starts]
+        elif col in LAST_COLUMNS:
+            aggregated[col] = values[ends - 1]
+        elif col in MAX_COLUMNS:
+            aggregated[col] = np.maximum.reduceat(values, starts)
+        elif col in MIN_COLUMNS:
+            aggregated[col] = np.minimum.reduceat(values, starts)
+        else:
+            aggregated[col] = np.add.reduceat(values, starts)
+
+    bucket_opentime = bucket[starts] * tf_ms
+    if complete_only:
+        complete = (ends - starts) == tf_ms // base_ms
+        bucket_opentime = bucket_opentime[complete]
+        aggregated = {col: values[complete] for col, values in aggregated.items()}
+
+    index = pd.DatetimeIndex(bucket_opentime.astype("datetime64[ms]").astype("datetime64[ns]"), name="opentime")
+    rdf = pd.DataFrame(aggregated, index=index, columns=columns)
+    # closetime floored to seconds the same way KlineGenerator formats binance candles
+    rdf["closetime"] = index + pd.Timedelta(milliseconds=tf_ms) - pd.Timedelta(seconds=1)
+    return rdf
+
+
+class KlineResampler:
+    """
+    Streaming operator deriving higher timeframe candles from finished base candles, so only the
+    base timeframe needs an upstream subscription. The candles of the bucket in progress are kept
+    per symbol and aggregated by resample_klines once the bucket closes, so streaming and batch
+    results are identical.
+    Args:
+        timeframes: list: higher timeframes to derive, e.g. ["5m", "15m", "1h"]
+        base_timeframe: str: timeframe of the candles fed to update
+
+    Usage:
+        resampler = KlineResampler(["5m", "1h"])
+        for timeframe, rdf in resampler.update("BTCUSDT", latest_kdf).items():
+            ...
+    """
+
+    def __init__(self, timeframes: list, base_timeframe: str = "1m") -> None:
+        self.base_timeframe = base_timeframe
+        self.base_ms = int(interval_to_millis(base_timeframe))
+        self.timeframes = {timeframe: int(interval_to_millis(timeframe)) for timeframe in timeframes}
+        self._pending = {}
+
+    def reset(self, symbol: str) -> None:
+        """drop the pending candles of a symbol, e.g. before feeding a full refresh"""
+        for timeframe in self.timeframes:
+            self._pending.pop((symbol, timeframe), None)
+
+    def update(self, symbol: str, kdf: pd.DataFrame) -> dict:
+        """feed finished base candles, return {timeframe: kdf of the candles closed by them}"""
+        closed = {}
+        if len(kdf) == 0:
+            return closed
+        for timeframe, tf_ms in self.timeframes.items():
+            pending = self._pending.get((symbol, timeframe))
+            if pending is not None:
+                kdf_tf = pd.concat([pending, kdf[~kdf.index.isin(pending.index)]]).sort_index()
+            else:
+                kdf_tf = kdf
+            last_opentime = int(kdf_tf.index[-1].value // 1_000_000)
+            if (last_opentime + self.base_ms) % tf_ms == 0:
+                # the last bucket is closed, nothing left pending
+                self._pending.pop((symbol, timeframe), None)
+                closed_kdf = kdf_tf
+            else:
+                bucket_start = pd.Timestamp((last_opentime // tf_ms) * tf_ms, unit="ms")
+                self._pending[(symbol, timeframe)] = kdf_tf[kdf_tf.index >= bucket_start]
+                closed_kdf = kdf_tf[kdf_tf.index < bucket_start]
+            rdf = resample_klines(closed_kdf, timeframe, self.base_timeframe)
+            if len(rdf) > 0:
+                closed[timeframe] = rdf
+        return closed
+
+
+if __name__ == "__main__":
+    import time
+
+    kdf = pd.read_csv(os.path.join(main_path, "production/data/BTCUSDT_1m.csv"), index_col=0)
+    kdf.index = pd.to_datetime(kdf.index)
+    start_time = time.time()
+    batch = resample_klines(kdf, "5m")
+    print(f"Time used to resample {len(kdf)} candles: {time.time() - start_time} seconds")
+
+    resampler = KlineResampler(["5m"])
+    streamed = [resampler.update("BTCUSDT", kdf.iloc[i : i + 1]).get("5m") for i in range(len(kdf))]
+    streamed = pd.concat([rdf for rdf in streamed if rdf is not None])
+    assert streamed.equals(batch)
+    print(batch.tail())
@@ -0,0 +1,379 @@
+import os
+import sys
+import zlib
+
+main_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+sys.path.append(main_path)
+import warnings
+
+warnings.filterwarnings("ignore")
+
+from dataclasses import dataclass
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+from contek_pyutils.time import interval_to_millis
+
+# the columns of KlineGenerator.kline_columns, times in epoch millis like the binance rows
+KLINE_COLUMNS = [
+    "opentime",
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "closetime",
+    "volume_U",
+    "num_trade",
+    "taker_buy",
+    "taker_buy_volume_U",
+    "ignore",
+]
+# bars per chunk of random streams
+CHUNK_BARS = 1 << 20
+AGG_TRADE_DTYPE = np.dtype(
+    [
+        ("agg_id", "i8"),
+        ("price", "f8"),
+        ("qty", "f8"),
+        ("first_id", "i8"),
+        ("last_id", "i8"),
+        ("time", "i8"),
+        ("is_buyer_maker", "?"),
+    ]
+)
+DEPTH_DTYPE = np.dtype([("update_id", "i8"), ("time", "i8"), ("is_bid", "?"), ("price", "f8"), ("qty", "f8")])
+FUNDING_DTYPE = np.dtype([("funding_time", "i8"), ("funding_rate", "f8"), ("mark_price", "f8")])
+
+
+@dataclass(frozen=True)
+class Regime:
+    """
+    A volatility regime of a SyntheticMarket.
+    Args:
+        volatility: float: standard deviation of the log return of a bar
+        mean_bars: float: mean length of the regime in bars, lengths are geometric
+        volume_scale: float: multiplier of the bar volume while the regime lasts
+    """
+
+    volatility: float
+    mean_bars: float
+    volume_scale: float = 1.0
+
+
+class SyntheticMarket:
+    """
+    Deterministic synthetic market of one symbol: klines, aggTrades, depth diffs and funding.
+
+    Log returns are gaussian with the volatility of a regime switching at geometric lengths, plus
+    poisson jumps of laplace size. Volume follows the volatility and the size of the move, the
+    taker buy share follows its sign. Gaps drop runs of bars like an exchange outage, the times of
+    the remaining bars are unchanged. Bars are generated in CHUNK_BARS chunks, each with its own
+    random streams seeded by (seed, quantity, chunk), one per quantity drawn, so the same seed gives
+    the same bars on every machine and the first n bars do not depend on how many are generated.
+    Args:
+        seed: int: seed of the random streams
+        start: str: opentime of the first bar
+        timeframe: str: bar interval, e.g. 1m
+        price: float: open of the first bar
+        regimes: tuple: Regime, the first is the regime of the first bar
+        jump_prob: float: probability of a jump per bar
+        jump_scale: float: mean absolute log size of a jump
+        gap_prob: float: probability of a gap starting at a bar
+        gap_bars: tuple: (min, max) bars of a gap
+        tick_size: float: price tick of the depth
+
+    Usage:
+        market = SyntheticMarket(seed=1)
+        arrays = market.kline_arrays(10_000_000)
+        kdf = market.klines(20_000)
+        market.to_store(KlineStore("kline_store"), "BTCUSDT", 5_000_000)
+    """
+
+    def __init__(
+        self,
+        seed: int = 0,
+        start: str = "2024-01-01",
+        timeframe: str = "1m",
+        price: float = 60000.0,
+        regimes: tuple = (Regime(6e-4, 2880, 1.0), Regime(1.8e-3, 720, 2.5)),
+        jump_prob: float = 2e-4,
+        jump_scale: float = 0.01,
+        gap_prob: float = 2e-5,
+        gap_bars: tuple = (5, 240),
+        tick_size: float = 0.1,
+    ) -> None:
+        self.seed = seed
+        self.start_ms = int(pd.Timestamp(start).value // 1_000_000)
+        self.timeframe = timeframe
+        self.tf_ms = int(interval_to_millis(timeframe))
+        self.price = price
+        self.regimes = regimes
+        self.jump_prob = jump_prob
+        self.jump_scale = jump_scale
+        self.gap_prob = gap_prob
+        self.gap_bars = gap_bars
+        self.tick_size = tick_size
+
+    def _rng(self, stream: str, chunk: int) -> np.random.Generator:
+        return np.random.default_rng([self.seed, zlib.crc32(stream.encode()), chunk])
+
+    def _regime_index(self, rng: np.random.Generator, num_bars: int, regime: int, left: int) -> tuple:
+        """regime of every bar of a chunk, continuing a regime with left bars, and the state after it"""
+        index = np.empty(num_bars, dtype=np.int64)
+        filled = 0
+        while filled < num_bars:
+            if left <= 0:
+                if len(self.regimes) > 1:
+                    regime = (regime + rng.integers(1, len(self.regimes))) % len(self.regimes)
+                left = int(rng.geometric(1 / self.regimes[regime].mean_bars))
+            length = min(left, num_bars - filled)
+            index[filled : filled + length] = regime
+            filled += length
+            left -= length
+        return index, regime, left
+
+    def iter_kline_chunks(self, num_bars: int) -> Iterator[dict]:
+        """{column: array} of KLINE_COLUMNS per CHUNK_BARS bars, gaps removed"""
+        volatility = np.array([regime.volatility for regime in self.regimes])
+        volume_scale = np.array([regime.volume_scale for regime in self.regimes])
+        regime, left = 0, int(self._rng("first_regime", 0).geometric(1 / self.regimes[0].mean_bars))
+        last_close = self.price
+        gap_left = 0
+        for chunk, first in enumerate(range(0, num_bars, CHUNK_BARS)):
+            n = min(CHUNK_BARS, num_bars - first)
+            regime_index, regime, left = self._regime_index(self._rng("regime", chunk), n, regime, left)
+            sigma = volatility[regime_index]
+
+            log_returns = self._rng("return", chunk).standard_normal(n) * sigma
+            jumps = self._rng("jump", chunk).random(n) < self.jump_prob
+            log_returns[jumps] += self._rng("jump_size", chunk).laplace(0, self.jump_scale, jumps.sum())
+            close = last_close * np.exp(np.cumsum(log_returns))
+            open_ = np.r_[last_close, close[:-1]]
+            last_close = close[-1]
+            # wicks beyond the body of about half a bar's volatility
+            high = np.maximum(open_, close) * (1 + np.abs(self._rng("high", chunk).standard_normal(n)) * sigma * 0.5)
+            low = np.minimum(open_, close) * (1 - np.abs(self._rng("low", chunk).standard_normal(n)) * sigma * 0.5)
+
+            activity = volume_scale[regime_index] * (1 + np.abs(log_returns) / sigma)
+            size = self._rng("volume", chunk).lognormal(0, 0.6, n) * activity
+            volume = size * 3e5 / self.price
+            num_trade = self._rng("num_trade", chunk).poisson(size * 200) + 1
+            noise = self._rng("buy_share", chunk).normal(0, 0.05, n)
+            buy_share = np.clip(0.5 + 0.25 * np.tanh(log_returns / sigma) + noise, 0.02, 0.98)
+            taker_buy = volume * buy_share
+            mean_price = (open_ + high + low + close) / 4
+
+            opentime = self.start_ms + (first + np.arange(n, dtype=np.int64)) * self.tf_ms
+            arrays = {
+                "opentime": opentime,
+                "open": open_,
+                "high": high,
+                "low": low,
+                "close": close,
+                "volume": volume,
+                "closetime": opentime + self.tf_ms - 1,
+                "volume_U": volume * mean_price,
+                "num_trade": num_trade,
+                "taker_buy": taker_buy,
+                "taker_buy_volume_U": taker_buy * mean_price,
+                "ignore": np.zeros(n),
+            }
+            keep, gap_left = self._gaps(chunk, n, gap_left)
+            if not keep.all():
+                arrays = {col: array[keep] for col, array in arrays.items()}
+            yield arrays
+
+    def _gaps(self, chunk: int, num_bars: int, gap_left: int) -> tuple:
+        """mask of the bars outside gaps, continuing a gap with gap_left bars"""
+        keep = np.ones(num_bars, dtype=bool)
+        keep[:gap_left] = False
+        starts = np.flatnonzero(self._rng("gap", chunk).random(num_bars) < self.gap_prob)
+        lengths = self._rng("gap_length", chunk).integers(self.gap_bars[0], self.gap_bars[1] + 1, len(starts))
+        end = min(gap_left, num_bars)
+        for start, length in zip(starts, lengths):
+            keep[start : start + length] = False
+            end = max(end, start + length)
+        return keep, max(end - num_bars, 0)
+
+    def kline_arrays(self, num_bars: int) -> dict:
+        """{column: array} of KLINE_COLUMNS of num_bars bars minus the gaps"""
+        chunks = list(self.iter_kline_chunks(num_bars))
+        return {col: np.concatenate([chunk[col] for chunk in chunks]) for col in KLINE_COLUMNS}
+
+    @staticmethod
+    def to_frame(arrays: dict) -> pd.DataFrame:
+        """kdf indexed by opentime like KlineStore.load, closetime floored to the second"""
+        index = pd.DatetimeIndex(arrays["opentime"].astype("datetime64[ms]"), name="opentime")
+        kdf = pd.DataFrame({col: arrays[col] for col in KLINE_COLUMNS[1:]}, index=index)
+        kdf["closetime"] = (arrays["closetime"] // 1000 * 1000).astype("datetime64[ms]")
+        return kdf
+
+    def klines(self, num_bars: int) -> pd.DataFrame:
+        return self.to_frame(self.kline_arrays(num_bars))
+
+    def to_store(self, store, symbol: str, num_bars: int) -> None:
+        """ingest num_bars bars into a KlineStore chunk by chunk, bounding the memory"""
+        for arrays in self.iter_kline_chunks(num_bars):
+            store.ingest(symbol, self.timeframe, self.to_frame(arrays))
+
+    def agg_trades(self, arrays: dict, max_trades_per_bar: int = 50) -> np.ndarray:
+        """
+        AGG_TRADE_DTYPE trades of the klines in arrays: per bar up to max_trades_per_bar trades at
+        increasing times inside the bar, starting at the open, touching the high and the low and
+        ending at the close, their quantities summing to the volume and the taker buys to taker_buy
+        """
+        rng = self._rng("agg_trade", int(arrays["opentime"][0] // self.tf_ms))
+        counts = np.clip(arrays["num_trade"], 4, max(max_trades_per_bar, 4)).astype(np.int64)
+        bar = np.repeat(np.arange(len(counts)), counts)
+        starts = np.r_[0, np.cumsum(counts)[:-1]]
+        position = np.arange(len(bar)) - starts[bar]
+        last = position == counts[bar] - 1
+
+        # a bridge from open to close with noise, clipped into [low, high]
+        fraction = (position + 1) / counts[bar]
+        open_, close = arrays["open"][bar], arrays["close"][bar]
+        high, low = arrays["high"][bar], arrays["low"][bar]
+        noise = rng.standard_normal(len(bar)) * (high - low) * 0.25 * np.sqrt(fraction * (1 - fraction))
+        price = np.clip(open_ + (close - open_) * fraction + noise, low, high)
+        price[starts] = open_[starts]
+        price[starts + 1] = high[starts + 1]
+        price[starts + 2] = low[starts + 2]
+        price[last] = close[last]
+        price = np.round(price / self.tick_size) * self.tick_size
+
+        weights = rng.exponential(1.0, len(bar))
+        bar_weight = np.add.reduceat(weights, starts)
+        is_buy = rng.random(len(bar)) < (arrays["taker_buy"] / arrays["volume"])[bar]
+        buy_weight = np.add.reduceat(np.where(is_buy, weights, 0), starts)
+        sell_weight = bar_weight - buy_weight
+        # scale the buys to taker_buy and the sells to the rest, a bar with one side only scales to the volume
+        buy_scale = np.where(buy_weight > 0, arrays["taker_buy"] / np.where(buy_weight > 0, buy_weight, 1), 0)
+        sell_scale = np.where(
+            sell_weight > 0, (arrays["volume"] - arrays["taker_buy"]) / np.where(sell_weight > 0, sell_weight, 1), 0
+        )
+        empty = (buy_weight == 0) | (sell_weight == 0)
+        buy_scale[empty] = sell_scale[empty] = (arrays["volume"] / bar_weight)[empty]
+        qty = weights * np.where(is_buy, buy_scale[bar], sell_scale[bar])
+
+        slot = (position + rng.random(len(bar))) / counts[bar]
+        time = arrays["opentime"][bar] + (slot * (self.tf_ms - 1)).astype(np.int64)
+
+        raw_trades = rng.integers(1, 4, len(bar))
+        last_id = np.cumsum(raw_trades)
+        trades = np.empty(len(bar), dtype=AGG_TRADE_DTYPE)
+        trades["agg_id"] = np.arange(len(bar))
+        trades["price"] = price
+        trades["qty"] = qty
+        trades["first_id"] = last_id - raw_trades + 1
+        trades["last_id"] = last_id
+        trades["time"] = time
+        trades["is_buyer_maker"] = ~is_buy
+        return trades
+
+    def depth_diffs(self, arrays: dict, levels: int = 20, updates_per_bar: int = 4) -> tuple:
+        """
+        (snapshot, diffs) of a depth book following the closes of the klines in arrays: the snapshot
+        is the DEPTH_DTYPE book before the first update, every update sets the quantity of its levels
+        levels per side and zeroes the levels that left the window, like a depthUpdate stream
+        """
+        rng = self._rng("depth", int(arrays["opentime"][0] // self.tf_ms))
+        num_updates = len(arrays["close"]) * updates_per_bar
+        bar = np.arange(num_updates) // updates_per_bar
+        step = (np.arange(num_updates) % updates_per_bar + 1) / updates_per_bar
+        open_, close = arrays["open"][bar], arrays["close"][bar]
+        mid = open_ + (close - open_) * step
+        time = arrays["opentime"][bar] + (step * (self.tf_ms - 1)).astype(np.int64)
+        best_bid = np.floor(mid / self.tick_size).astype(np.int64)
+        update_id = np.cumsum(rng.integers(1, 20, num_updates)) + 1_000_000
+
+        offsets = np.arange(levels)
+        bid_ticks = best_bid[:, None] - offsets
+        ask_ticks = best_bid[:, None] + 1 + offsets
+        # deeper levels hold more
+        bid_qty = rng.exponential(1.0, (num_updates, levels)) * (1 + offsets) * 0.05
+        ask_qty = rng.exponential(1.0, (num_updates, levels)) * (1 + offsets) * 0.05
+
+        # levels of the previous update outside the new window are removed
+        previous = np.r_[best_bid[0], best_bid[:-1]]
+        prev_bids = previous[:, None] - offsets
+        prev_asks = previous[:, None] + 1 + offsets
+        bid_gone = (prev_bids > best_bid[:, None]) | (prev_bids <= best_bid[:, None] - levels)
+        ask_gone = (prev_asks <= best_bid[:, None]) | (prev_asks > best_bid[:, None] + levels)
+
+        row = np.arange(num_updates)[:, None]
+        parts = [
+            (np.broadcast_to(row, bid_ticks.shape), True, bid_ticks, bid_qty),
+            (np.broadcast_to(row, ask_ticks.shape), False, ask_ticks, ask_qty),
+            (np.broadcast_to(row, prev_bids.shape)[bid_gone], True, prev_bids[bid_gone], 0.0),
+            (np.broadcast_to(row, prev_asks.shape)[ask_gone], False, prev_asks[ask_gone], 0.0),
+        ]
+        rows = np.concatenate([np.ravel(part[0]) for part in parts])
+        diffs = np.empty(len(rows), dtype=DEPTH_DTYPE)
+        diffs["update_id"] = update_id[rows]
+        diffs["time"] = time[rows]
+        diffs["is_bid"] = np.concatenate([np.full(np.size(part[0]), part[1]) for part in parts])
+        diffs["price"] = np.concatenate([np.ravel(part[2]) for part in parts]) * self.tick_size
+        diffs["qty"] = np.concatenate([np.broadcast_to(part[3], np.shape(part[2])).ravel() for part in parts])
+        diffs = diffs[np.argsort(diffs["update_id"], kind="stable")]
+
+        snapshot = np.empty(2 * levels, dtype=DEPTH_DTYPE)
+        snapshot["update_id"] = update_id[0] - 1
+        snapshot["time"] = arrays["opentime"][0]
+        snapshot["is_bid"] = np.r_[np.ones(levels, bool), np.zeros(levels, bool)]
+        snapshot["price"] = np.r_[prev_bids[0], prev_asks[0]] * self.tick_size
+        snapshot["qty"] = rng.exponential(1.0, 2 * levels) * np.r_[1 + offsets, 1 + offsets] * 0.05
+        return snapshot, diffs
+
+    def funding(self, arrays: dict, interval_hours: int = 8, interest: float = 1e-4) -> np.ndarray:
+        """
+        FUNDING_DTYPE funding of the klines in arrays every interval_hours, the binance formula on a
+        mean reverting premium that leans with the trend of the interval
+        """
+        interval_ms = interval_hours * 3600 * 1000
+        at = np.flatnonzero(arrays["opentime"] % interval_ms == 0)
+        rng = self._rng("funding", int(arrays["opentime"][0] // interval_ms))
+        mark_price = arrays["open"][at]
+        trend = np.log(mark_price / np.r_[mark_price[0], mark_price[:-1]])
+        premium = np.empty(len(at))
+        level = 0.0
+        for i, (move, shock) in enumerate(zip(trend, rng.normal(0, 2e-4, len(at)))):
+            level = 0.7 * level + 0.05 * move + shock
+            premium[i] = level
+        rates = np.empty(len(at), dtype=FUNDING_DTYPE)
+        rates["funding_time"] = arrays["opentime"][at]
+        rates["funding_rate"] = np.clip(premium + np.clip(interest - premium, -5e-4, 5e-4), -0.0075, 0.0075)
+        rates["mark_price"] = mark_price
+        return rates
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    from research.Market.kline_store import KlineStore
+
+    market = SyntheticMarket(seed=0)
+    for num_bars in (1_000_000, 10_000_000):
+        start = time.perf_counter()
+        arrays = market.kline_arrays(num_bars)
+        elapsed = time.perf_counter() - start
+        print(f"{num_bars} bars ({len(arrays['close'])} after gaps) in {elapsed:.2f}s, {num_bars / elapsed / 1e6:.1f}M bars/s")
+    assert np.array_equal(market.kline_arrays(1000)["close"], arrays["close"][:1000])
+
+    day = {col: array[:1440] for col, array in arrays.items()}
+    start = time.perf_counter()
+    trades = market.agg_trades(day)
+    snapshot, diffs = market.depth_diffs(day)
+    funding = market.funding(day)
+    print(
+        f"one day: {len(trades)} aggTrades, {len(diffs)} depth diffs, {len(funding)} fundings "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+
+    with tempfile.TemporaryDirectory() as root:
+        start = time.perf_counter()
+        market.to_store(KlineStore(root), "BTCUSDT", 2_000_000)
+        kdf = KlineStore(root).load("BTCUSDT", "1m")
+        print(f"stored {len(kdf)} bars in {time.perf_counter() - start:.2f}s")
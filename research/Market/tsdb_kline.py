@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import os
+import sys
+
+main_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+sys.path.append(main_path)
+import warnings
+
+warnings.filterwarnings("ignore")
+
+import pandas as pd
+import yaml
+from contek_pyutils.async_tsdb_client import AsyncTsdbClient
+from contek_pyutils.time import interval_to_millis, to_epoch_millis
+from psycopg import sql
+from research.Market.universe import MarketUniverse
+
+
+class TsdbKlineReader:
+    """
+    Loads klines persisted by the tsdb sink into the kdf layout of test_data csv files,
+    streaming them through AsyncTsdbClient.iter_arrays (binary COPY) instead of fetchall.
+    load runs its own event loop for synchronous callers like the alphas, load_async is for
+    callers already in one. Each load opens a client of its own loop and closes it after.
+    Args:
+        tsdb_config: dict: AsyncTsdbClient kwargs, e.g. the tsdb section of config.yaml
+    """
+
+    table = "kline"
+    kline_columns = [
+        "open",
+        "high",
+        "low",
+        "close",
+        "volume",
+        "volume_U",
+        "num_trade",
+        "taker_buy",
+        "taker_buy_volume_U",
+    ]
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, tsdb_config: dict) -> None:
+        self.tsdb_config = tsdb_config
+
+    @classmethod
+    def from_config(cls, rel_path="/production/config.yaml") -> "TsdbKlineReader":
+        with open(main_path + rel_path, "r") as stream:
+            config = yaml.safe_load(stream)
+        tsdb_config = dict(config["tsdb"])
+        tsdb_config.pop("sink", None)
+        return cls(tsdb_config)
+
+    def load(
+        self,
+        symbol: str,
+        timeframe: str,
+        start: pd.Timestamp = None,
+        end: pd.Timestamp = None,
+        columns: list = None,
+    ) -> pd.DataFrame:
+        """load klines of [start, end) for a pair or exchange symbol, all kline columns by default"""
+        return asyncio.run(self.load_async(symbol, timeframe, start, end, columns))
+
+    async def load_async(
+        self,
+        symbol: str,
+        timeframe: str,
+        start: pd.Timestamp = None,
+        end: pd.Timestamp = None,
+        columns: list = None,
+    ) -> pd.DataFrame:
+        columns = columns or self.kline_columns
+        c_symbol = str(MarketUniverse.canonical(symbol))
+        conditions = [sql.SQL("interval = %s"), sql.SQL("c_symbol = %s")]
+        params = [timeframe, c_symbol]
+        if start is not None:
+            conditions.append(sql.SQL("time >= %s"))
+            params.append(to_epoch_millis(pd.Timestamp(start)))
+        if end is not None:
+            conditions.append(sql.SQL("time < %s"))
+            params.append(to_epoch_millis(pd.Timestamp(end)))
+        query = sql.SQL("SELECT {} FROM {} WHERE {} ORDER BY time").format(
+            sql.SQL(", ").join(sql.Identifier(col) for col in ["time", *columns]),
+            sql.Identifier(self.table),
+            sql.SQL(" AND ").join(conditions),
+        )
+        client = AsyncTsdbClient(**self.tsdb_config)
+        try:
+            arrays = await client.query_arrays(query, params)
+        finally:
+            await client.close()
+        if len(arrays.get("time", [])) == 0:
+            self.logger.warning(f"{c_symbol} {timeframe} klines not found in {self.table}")
+            return pd.DataFrame(columns=columns)
+
+        opentime = pd.DatetimeIndex(arrays.pop("time").astype("datetime64[ms]"), name="opentime")
+        kdf = pd.DataFrame(arrays, index=opentime)
+        if "num_trade" in kdf:
+            kdf["num_trade"] = kdf["num_trade"].astype(int)
+        timeframe_delta = pd.Timedelta(milliseconds=interval_to_millis(timeframe))
+        kdf["closetime"] = opentime + timeframe_delta - pd.Timedelta(seconds=1)
+        return kdf
+
+
+if __name__ == "__main__":
+    import time
+
+    reader = TsdbKlineReader.from_config()
+    start_time = time.time()
+    kdf = reader.load("BTCUSD", "1m", start=pd.Timestamp("2024-05-10"), end=pd.Timestamp("2024-06-10"))
+    print(kdf.tail())
+    print(f"Time used to load {len(kdf)} candles: {time.time() - start_time} seconds")
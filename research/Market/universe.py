@@ -0,0 +1,156 @@
+import itertools
+import logging
+import os
+import sys
+
+main_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+sys.path.append(main_path)
+import warnings
+
+warnings.filterwarnings("ignore")
+
+import numpy as np
+import pandas as pd
+from contek_pyutils.symbol import CanonicalSymbol, Universe
+
+# one id space for every CanonicalSymbol created in this process
+_cid_counter = itertools.count(0, 1)
+
+
+class MarketUniverse:
+    """
+    Market universe addresses instruments by CanonicalSymbol (e.g. BTCUSD) instead of
+    exchange strings, so panels, caches and shared-memory buffers can be indexed by
+    dense integer ids.
+    Args:
+        pairs: list: canonical pairs or exchange symbols, e.g. ["BTCUSD"] or ["BTCUSDT"]
+        quote: str: settlement quote used to build exchange symbols, USDT or USDC
+
+    Attributes:
+        universe: Universe: symbols of the universe mapped to their dense ids
+    """
+
+    base_url = "https://fapi.binance.com"
+    quotes = ("USDT", "USDC")
+    ticker_columns = [
+        "symbol",
+        "price_change",
+        "price_change_percent",
+        "weighted_avg_price",
+        "last_price",
+        "last_qty",
+        "open_price",
+        "high_price",
+        "low_price",
+        "volume",
+        "quote_volume",
+        "open_time",
+        "close_time",
+        "first_id",
+        "last_id",
+        "count",
+    ]
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, pairs: list, quote: str = "USDT") -> None:
+        if quote not in self.quotes:
+            raise ValueError(f"Unsupported quote {quote}")
+        self.quote = quote
+        self.universe = self._build_universe(pairs)
+
+    @classmethod
+    def canonical(cls, symbol) -> CanonicalSymbol:
+        """convert a pair or an exchange symbol to its CanonicalSymbol"""
+        if isinstance(symbol, CanonicalSymbol):
+            return symbol
+        for quote in cls.quotes:
+            if symbol.endswith(quote):
+                symbol = symbol[: -len(quote)] + "USD"
+                break
+        return CanonicalSymbol(symbol, _cid_counter)
+
+    def _build_universe(self, pairs: list) -> Universe:
+        canonical_symbols = [self.canonical(pair) for pair in pairs]
+        return Universe.get([str(cs) for cs in canonical_symbols])
+
+    @property
+    def symbols(self) -> list:
+        """canonical symbols ordered by their dense id"""
+        return sorted(self.universe, key=self.universe.__getitem__)
+
+    def __len__(self) -> int:
+        return len(self.universe)
+
+    def __iter__(self):
+        return iter(self.symbols)
+
+    def __contains__(self, symbol) -> bool:
+        return self.canonical(symbol) in self.universe
+
+    def id(self, symbol) -> int:
+        """dense id of a pair or exchange symbol inside the universe"""
+        return self.universe[self.canonical(symbol)]
+
+    def exchange_symbol(self, symbol, quote: str = None) -> str:
+        canonical = str(self.canonical(symbol))
+        return canonical.removesuffix("USD") + (quote or self.quote)
+
+    def exchange_symbols(self, quote: str = None) -> list:
+        return [self.exchange_symbol(cs, quote) for cs in self.symbols]
+
+    def get_24h_ticker(self) -> pd.DataFrame:
+        import requests
+
+        url = f"{self.base_url}/fapi/v1/ticker/24hr"
+        res = requests.get(url, timeout=10)
+        ticker = pd.DataFrame(res.json())
+        ticker.columns = self.ticker_columns
+        numeric_columns = self.ticker_columns[1:11]
+        ticker[numeric_columns] = ticker[numeric_columns].astype(float)
+        ticker["open_time"] = pd.to_datetime(ticker["open_time"], unit="ms")
+        ticker["close_time"] = pd.to_datetime(ticker["close_time"], unit="ms")
+        ticker = ticker.astype({"first_id": int, "last_id": int, "count": int})
+
+        return ticker
+
+    def qualified_symbols(self, ticker: pd.DataFrame, top_n: int = 5) -> list:
+        """symbols ranking top_n both by quote volume and by price change"""
+        ticker = ticker[ticker["symbol"].str.endswith(self.quote)]
+        volume_rank = ticker["quote_volume"].rank(ascending=False, method="first")
+        change_rank = ticker["price_change_percent"].rank(ascending=False, method="first")
+        qualified = ticker["symbol"][(volume_rank <= top_n) & (change_rank <= top_n)]
+        return qualified.tolist()
+
+    def refresh(self, top_n: int = 5) -> bool:
+        """rebuild the universe from 24h ticker stats fetched in one batched call"""
+        try:
+            ticker = self.get_24h_ticker()
+        except Exception as error:
+            self.logger.error(error)
+            return False
+        symbols = self.qualified_symbols(ticker, top_n)
+        if len(symbols) == 0:
+            self.logger.warning("No qulified ticker found.")
+            return False
+        self.universe = self._build_universe(symbols)
+        self.logger.info(f"Universe refreshed: {self.exchange_symbols()}")
+        return True
+
+    def panel(self, market: dict, columns: list) -> np.ndarray:
+        """stack kline frames into an array of shape (symbols, bars, columns) indexed by dense id"""
+        frames = {self.id(symbol): kdf for symbol, kdf in market.items() if symbol in self}
+        if len(frames) != len(self):
+            raise ValueError("Market does not cover every symbol of the universe")
+        num_bars = min(len(kdf) for kdf in frames.values())
+        panel = np.empty((len(self), num_bars, len(columns)), dtype=np.float64)
+        for symbol_id, kdf in frames.items():
+            panel[symbol_id] = kdf[columns].to_numpy(dtype=np.float64)[-num_bars:]
+        return panel
+
+
+if __name__ == "__main__":
+    market_universe = MarketUniverse(["BTCUSD", "ETHUSD", "SOLUSD"])
+    print(market_universe.symbols, market_universe.exchange_symbols("USDC"))
+    print(market_universe.id("ETHUSDT"), market_universe.id("ETHUSDC"))
+    market_universe.refresh()
+    print(market_universe.exchange_symbols())
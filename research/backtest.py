@@ -1,8 +1,28 @@
 import pandas as pd
 import numpy as np
 
+# keys of calculate_performance, also the metric order of the batched strategy kernels
+PERFORMANCE_METRICS = (
+    "net_value",
+    "win_ratio",
+    "single_avg_wlr",
+    "total_trades",
+    "return",
+    "max_drawdown",
+    "t_sharpe",
+    "commission",
+    "score",
+)
+
 
 class BacktestFramework:
+    # called with the performance so far at its checkpoints of get_result, see research.pruning
+    reporter = None
+
+    def _checkpoint(self, portfolio: pd.DataFrame, i: int) -> None:
+        """after candle i of get_result, report the performance of the candles so far if it is a checkpoint"""
+        if self.reporter is not None and self.reporter.is_checkpoint(i, len(portfolio)):
+            self.reporter(self.calculate_performance(portfolio.iloc[: i + 1]))
 
     def initialize_portfolio_variables(self, kdf: pd.DataFrame) -> pd.DataFrame:
         portfolio = kdf[["open", "high", "low", "close", "volume_U"]]
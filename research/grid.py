@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+import sys
+import os
+
+main_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+sys.path.append(main_path)
+import warnings
+
+warnings.filterwarnings("ignore")
+
+import json
+import logging
+import math
+import multiprocessing
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from research.backtest import PERFORMANCE_METRICS
+
+REDUCERS = {
+    "mean": np.nanmean,
+    "median": np.nanmedian,
+    "max": np.nanmax,
+    "min": np.nanmin,
+    "std": np.nanstd,
+}
+
+
+def axis_values(low, high, step) -> list:
+    """values of a (low, high, step) search space entry, the choices of optuna suggest_int / suggest_float"""
+    if all(isinstance(bound, int) for bound in (low, high, step)):
+        return list(range(low, high + 1, step))
+    num = int(math.floor((high - low) / step + 1e-9)) + 1
+    return [round(low + i * step, 10) for i in range(num)]
+
+
+def _position(values: np.ndarray, value) -> int:
+    matches = np.flatnonzero(np.isclose(values, value))
+    if len(matches) == 0:
+        raise KeyError(f"{value} is not on the axis {values.tolist()}")
+    return int(matches[0])
+
+
+class ScoreSurface:
+    """
+    Performance metrics of a parameter grid as N-d arrays with one dimension per param, for
+    sensitivity heatmaps and robustness checks of the optimized params.
+    Args:
+        axes: dict: {param: values} in the order of the array dimensions
+        metrics: dict: {metric: array shaped by the axes}
+        attrs: dict: json-able description of the grid, e.g. alpha, symbol and candles
+
+    Usage:
+        surface = ScoreSurface.load("result_book/alp_adx_stochrsi_BTCUSDT_grid.npz")
+        surface.best("t_sharpe", top=10)
+        # t_sharpe over tp_atr x sl_atr around an optimum, averaged over the other signal params
+        surface.slice(adx_len=27, stoch_len=45).marginalize(["rsi_len", "kd"]).table("t_sharpe")
+    """
+
+    def __init__(self, axes: dict, metrics: dict, attrs: dict = None) -> None:
+        self.axes = {name: np.asarray(values) for name, values in axes.items()}
+        self.metrics = metrics
+        self.attrs = attrs or {}
+        shape = self.shape
+        for metric, values in metrics.items():
+            if values.shape != shape:
+                raise ValueError(f"{metric} has shape {values.shape}, the axes have {shape}")
+
+    @property
+    def shape(self) -> tuple:
+        return tuple(len(values) for values in self.axes.values())
+
+    @property
+    def size(self) -> int:
+        return int(np.prod(self.shape))
+
+    def __repr__(self) -> str:
+        axes = ", ".join(f"{name}={len(values)}" for name, values in self.axes.items())
+        return f"ScoreSurface({axes}; {', '.join(self.metrics)})"
+
+    def save(self, path: str) -> None:
+        """one compressed npz holding the axes, the metric arrays and the attrs"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        arrays = {f"axis__{name}": values for name, values in self.axes.items()}
+        arrays.update({f"metric__{name}": values for name, values in self.metrics.items()})
+        np.savez_compressed(
+            path,
+            axes=np.array(list(self.axes)),
+            attrs=np.array(json.dumps(self.attrs, default=str)),
+            **arrays,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "ScoreSurface":
+        with np.load(path) as data:
+            axes = {name: data[f"axis__{name}"] for name in data["axes"].tolist()}
+            metrics = {key[len("metric__") :]: data[key] for key in data.files if key.startswith("metric__")}
+            attrs = json.loads(data["attrs"].item())
+        return cls(axes, metrics, attrs)
+
+    def slice(self, **fixed) -> "ScoreSurface":
+        """the surface at fixed param values, dropping their axes"""
+        unknown = [name for name in fixed if name not in self.axes]
+        if unknown:
+            raise KeyError(f"{unknown} are not axes of {self!r}")
+        index = tuple(
+            _position(values, fixed[name]) if name in fixed else slice(None) for name, values in self.axes.items()
+        )
+        axes = {name: values for name, values in self.axes.items() if name not in fixed}
+        metrics = {metric: values[index] for metric, values in self.metrics.items()}
+        return ScoreSurface(axes, metrics, {**self.attrs, "fixed": {**self.attrs.get("fixed", {}), **fixed}})
+
+    def marginalize(self, axes: list, how: str = "mean") -> "ScoreSurface":
+        """reduce the metrics over axes with mean, median, max, min or std, ignoring nan"""
+        if how not in REDUCERS:
+            raise ValueError(f"how must be one of {list(REDUCERS)}, got {how}")
+        unknown = [name for name in axes if name not in self.axes]
+        if unknown:
+            raise KeyError(f"{unknown} are not axes of {self!r}")
+        dims = tuple(i for i, name in enumerate(self.axes) if name in axes)
+        with warnings.catch_warnings():
+            # all nan slices, e.g. t_sharpe without trades
+            warnings.simplefilter("ignore", RuntimeWarning)
+            metrics = {metric: REDUCERS[how](values, axis=dims) for metric, values in self.metrics.items()}
+        kept = {name: values for name, values in self.axes.items() if name not in axes}
+        return ScoreSurface(kept, metrics, {**self.attrs, "marginalized": {name: how for name in axes}})
+
+    def table(self, metric: str = "score") -> pd.DataFrame:
+        """2-d surface as a heatmap table, the first axis as index and the second as columns"""
+        if len(self.axes) != 2:
+            raise ValueError(f"table needs 2 axes, slice or marginalize {self!r} first")
+        (row, rows), (col, cols) = self.axes.items()
+        table = pd.DataFrame(self.metrics[metric], index=rows, columns=cols)
+        table.index.name = row
+        table.columns.name = col
+        return table
+
+    def best(self, metric: str = "score", top: int = 10) -> pd.DataFrame:
+        """the top param combinations by metric with all their metrics"""
+        values = np.nan_to_num(self.metrics[metric].ravel(), nan=-np.inf)
+        order = np.argsort(-values, kind="stable")[:top]
+        index = np.unravel_index(order, self.shape)
+        rows = {name: self.axes[name][i] for name, i in zip(self.axes, index)}
+        rows.update({name: values.ravel()[order] for name, values in self.metrics.items()})
+        return pd.DataFrame(rows)
+
+
+# per process state of GridSearch, set once by _init_worker instead of pickled with every chunk
+_worker = {}
+
+
+def _init_worker(alpha, kdf, signal_axes, exit_values, cache_size) -> None:
+    _worker.update(
+        alpha=alpha,
+        kdf=kdf,
+        signal_axes=signal_axes,
+        exit_values=exit_values,
+        cache_size=cache_size,
+        cache=OrderedDict(),
+    )
+
+
+def _cached_indicators(nodes: dict) -> dict:
+    """compute_indicators with a least recently used cache bounded to cache_size nodes"""
+    cache = _worker["cache"]
+    indicators = {}
+    for name, node in nodes.items():
+        if node in cache:
+            cache.move_to_end(node)
+        else:
+            cache[node] = node.compute(_worker["kdf"])
+        indicators[name] = cache[node]
+    while len(cache) > _worker["cache_size"]:
+        cache.popitem(last=False)
+    return indicators
+
+
+def _evaluate_chunk(bounds: tuple) -> tuple:
+    """(start, metrics of the signal combinations start..stop, shaped (combos, exit combos, metrics))"""
+    start, stop = bounds
+    alpha = _worker["alpha"]
+    names = list(_worker["signal_axes"])
+    shape = tuple(len(values) for values in _worker["signal_axes"].values())
+    block = np.empty((stop - start, len(next(iter(_worker["exit_values"].values()))), len(PERFORMANCE_METRICS)))
+    for j, flat in enumerate(range(start, stop)):
+        index = np.unravel_index(flat, shape)
+        params = {name: _worker["signal_axes"][name][i] for name, i in zip(names, index)}
+        indicators = _cached_indicators(alpha._indicator_nodes(**params))
+        signal = alpha.signal_frame(_worker["kdf"], indicators)
+        performance = alpha.grid_performance(signal, **_worker["exit_values"])
+        block[j] = np.column_stack([performance[metric] for metric in PERFORMANCE_METRICS])
+    return start, block
+
+
+class GridSearch:
+    """
+    Full grid evaluation of an alpha's search space on one symbol. The signal params (all but
+    alpha.exit_params) are enumerated by worker processes, each signal combination computes its
+    indicators through a per process cache and builds its signal frame once, then the batched
+    strategy scores every exit param combination on that frame in one compiled pass.
+    Args:
+        alpha: registered alpha with search_space, exit_params, _indicator_nodes(**signal params),
+            signal_frame(kdf, indicators) and grid_performance(signal, **exit param arrays)
+        symbol: str: symbol of the kdf
+        axes: dict: {param: values} replacing the search space values of some params
+        processes: int: worker processes, 1 evaluates in this process
+        cache_size: int: indicator values kept per process
+
+    Attributes:
+        axes: dict: {param: values} of the grid, in search space order
+        signal_axes: dict: the axes determining the signal
+        exit_axes: dict: the axes evaluated in one batch per signal
+
+    Usage:
+        alpha = create_alpha("alp_adx_stochrsi", money=2000, leverage=5, params={})
+        grid = GridSearch(alpha, "BTCUSDT", axes={"kd": [3]}, processes=8)
+        surface = grid.run(kdf)
+        surface.save("result_book/alp_adx_stochrsi_BTCUSDT_grid.npz")
+    """
+
+    logger = logging.getLogger("grid_search")
+
+    def __init__(
+        self, alpha, symbol: str, axes: dict = None, processes: int = None, cache_size: int = 256
+    ) -> None:
+        for attr in ("search_space", "exit_params", "_indicator_nodes", "signal_frame", "grid_performance"):
+            if not hasattr(alpha, attr):
+                raise TypeError(f"{alpha.alpha_name} does not support grid evaluation, missing {attr}")
+        axes = axes or {}
+        unknown = [name for name in axes if name not in alpha.search_space]
+        if unknown:
+            raise KeyError(f"{unknown} are not in the search space of {alpha.alpha_name}")
+        self.alpha = alpha
+        self.symbol = symbol
+        self.axes = {
+            name: list(axes[name]) if name in axes else axis_values(*space)
+            for name, space in alpha.search_space.items()
+        }
+        self.signal_axes = {name: values for name, values in self.axes.items() if name not in alpha.exit_params}
+        self.exit_axes = {name: values for name, values in self.axes.items() if name in alpha.exit_params}
+        self.processes = processes or os.cpu_count()
+        self.cache_size = cache_size
+
+    @property
+    def size(self) -> int:
+        return int(np.prod([len(values) for values in self.axes.values()]))
+
+    def _exit_values(self) -> dict:
+        """exit params of every exit combination as equally long arrays, the last axis varying fastest"""
+        mesh = np.meshgrid(*self.exit_axes.values(), indexing="ij")
+        return {name: values.ravel() for name, values in zip(self.exit_axes, mesh)}
+
+    def _chunks(self, num_signals: int) -> list:
+        # contiguous chunks keep the slow varying indicators cached, several per process balance the load
+        size = max(1, math.ceil(num_signals / (self.processes * 4)))
+        return [(start, min(start + size, num_signals)) for start in range(0, num_signals, size)]
+
+    def run(self, kdf: pd.DataFrame = None) -> ScoreSurface:
+        if kdf is None:
+            kdf = self.alpha._read_kdf_from_csv(self.symbol)
+        signal_shape = tuple(len(values) for values in self.signal_axes.values())
+        exit_shape = tuple(len(values) for values in self.exit_axes.values())
+        num_signals = int(np.prod(signal_shape))
+        exit_values = self._exit_values()
+        chunks = self._chunks(num_signals)
+        self.logger.info(
+            f"{self.alpha.alpha_name} {self.symbol}: {self.size} combinations, {num_signals} signals "
+            f"x {int(np.prod(exit_shape))} exits on {len(kdf)} candles, {self.processes} processes"
+        )
+
+        begin = time.time()
+        scores = np.empty((num_signals, int(np.prod(exit_shape)), len(PERFORMANCE_METRICS)))
+        initargs = (self.alpha, kdf, self.signal_axes, exit_values, self.cache_size)
+        if self.processes == 1:
+            _init_worker(*initargs)
+            results = map(_evaluate_chunk, chunks)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(self.processes, initializer=_init_worker, initargs=initargs)
+            results = pool.imap_unordered(_evaluate_chunk, chunks)
+        try:
+            for done, (start, block) in enumerate(results, 1):
+                scores[start : start + len(block)] = block
+                if done % max(1, len(chunks) // 10) == 0:
+                    self.logger.info(f"{done}/{len(chunks)} chunks in {time.time() - begin:.1f}s")
+        finally:
+            if pool is not None:
+                pool.terminate()
+        elapsed = time.time() - begin
+        self.logger.info(f"{self.size} combinations in {elapsed:.1f}s, {self.size / elapsed:.0f}/s")
+
+        # (signals, exits, metric) -> one array per metric in search space order
+        order = list(self.signal_axes) + list(self.exit_axes)
+        dims = [order.index(name) for name in self.axes]
+        metrics = {
+            metric: scores[:, :, m].reshape(signal_shape + exit_shape).transpose(dims)
+            for m, metric in enumerate(PERFORMANCE_METRICS)
+        }
+        attrs = {
+            "alpha": self.alpha.alpha_name,
+            "symbol": self.symbol,
+            "candles": len(kdf),
+            "start": kdf.index[0],
+            "end": kdf.index[-1],
+        }
+        return ScoreSurface(self.axes, metrics, attrs)
+
+
+if __name__ == "__main__":
+    import contek_timbersaw as timbersaw
+    import research.Alpha.alp_adx_stochrsi_atropen  # registers alp_adx_stochrsi
+    from research.Alpha.registry import create_alpha
+
+    timbersaw.setup()
+    alpha = create_alpha("alp_adx_stochrsi", money=2000, leverage=5, params={})
+    kdf = pd.read_csv(f"{main_path}/production/data/BTCUSDT_1m.csv", index_col="opentime", parse_dates=True)
+    grid = GridSearch(
+        alpha,
+        "BTCUSDT",
+        axes={"stoch_len": [9, 18, 27], "rsi_len": [9, 18, 27], "kd": [3], "adx_len": [9, 18, 27]},
+    )
+    surface = grid.run(kdf)
+    surface.save(f"{main_path}/result_book/alp_adx_stochrsi_BTCUSDT_grid.npz")
+    print(surface)
+    print(surface.best("score", top=5))
+    print(surface.slice(kd=3, stoch_len=9, rsi_len=9, adx_len=9).table("score"))
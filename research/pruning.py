@@ -0,0 +1,69 @@
+"""
+optuna pruning of backtests: strategies hand the performance of the candles so far to a
+TrialReporter at evenly spaced checkpoints of get_result, the reporter reports the target to the
+trial and aborts the backtest with optuna.TrialPruned once the study's pruner gives up on it.
+optuna is only imported by the optimizer, not by the production processes importing the alphas.
+"""
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+
+def make_pruner(config: dict = None):
+    """
+    optuna pruner of an alpha's pruner config, e.g. {"name": "MedianPruner", "n_warmup_steps": 3};
+    the other keys are passed to the pruner class of optuna.pruners, None disables pruning
+    """
+    import optuna
+
+    if config is None:
+        return optuna.pruners.NopPruner()
+    kwargs = dict(config)
+    name = kwargs.pop("name")
+    try:
+        pruner = getattr(optuna.pruners, name)
+    except AttributeError:
+        raise ValueError(f"unknown pruner {name}") from None
+    return pruner(**kwargs)
+
+
+class TrialReporter:
+    """
+    Reports the intermediate target of a backtest to an optuna trial. The steps count over every
+    get_result run of the trial, so a multi symbol backtest reports the checkpoints of each symbol
+    in turn, at the same steps for every trial.
+    Args:
+        trial: optuna.Trial: trial of the objective
+        target: str: reported metric of calculate_performance
+        checkpoints: int: reports per get_result run
+
+    Usage:
+        strategy.reporter = TrialReporter(trial, "t_sharpe", checkpoints=10)
+        portfolio = strategy.get_result(signal)  # raises optuna.TrialPruned when pruned
+    """
+
+    def __init__(self, trial, target: str, checkpoints: int = 10) -> None:
+        self.trial = trial
+        self.target = target
+        self.checkpoints = checkpoints
+        self.step = 0
+
+    def is_checkpoint(self, i: int, num_bars: int) -> bool:
+        """candle i ends a checkpoint, the last candle is left to the objective's final value"""
+        interval = max(num_bars // max(self.checkpoints, 1), 1)
+        return (i + 1) % interval == 0 and i + 1 < num_bars
+
+    def __call__(self, performance: dict) -> None:
+        import optuna
+
+        value = performance[self.target]
+        step = self.step
+        self.step += 1
+        if math.isnan(value):
+            # e.g. t_sharpe before the first trade, nothing to judge yet and optuna pruners prune nan
+            return
+        self.trial.report(value, step)
+        if self.trial.should_prune():
+            logger.debug(f"trial {self.trial.number} pruned at step {step} with {self.target} {value}")
+            raise optuna.TrialPruned(f"{self.target} {value} at step {step}")
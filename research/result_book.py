@@ -0,0 +1,271 @@
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+
+main_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+sys.path.append(main_path)
+import warnings
+
+warnings.filterwarnings("ignore")
+
+import numpy as np
+import pandas as pd
+from contek_pyutils.singleton import Memoized
+
+INDEX_COLUMNS = ("dataset_hash", "params_hash", "params", "created")
+# table of the bootstrap confidence intervals of trials, see research.robustness
+ROBUSTNESS = "robustness"
+
+
+def params_hash(params: dict) -> str:
+    """hash of a params dict, independent of the key order and of int / float / numpy scalar types"""
+    canonical = json.dumps({key: float(value) for key, value in sorted(params.items())}, sort_keys=True)
+    return hashlib.blake2b(canonical.encode(), digest_size=8).hexdigest()
+
+
+def dataset_hash(kdfs: list) -> str:
+    """hash of the klines a study runs on, over the index and the values of every kdf"""
+    digest = hashlib.blake2b(digest_size=8)
+    for kdf in kdfs:
+        digest.update(pd.util.hash_pandas_object(kdf, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def downsample(values, points: int) -> np.ndarray:
+    """points evenly spaced samples of an equity curve, keeping the first and the last value"""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) <= points:
+        return np.concatenate([values, np.full(points - len(values), np.nan)])
+    return values[np.linspace(0, len(values) - 1, points).round().astype(np.int64)]
+
+
+class ResultBook(metaclass=Memoized):
+    """
+    Store of optimization trials: params, performance metrics and a downsampled equity curve per
+    trial, indexed by alpha, dataset hash and params hash. Trials are buffered and written as
+    immutable segments of column files, so concurrent studies never rewrite each other's files and
+    a query only reads the small index and metric columns; equity curves are memory mapped on demand.
+    A trial already in the book for the same alpha, dataset and params is not added again, and
+    get returns its metrics so re-runs of a study skip the backtest.
+    Args:
+        root: str: directory of the book
+        curve_points: int: samples kept of each equity curve
+        flush_every: int: buffered trials written as one segment
+
+    Layout:
+        {root}/{alpha_name}/{segment}/{column}.npy
+        columns: dataset_hash, params_hash, params (json), created (epoch millis), one float64
+            column per metric, equity (float32, trials x curve_points)
+        {root}/{alpha_name}/robustness/{segment}/{column}.npy
+        columns: dataset_hash, params_hash, created and the confidence intervals of the trial,
+            joined to the trial columns by frame and top, the latest run of a trial wins
+
+    Usage:
+        book = ResultBook("result_book")
+        if book.get(alpha_name, data_hash, params) is None:
+            book.add(alpha_name, data_hash, params, performance, portfolio["value"])
+        book.flush()
+        book.top("t_sharpe", 10)
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, root: str, curve_points: int = 512, flush_every: int = 100) -> None:
+        self.root = root
+        self.curve_points = curve_points
+        self.flush_every = flush_every
+        self._pending = {}
+        self._trials = {}
+        self._frames = {}
+
+    def alphas(self) -> list:
+        try:
+            entries = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        return sorted(entry for entry in entries if os.path.isdir(os.path.join(self.root, entry)))
+
+    def _segments(self, alpha_name: str, table: str = "") -> list:
+        table_dir = os.path.join(self.root, alpha_name, table)
+        try:
+            entries = os.listdir(table_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(entry for entry in entries if not entry.startswith(".") and entry != ROBUSTNESS)
+
+    def _read_segment(self, alpha_name: str, segment: str, table: str = "") -> pd.DataFrame:
+        segment_dir = os.path.join(self.root, alpha_name, table, segment)
+        columns = sorted(name[:-4] for name in os.listdir(segment_dir) if name.endswith(".npy"))
+        frame = pd.DataFrame(
+            {column: np.load(os.path.join(segment_dir, f"{column}.npy")) for column in columns if column != "equity"}
+        )
+        frame["segment"] = segment
+        frame["row"] = np.arange(len(frame))
+        return frame
+
+    def _read_table(self, alpha_name: str, table: str = "", keep: str = "first") -> pd.DataFrame:
+        """segments of a table indexed by (dataset_hash, params_hash), one row per trial"""
+        frames = [self._read_segment(alpha_name, segment, table) for segment in self._segments(alpha_name, table)]
+        frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=INDEX_COLUMNS)
+        frame = frame.drop_duplicates(["dataset_hash", "params_hash"], keep=keep)
+        return frame.set_index(["dataset_hash", "params_hash"], drop=False)
+
+    def _trial_frame(self, alpha_name: str) -> pd.DataFrame:
+        """stored trials of an alpha, loaded once"""
+        if alpha_name not in self._trials:
+            self._trials[alpha_name] = self._read_table(alpha_name)
+        return self._trials[alpha_name]
+
+    def _frame(self, alpha_name: str) -> pd.DataFrame:
+        """stored trials of an alpha with the confidence intervals of the trials tested for robustness"""
+        if alpha_name not in self._frames:
+            frame = self._trial_frame(alpha_name)
+            robustness = self._read_table(alpha_name, ROBUSTNESS, keep="last")
+            intervals = [column for column in robustness.columns if column not in (*INDEX_COLUMNS, "segment", "row")]
+            if intervals:
+                frame = frame.join(robustness[intervals])
+            self._frames[alpha_name] = frame
+        return self._frames[alpha_name]
+
+    def reload(self) -> None:
+        """forget the loaded index, e.g. to see the segments flushed by other processes"""
+        self._trials = {}
+        self._frames = {}
+
+    def get(self, alpha_name: str, data_hash: str, params: dict) -> dict:
+        """{metric: value} of a stored or pending trial, None if the params were never evaluated"""
+        key = (data_hash, params_hash(params))
+        for trial in self._pending.get(alpha_name, []):
+            if (trial["dataset_hash"], trial["params_hash"]) == key:
+                return dict(trial["metrics"])
+        frame = self._trial_frame(alpha_name)
+        if key not in frame.index:
+            return None
+        row = frame.loc[key]
+        metrics = [column for column in frame.columns if column not in (*INDEX_COLUMNS, "segment", "row")]
+        return {metric: row[metric] for metric in metrics}
+
+    def add(self, alpha_name: str, data_hash: str, params: dict, performance: dict, equity=None) -> bool:
+        """buffer a trial, False if the book already holds the params on this dataset"""
+        if self.get(alpha_name, data_hash, params) is not None:
+            return False
+        curve = downsample(equity, self.curve_points) if equity is not None else np.full(self.curve_points, np.nan)
+        self._pending.setdefault(alpha_name, []).append(
+            {
+                "dataset_hash": data_hash,
+                "params_hash": params_hash(params),
+                "params": json.dumps(params, default=float),
+                "created": int(time.time() * 1000),
+                "metrics": {metric: float(value) for metric, value in performance.items()},
+                "equity": curve,
+            }
+        )
+        if sum(len(trials) for trials in self._pending.values()) >= self.flush_every:
+            self.flush()
+        return True
+
+    def flush(self) -> None:
+        """write the buffered trials, one new segment per alpha"""
+        for alpha_name, trials in self._pending.items():
+            if not trials:
+                continue
+            metrics = list(dict.fromkeys(metric for trial in trials for metric in trial["metrics"]))
+            arrays = {column: np.array([trial[column] for trial in trials]) for column in INDEX_COLUMNS}
+            for metric in metrics:
+                arrays[metric] = np.array([trial["metrics"].get(metric, np.nan) for trial in trials], dtype=np.float64)
+            arrays["equity"] = np.stack([trial["equity"] for trial in trials]).astype(np.float32)
+            self._write_segment(alpha_name, arrays)
+            self._trials.pop(alpha_name, None)
+            self._frames.pop(alpha_name, None)
+            self.logger.info(f"{alpha_name}: {len(trials)} trials written to {self.root}")
+        self._pending = {}
+
+    def add_robustness(self, alpha_name: str, data_hash: str, results: list) -> None:
+        """store the [(params, {interval: value})] of a robustness run, replacing earlier runs of the trials"""
+        if not results:
+            return
+        columns = list(dict.fromkeys(column for _, intervals in results for column in intervals))
+        arrays = {
+            "dataset_hash": np.array([data_hash] * len(results)),
+            "params_hash": np.array([params_hash(params) for params, _ in results]),
+            "created": np.full(len(results), int(time.time() * 1000)),
+        }
+        for column in columns:
+            arrays[column] = np.array([intervals.get(column, np.nan) for _, intervals in results], dtype=np.float64)
+        self._write_segment(alpha_name, arrays, ROBUSTNESS)
+        self._frames.pop(alpha_name, None)
+        self.logger.info(f"{alpha_name}: confidence intervals of {len(results)} trials written to {self.root}")
+
+    def _write_segment(self, alpha_name: str, arrays: dict, table: str = "") -> str:
+        # written to a hidden directory and renamed, readers never see a partial segment
+        segment = f"{time.time_ns()}_{os.getpid()}"
+        table_dir = os.path.join(self.root, alpha_name, table)
+        tmp_dir = os.path.join(table_dir, f".{segment}")
+        os.makedirs(tmp_dir, exist_ok=True)
+        for column, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{column}.npy"), array)
+        os.replace(tmp_dir, os.path.join(table_dir, segment))
+        return segment
+
+    def frame(self, alpha_name: str = None, data_hash: str = None) -> pd.DataFrame:
+        """stored trials with their params and metrics, of one alpha / dataset or of all of them"""
+        alpha_names = [alpha_name] if alpha_name is not None else self.alphas()
+        frames = [self._frame(name).assign(alpha=name) for name in alpha_names]
+        frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["alpha", *INDEX_COLUMNS])
+        frame = frame[["alpha", *(column for column in frame.columns if column != "alpha")]]
+        if data_hash is not None:
+            frame = frame[frame["dataset_hash"] == data_hash]
+        return frame.reset_index(drop=True)
+
+    def top(self, metric: str = "t_sharpe", n: int = 10, alpha_name: str = None, data_hash: str = None) -> pd.DataFrame:
+        """best n trials by metric across all studies, or of one alpha / dataset"""
+        frame = self.frame(alpha_name, data_hash)
+        if metric not in frame:
+            raise KeyError(f"{metric} is not stored, metrics: {list(frame.columns)}")
+        return frame.sort_values(metric, ascending=False, na_position="last").head(n).reset_index(drop=True)
+
+    def equity(self, alpha_name: str, data_hash: str, params: dict) -> np.ndarray:
+        """downsampled equity curve of a stored trial"""
+        key = (data_hash, params_hash(params))
+        frame = self._trial_frame(alpha_name)
+        if key not in frame.index:
+            raise KeyError(f"{alpha_name} has no trial {params} on dataset {data_hash}")
+        row = frame.loc[key]
+        curves = np.load(os.path.join(self.root, alpha_name, row["segment"], "equity.npy"), mmap_mode="r")
+        return np.asarray(curves[row["row"]])
+
+    def compact(self, alpha_name: str) -> None:
+        """merge the segments of an alpha into one, e.g. after many small flushes"""
+        segments = self._segments(alpha_name)
+        if len(segments) < 2:
+            return
+        frame = self._trial_frame(alpha_name)
+        arrays = {column: frame[column].to_numpy() for column in frame.columns if column not in ("segment", "row")}
+        arrays["params"] = arrays["params"].astype(str)
+        arrays["dataset_hash"] = arrays["dataset_hash"].astype(str)
+        arrays["params_hash"] = arrays["params_hash"].astype(str)
+        arrays["created"] = arrays["created"].astype(np.int64)
+        curves = {
+            segment: np.load(os.path.join(self.root, alpha_name, segment, "equity.npy"), mmap_mode="r")
+            for segment in segments
+        }
+        arrays["equity"] = np.stack([curves[segment][row] for segment, row in zip(frame["segment"], frame["row"])])
+        self._write_segment(alpha_name, arrays)
+        for segment in segments:
+            segment_dir = os.path.join(self.root, alpha_name, segment)
+            for name in os.listdir(segment_dir):
+                os.remove(os.path.join(segment_dir, name))
+            os.rmdir(segment_dir)
+        self._trials.pop(alpha_name, None)
+        self._frames.pop(alpha_name, None)
+        self.logger.info(f"{alpha_name}: {len(segments)} segments compacted, {len(frame)} trials")
+
+
+if __name__ == "__main__":
+    book = ResultBook(os.path.join(main_path, "result_book"))
+    for alpha_name in book.alphas():
+        print(f"{alpha_name}: {len(book.frame(alpha_name))} trials")
+    print(book.top("t_sharpe", 10))
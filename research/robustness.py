@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+import sys
+import os
+
+main_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+sys.path.append(main_path)
+import warnings
+
+warnings.filterwarnings("ignore")
+
+import inspect
+import json
+import logging
+import math
+import multiprocessing
+import time
+
+import numpy as np
+import pandas as pd
+from research.Alpha.registry import compute_indicators
+from research.result_book import ResultBook, dataset_hash, params_hash
+
+INTERVAL_METRICS = ("net_value", "win_ratio", "max_drawdown", "t_sharpe", "score")
+# sample rows held in memory at once, bounds the (samples x rows) arrays of long backtests
+MAX_CHUNK_CELLS = 4_000_000
+
+
+def sample_metrics(dv: np.ndarray, du: np.ndarray, realized: np.ndarray, commission: np.ndarray, initial_value: float) -> dict:
+    """
+    calculate_performance of many resampled paths at once. Each row of the (samples, steps) arrays
+    is one path of value increments dv, unrealized pnl increments du, realized pnl and commission;
+    the value path is initial_value + cumsum(dv)
+    """
+    value = np.cumsum(dv, axis=1)
+    peak = np.maximum.accumulate(np.maximum(value, 0), axis=1)
+    max_drawdown = np.maximum((peak - value).max(axis=1), 0)
+    net_value = value[:, -1] + du.sum(axis=1)
+
+    wins = realized > 0
+    losses = realized < 0
+    total = (wins | losses).sum(axis=1)
+    win = wins.sum(axis=1)
+    loss = losses.sum(axis=1)
+    cumulative_win = np.where(wins, realized, 0).sum(axis=1)
+    cumulative_loss = np.where(losses, realized, 0).sum(axis=1)
+    avg_trade_pnl = net_value / (total + 0.0001)
+    win_ratio = win / (total + 0.0001)
+    sigma_sum = np.where(realized != 0, (realized - avg_trade_pnl[:, None]) ** 2, 0).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_sharpe = net_value / np.sqrt(sigma_sum / (total + 0.0001))
+    return {
+        "net_value": net_value,
+        "win_ratio": win_ratio,
+        "single_avg_wlr": -(cumulative_win / (win + 0.0001)) / (cumulative_loss / (loss + 0.0001) + 0.0001),
+        "total_trades": total,
+        "return": net_value / initial_value,
+        "max_drawdown": max_drawdown,
+        "t_sharpe": t_sharpe,
+        "commission": commission.sum(axis=1) / initial_value,
+        "score": win_ratio * net_value / (max_drawdown + 0.0001),
+    }
+
+
+def _steps(portfolio: pd.DataFrame) -> tuple:
+    """
+    per candle value / unrealized pnl increments, realized pnl and commission of a portfolio, the
+    unrealized pnl, realized pnl and commission of the first candle folded into the first step so
+    the steps add up to the totals of calculate_performance
+    """
+    value = portfolio["value"].to_numpy(dtype=np.float64)
+    unrealized = portfolio["unrealized_pnl"].to_numpy(dtype=np.float64)
+    realized = portfolio["realized_pnl"].to_numpy(dtype=np.float64)
+    commission = portfolio["commission"].to_numpy(dtype=np.float64)
+    du, realized_steps, commission_steps = np.diff(unrealized), realized[1:].copy(), commission[1:].copy()
+    if len(du) > 0:
+        du[0] += unrealized[0]
+        realized_steps[0] += realized[0]
+        commission_steps[0] += commission[0]
+    return np.diff(value), du, realized_steps, commission_steps, value[0]
+
+
+def block_indices(num_steps: int, num_samples: int, block: int, rng: np.random.Generator) -> np.ndarray:
+    """(samples, num_steps) indices of a moving block bootstrap, blocks of block consecutive steps"""
+    block = max(1, min(block, num_steps))
+    num_blocks = math.ceil(num_steps / block)
+    starts = rng.integers(0, num_steps - block + 1, size=(num_samples, num_blocks))
+    return (starts[:, :, None] + np.arange(block)).reshape(num_samples, -1)[:, :num_steps]
+
+
+def _chunked(num_samples: int, num_steps: int) -> list:
+    size = max(1, MAX_CHUNK_CELLS // max(num_steps, 1))
+    return [min(size, num_samples - start) for start in range(0, num_samples, size)]
+
+
+def _concat(chunks: list) -> dict:
+    return {metric: np.concatenate([chunk[metric] for chunk in chunks]) for metric in chunks[0]}
+
+
+def trade_bootstrap(portfolio: pd.DataFrame, num_samples: int, rng: np.random.Generator) -> dict:
+    """
+    {metric: samples} of the closed trades drawn with replacement. The commission is spread evenly
+    over the trades and the drawdown is measured trade to trade, without open position swings
+    """
+    _, _, realized, commission, initial_value = _steps(portfolio)
+    trades = realized[realized != 0]
+    if len(trades) == 0:
+        return {}
+    fee = commission.sum() / len(trades)
+    chunks = []
+    for size in _chunked(num_samples, len(trades)):
+        sampled = trades[rng.integers(0, len(trades), size=(size, len(trades)))]
+        fees = np.full(sampled.shape, fee)
+        chunks.append(sample_metrics(sampled - fees, np.zeros(sampled.shape), sampled, fees, initial_value))
+    return _concat(chunks)
+
+
+def block_bootstrap(portfolio: pd.DataFrame, num_samples: int, block: int, rng: np.random.Generator) -> dict:
+    """{metric: samples} of the candles resampled in blocks, keeping volatility clusters and open positions"""
+    dv, du, realized, commission, initial_value = _steps(portfolio)
+    if len(dv) == 0:
+        return {}
+    chunks = []
+    for size in _chunked(num_samples, len(dv)):
+        index = block_indices(len(dv), size, block, rng)
+        chunks.append(sample_metrics(dv[index], du[index], realized[index], commission[index], initial_value))
+    return _concat(chunks)
+
+
+def resample_klines(kdf: pd.DataFrame, block: int, rng: np.random.Generator) -> pd.DataFrame:
+    """
+    synthetic kdf on the timestamps of kdf: close log returns are block bootstrapped together with
+    the open / high / low of each candle relative to its closes and the other columns
+    """
+    close = kdf["close"].to_numpy(dtype=np.float64)
+    index = block_indices(len(kdf) - 1, 1, block, rng)[0] + 1
+    log_return = np.log(close[1:] / close[:-1])
+    synthetic = kdf.iloc[np.r_[0, index]].copy()
+    synthetic.index = kdf.index
+    closes = close[0] * np.exp(np.r_[0, np.cumsum(log_return[index - 1])])
+    previous = np.r_[close[0], closes[:-1]]
+    source_previous = np.r_[close[0], close[index - 1]]
+    source_close = synthetic["close"].to_numpy(dtype=np.float64)
+    synthetic["open"] = previous * synthetic["open"].to_numpy(dtype=np.float64) / source_previous
+    synthetic["high"] = closes * synthetic["high"].to_numpy(dtype=np.float64) / source_close
+    synthetic["low"] = closes * synthetic["low"].to_numpy(dtype=np.float64) / source_close
+    synthetic["close"] = closes
+    if "closetime" in synthetic:
+        synthetic["closetime"] = kdf["closetime"].to_numpy()
+    return synthetic
+
+
+# per process state of RobustnessTest's path fan-out, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(alpha, kdf, signal_params, exit_params, block) -> None:
+    _worker.update(alpha=alpha, kdf=kdf, signal_params=signal_params, exit_params=exit_params, block=block)
+
+
+def _path_metrics(seed) -> dict:
+    """{metric: [value]} of the trial on one synthetic path, through the batched strategy of the alpha"""
+    alpha = _worker["alpha"]
+    kdf = resample_klines(_worker["kdf"], _worker["block"], np.random.default_rng(seed))
+    indicators = compute_indicators(alpha._indicator_nodes(**_worker["signal_params"]), kdf)
+    signal = alpha.signal_frame(kdf, indicators)
+    exits = {name: [value] for name, value in _worker["exit_params"].items()}
+    return alpha.grid_performance(signal, **exits)
+
+
+def confidence_intervals(samples: dict, metrics: tuple, quantiles: tuple, prefix: str) -> dict:
+    """{prefix_metric_pXX: quantile} of the finite samples of each metric"""
+    intervals = {}
+    for metric in metrics:
+        values = samples.get(metric, np.empty(0))
+        values = values[np.isfinite(values)]
+        for quantile in quantiles:
+            key = f"{prefix}_{metric}_p{round(quantile * 100):02d}"
+            intervals[key] = float(np.quantile(values, quantile)) if len(values) else np.nan
+    return intervals
+
+
+class RobustnessTest:
+    """
+    Distribution of the performance of a trial beyond its single backtest path:
+        trades: closed trades bootstrapped with replacement
+        blocks: candles block bootstrapped, keeping open positions and volatility clusters
+        paths: the strategy rerun on synthetic klines resampled from the backtest klines, only for
+            single symbol alphas with a batched strategy (see research.grid), fanned out to processes
+    The bootstraps recompute calculate_performance for all samples at once with numpy, and the
+    quantiles of each metric are stored next to the trial in the result book.
+    Args:
+        alpha: registered alpha instance
+        num_samples: int: bootstrap samples of trades and blocks
+        num_paths: int: synthetic paths
+        block: int: candles per bootstrap block
+        quantiles: tuple: reported quantiles
+        processes: int: processes of the synthetic paths
+        seed: int: seed of all resampling, runs are reproducible
+
+    Usage:
+        test = RobustnessTest(create_alpha("alp_adx_stochrsi", money=2000, leverage=5, params={}))
+        intervals = test.run(params)
+        test.run_study(metric="t_sharpe", top=10)  # top trials of the result book, stored back
+    """
+
+    logger = logging.getLogger("robustness")
+
+    def __init__(
+        self,
+        alpha,
+        num_samples: int = 2000,
+        num_paths: int = 200,
+        block: int = 60,
+        quantiles: tuple = (0.05, 0.5, 0.95),
+        processes: int = None,
+        seed: int = 0,
+        book: ResultBook = None,
+    ) -> None:
+        self.alpha = alpha
+        self.num_samples = num_samples
+        self.num_paths = num_paths
+        self.block = block
+        self.quantiles = quantiles
+        self.processes = processes or os.cpu_count()
+        self.seed = seed
+        self.book = book or ResultBook("result_book")
+        self._klines = None
+
+    def klines(self) -> dict:
+        """{symbol: kdf} the alpha backtests on"""
+        if self._klines is None:
+            if hasattr(self.alpha, "pairs"):
+                self._klines = {pair: self.alpha._read_kdf(pair) for pair in self.alpha.pairs}
+            else:
+                self._klines = {symbol: self.alpha._read_kdf_from_csv(symbol) for symbol in self.alpha.symbols}
+        return self._klines
+
+    def _supports_paths(self) -> bool:
+        batched = all(hasattr(self.alpha, attr) for attr in ("exit_params", "signal_frame", "grid_performance"))
+        return batched and len(self.klines()) == 1
+
+    def _paths(self, params: dict, seeds: list) -> dict:
+        (symbol, kdf), = self.klines().items()
+        names = {name: params[f"{symbol}_{name}"] for name in self.alpha.search_space}
+        exit_params = {name: value for name, value in names.items() if name in self.alpha.exit_params}
+        signal_params = {name: value for name, value in names.items() if name not in self.alpha.exit_params}
+        initargs = (self.alpha, kdf, signal_params, exit_params, self.block)
+        if self.processes == 1:
+            _init_worker(*initargs)
+            results = list(map(_path_metrics, seeds))
+        else:
+            with multiprocessing.Pool(self.processes, initializer=_init_worker, initargs=initargs) as pool:
+                results = pool.map(_path_metrics, seeds, chunksize=max(1, len(seeds) // (self.processes * 4)))
+        return _concat(results)
+
+    def run(self, params: dict, metrics: tuple = INTERVAL_METRICS) -> dict:
+        """{method_metric_pXX: value} of a trial"""
+        begin = time.time()
+        portfolio = self.alpha.get_backtest_result(params)
+        # independent streams per method and trial, the same on every run
+        trades_seed, blocks_seed, paths_seed = np.random.SeedSequence([self.seed, int(params_hash(params), 16)]).spawn(3)
+        intervals = {}
+        samples = trade_bootstrap(portfolio, self.num_samples, np.random.default_rng(trades_seed))
+        intervals.update(confidence_intervals(samples, metrics, self.quantiles, "trades"))
+        samples = block_bootstrap(portfolio, self.num_samples, self.block, np.random.default_rng(blocks_seed))
+        intervals.update(confidence_intervals(samples, metrics, self.quantiles, "blocks"))
+        if self.num_paths and self._supports_paths():
+            samples = self._paths(params, paths_seed.spawn(self.num_paths))
+            intervals.update(confidence_intervals(samples, metrics, self.quantiles, "paths"))
+        self.logger.info(f"{self.alpha.alpha_name} {params}: robustness in {time.time() - begin:.1f}s")
+        return intervals
+
+    def run_study(self, metric: str = "t_sharpe", top: int = 10) -> pd.DataFrame:
+        """confidence intervals of the top trials of the alpha on its klines, stored in the result book"""
+        data_hash = dataset_hash(list(self.klines().values()))
+        trials = self.book.top(metric, top, self.alpha.alpha_name, data_hash)
+        if trials.empty:
+            self.logger.warning(f"{self.alpha.alpha_name} has no trials on dataset {data_hash}")
+            return trials
+        results = []
+        for params in trials["params"]:
+            params = json.loads(params)
+            results.append((params, self.run(params)))
+        self.book.add_robustness(self.alpha.alpha_name, data_hash, results)
+        return self.book.top(metric, top, self.alpha.alpha_name, data_hash)
+
+
+if __name__ == "__main__":
+    import argparse
+    import contek_timbersaw as timbersaw
+    import research.Alpha.alp_adx_stochrsi_atropen  # registers alp_adx_stochrsi
+    import research.Alpha.alp_adx_stochrsi_demastd  # registers alp_adx_stochrsi_multiple
+    import research.Alpha.alp_super_vwap_atropen  # registers alp_super_vwap_atropen
+    import research.Alpha.alp_super_vwap_trailing  # registers alp_super_vwap_trailing
+    from research.Alpha.registry import ALPHAS, create_alpha
+
+    parser = argparse.ArgumentParser(description="bootstrap confidence intervals of the top trials of a study")
+    parser.add_argument("alpha", choices=sorted(ALPHAS))
+    parser.add_argument("--metric", default="t_sharpe")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--paths", type=int, default=200)
+    args = parser.parse_args()
+
+    timbersaw.setup()
+    kwargs = {"money": 2000, "leverage": 5}
+    if "params" in inspect.signature(ALPHAS[args.alpha]).parameters:
+        kwargs["params"] = {}
+    test = RobustnessTest(create_alpha(args.alpha, **kwargs), num_samples=args.samples, num_paths=args.paths)
+    print(test.run_study(args.metric, args.top).to_string())
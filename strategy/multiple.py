@@ -148,7 +148,7 @@ class DemaStd(BacktestFramework):
         position = 0
         entry_price = 0
 
-        for index, row in signal.iterrows():
+        for i, (index, row) in enumerate(signal.iterrows()):
             signal = row.signal
             close = row.close
             std = row["std"]
@@ -176,4 +176,5 @@ class DemaStd(BacktestFramework):
                 realized_pnl,
                 commission,
             )
+            self._checkpoint(portfolio, i)
         return portfolio
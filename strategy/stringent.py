@@ -1,8 +1,104 @@
+import numpy as np
 import pandas as pd
 import sys
 
 sys.path.append("/Users/rivachol/Desktop/Rivachol_v2/")
-from research.backtest import BacktestFramework
+from research.backtest import PERFORMANCE_METRICS, BacktestFramework
+from index.jit import njit
+
+
+@njit(cache=True, error_model="numpy")
+def _atr_open_grid(signal, close, atr, sizer, money, comm, tp_atrs, sl_atrs, out):
+    """
+    AtrOpen.get_result followed by calculate_performance for every (tp_atr, sl_atr) pair, without
+    the portfolio frame: out[k] holds the PERFORMANCE_METRICS of pair k
+    """
+    num_bars = len(close)
+    pnls = np.empty(num_bars)
+    for k in range(len(tp_atrs)):
+        tp_atr = tp_atrs[k]
+        sl_atr = sl_atrs[k]
+        value = money
+        position = 0.0
+        entry_price = 0.0
+        unrealized_pnl = 0.0
+        initial_value = 0.0
+        peak = 0.0
+        max_drawdown = 0.0
+        total = 0
+        win = 0
+        loss = 0
+        cumulative_win = 0.0
+        cumulative_loss = 0.0
+        total_commission = 0.0
+        num_pnls = 0
+        for i in range(num_bars):
+            c = close[i]
+            a = atr[i]
+            realized_pnl = 0.0
+            commission = 0.0
+            if position > 0:
+                unrealized_pnl = (c - entry_price) * position
+                if c < entry_price - a * sl_atr or c > entry_price + a * tp_atr:
+                    realized_pnl = unrealized_pnl
+                    commission = comm * position * c
+                    value += unrealized_pnl - commission
+                    entry_price = 0.0
+                    position = 0.0
+            elif position < 0:
+                unrealized_pnl = (c - entry_price) * position
+                if c < entry_price - a * tp_atr or c > entry_price + a * sl_atr:
+                    realized_pnl = unrealized_pnl
+                    commission = comm * -position * c
+                    value += unrealized_pnl - commission
+                    entry_price = 0.0
+                    position = 0.0
+            else:
+                unrealized_pnl = 0.0
+                if signal[i] == 1 or signal[i] == -1:
+                    entry_price = c
+                    position = sizer[i] if signal[i] == 1 else -sizer[i]
+                    commission = comm * sizer[i] * c
+                    value -= commission
+                else:
+                    entry_price = 0.0
+
+            if i == 0:
+                initial_value = value
+                peak = value
+            peak = max(peak, value)
+            max_drawdown = max(max_drawdown, peak - value)
+            total_commission += commission
+            if realized_pnl > 0:
+                total += 1
+                win += 1
+                cumulative_win += realized_pnl
+            elif realized_pnl < 0:
+                total += 1
+                loss += 1
+                cumulative_loss += realized_pnl
+            if realized_pnl != 0:
+                pnls[num_pnls] = realized_pnl
+                num_pnls += 1
+
+        net_value = value + unrealized_pnl - initial_value
+        avg_trade_pnl = net_value / (total + 0.0001)
+        win_ratio = win / (total + 0.0001)
+        avg_winning = cumulative_win / (win + 0.0001)
+        avg_losing = cumulative_loss / (loss + 0.0001)
+        sigma_sum = 0.0
+        for j in range(num_pnls):
+            sigma_sum += (pnls[j] - avg_trade_pnl) ** 2
+        # same order as PERFORMANCE_METRICS
+        out[k, 0] = net_value
+        out[k, 1] = win_ratio
+        out[k, 2] = -avg_winning / (avg_losing + 0.0001)
+        out[k, 3] = total
+        out[k, 4] = net_value / initial_value
+        out[k, 5] = max_drawdown
+        out[k, 6] = net_value / np.sqrt(sigma_sum / (total + 0.0001))
+        out[k, 7] = total_commission / initial_value
+        out[k, 8] = win_ratio * net_value / (max_drawdown + 0.0001)
 
 
 class AtrOpen(BacktestFramework):
@@ -99,7 +195,7 @@ class AtrOpen(BacktestFramework):
         position = 0
         entry_price = 0
 
-        for index, row in signal.iterrows():
+        for i, (index, row) in enumerate(signal.iterrows()):
             signal = row.signal
             close = row.close
             atr = row.atr
@@ -128,4 +224,30 @@ class AtrOpen(BacktestFramework):
                 realized_pnl,
                 commission,
             )
+            self._checkpoint(portfolio, i)
         return portfolio
+
+    @classmethod
+    def grid_performance(cls, signal: pd.DataFrame, money: float, tp_atr, sl_atr) -> dict:
+        """
+        {metric: array} of calculate_performance(get_result(signal)) for each pair of the equally
+        long tp_atr and sl_atr arrays, computed in one compiled pass per pair for grid searches
+        """
+        tp_atr = np.asarray(tp_atr, dtype=np.float64)
+        sl_atr = np.asarray(sl_atr, dtype=np.float64)
+        close = signal["close"].to_numpy(dtype=np.float64)
+        # python round like _strategy_run, the sizers are shared by all pairs
+        sizer = np.array([round(money / price, 3) for price in close])
+        out = np.empty((len(tp_atr), len(PERFORMANCE_METRICS)))
+        _atr_open_grid(
+            signal["signal"].to_numpy(dtype=np.float64),
+            close,
+            signal["atr"].to_numpy(dtype=np.float64),
+            sizer,
+            float(money),
+            cls.comm,
+            tp_atr,
+            sl_atr,
+            out,
+        )
+        return dict(zip(PERFORMANCE_METRICS, out.T))
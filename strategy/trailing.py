@@ -84,7 +84,7 @@ class DemaTrailing(BacktestFramework):
         position = 0
         entry_price = 0
 
-        for index, row in signal.iterrows():
+        for i, (index, row) in enumerate(signal.iterrows()):
             signal = row.signal
             close = row.close
             dema = row.dema
@@ -109,4 +109,5 @@ class DemaTrailing(BacktestFramework):
                 realized_pnl,
                 commission,
             )
+            self._checkpoint(portfolio, i)
         return portfolio
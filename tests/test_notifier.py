@@ -0,0 +1,178 @@
+import asyncio
+import contextlib
+
+import pytest
+
+from contek_pyutils.notifier import DROP_NEWEST, DiscordNotifier, SlackNotifier
+
+web = pytest.importorskip("aiohttp.web")
+
+
+@contextlib.asynccontextmanager
+async def http_sink(respond=None):
+    """local webhook recording the json of every post, respond(request) may return a custom response"""
+    received = []
+
+    async def handle(request):
+        response = await respond(request) if respond is not None else None
+        if response is not None:
+            return response
+        received.append(await request.json())
+        return web.json_response({"ok": True})
+
+    app = web.Application()
+    app.router.add_post("/webhook", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}/webhook", received
+    finally:
+        await runner.cleanup()
+
+
+def _contents(received: list) -> list:
+    return [line for post in received for line in post["content"].split("\n")]
+
+
+def test_collapses_repeated_messages():
+    async def run():
+        async with http_sink() as (url, received):
+            notifier = DiscordNotifier(url, coalesce_window=60)
+            await notifier.start()
+            for message in ["a", "a", "a", "b", "a"]:
+                notifier.notify(message)
+            await notifier.close()
+        return received, notifier.stats
+
+    received, stats = asyncio.run(run())
+    assert received == [{"content": "a (x3)\nb\na"}]
+    assert stats["messages_sent"] == 3
+    assert stats["posts"] == 1
+
+
+def test_batches_under_destination_limits():
+    class SmallNotifier(DiscordNotifier):
+        max_chars = 20
+        max_messages = 3
+
+    messages = [f"msg {i}" for i in range(10)] + ["x" * 30]
+
+    async def run():
+        async with http_sink() as (url, received):
+            notifier = SmallNotifier(url, coalesce_window=60)
+            await notifier.start()
+            for message in messages:
+                notifier.notify(message)
+            await notifier.close()
+        return received
+
+    received = asyncio.run(run())
+    assert len(received) > 1
+    for post in received:
+        assert len(post["content"]) <= SmallNotifier.max_chars
+        assert len(post["content"].split("\n")) <= SmallNotifier.max_messages
+    assert _contents(received) == messages[:-1] + ["x" * 20]
+
+
+def test_slack_batches_blocks():
+    async def run():
+        async with http_sink() as (url, received):
+            notifier = SlackNotifier("token", "channel", url=url, coalesce_window=60)
+            await notifier.start()
+            for i in range(120):
+                notifier.notify(f"msg {i}")
+            await notifier.close()
+        return received, notifier.stats
+
+    received, stats = asyncio.run(run())
+    assert [len(post["blocks"]) for post in received] == [50, 50, 20]
+    assert stats["messages_sent"] == 120
+
+
+@pytest.mark.parametrize("drop_policy", ["oldest", DROP_NEWEST])
+def test_drop_policy(drop_policy):
+    messages = [f"msg {i}" for i in range(8)]
+
+    async def run():
+        async with http_sink() as (url, received):
+            notifier = DiscordNotifier(url, coalesce_window=60, max_queue=5, drop_policy=drop_policy)
+            await notifier.start()
+            accepted = [notifier.notify(message) for message in messages]
+            await notifier.close()
+        return received, accepted, notifier.stats
+
+    received, accepted, stats = asyncio.run(run())
+    assert stats["messages_dropped"] == 3
+    assert stats["messages_sent"] == 5
+    if drop_policy == DROP_NEWEST:
+        assert accepted == [True] * 5 + [False] * 3
+        assert _contents(received) == messages[:5]
+    else:
+        assert all(accepted)
+        assert _contents(received) == messages[3:]
+
+
+def test_invalid_drop_policy():
+    with pytest.raises(ValueError):
+        DiscordNotifier("http://127.0.0.1/webhook", drop_policy="random")
+
+
+def test_retries_after_rate_limit():
+    num_requests = 0
+
+    async def rate_limit_once(request):
+        nonlocal num_requests
+        num_requests += 1
+        if num_requests == 1:
+            return web.json_response({"message": "rate limited"}, status=429, headers={"Retry-After": "0.1"})
+
+    async def run():
+        async with http_sink(rate_limit_once) as (url, received):
+            notifier = DiscordNotifier(url, coalesce_window=60)
+            await notifier.start()
+            notifier.notify("BTCUSD position 0.1")
+            await notifier.close()
+        return received, notifier.stats
+
+    received, stats = asyncio.run(run())
+    assert num_requests == 2
+    assert received == [{"content": "BTCUSD position 0.1"}]
+    assert stats["posts"] == 1
+    assert stats["posts_failed"] == 0
+    assert stats["messages_sent"] == 1
+
+
+def test_close_waits_for_the_post_in_flight():
+    async def slow(request):
+        await asyncio.sleep(0.3)
+
+    async def run():
+        async with http_sink(slow) as (url, received):
+            notifier = DiscordNotifier(url, coalesce_window=0.05)
+            await notifier.start()
+            notifier.notify("in flight")
+            await asyncio.sleep(0.15)
+            notifier.notify("buffered")
+            await notifier.close()
+        return received, notifier.stats
+
+    received, stats = asyncio.run(run())
+    assert _contents(received) == ["in flight", "buffered"]
+    assert stats["messages_sent"] == 2
+    assert stats["messages_dropped"] == 0
+
+
+def test_thread_flushes_on_stop():
+    async def run():
+        async with http_sink() as (url, received):
+            notifier = DiscordNotifier(url, coalesce_window=60)
+            notifier.start_thread()
+            notifier.notify("from a thread")
+            await asyncio.to_thread(notifier.stop_thread, 5)
+        return received
+
+    received = asyncio.run(run())
+    assert received == [{"content": "from a thread"}]
@@ -0,0 +1,27 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+main_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+# in requirements-research.txt only, production processes must not import them
+RESEARCH_ONLY = ["pandas_ta", "optuna", "matplotlib"]
+
+
+@pytest.mark.parametrize(
+    "module",
+    ["production.kline", "production.model.model_best", "production.model.executor_best", "popinjay_executor"],
+)
+def test_production_imports_without_research_packages(module):
+    code = f"import sys, {module}; print(' '.join(m for m in {RESEARCH_ONLY!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=main_path, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
+
+
+def test_executor_startup_budget():
+    entry_points = ["production.model.model_best", "production.model.executor_best"]
+    command = [sys.executable, "-m", "contek_pyutils.importtime", "--budget", "1.0", "--repeat", "3", *entry_points]
+    result = subprocess.run(command, cwd=main_path, capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout + result.stderr
@@ -0,0 +1,159 @@
+import pytest
+
+from production.binance_execution.reconcile import PositionBook
+
+SYMBOL = "BTCUSDC"
+
+
+def position_risk(amount: float, update_time: int, symbol: str = SYMBOL) -> list:
+    return [
+        {
+            "symbol": symbol,
+            "positionAmt": str(amount),
+            "entryPrice": "100",
+            "unRealizedProfit": "0",
+            "notional": str(amount * 100),
+            "positionSide": "BOTH",
+            "updateTime": update_time,
+        }
+    ]
+
+
+def trade_update(qty: float, trade_time: int, symbol: str = SYMBOL, position_side: str = "BOTH") -> dict:
+    side = "BUY" if qty > 0 else "SELL"
+    return {
+        "e": "ORDER_TRADE_UPDATE",
+        "T": trade_time,
+        "o": {"s": symbol, "S": side, "l": str(abs(qty)), "T": trade_time, "ps": position_side},
+    }
+
+
+def account_update(amount: float, transaction_time: int, symbol: str = SYMBOL) -> dict:
+    return {
+        "e": "ACCOUNT_UPDATE",
+        "E": transaction_time + 5,
+        "T": transaction_time,
+        "a": {"P": [{"s": symbol, "pa": str(amount), "ep": "100", "up": "0", "ps": "BOTH"}]},
+    }
+
+
+@pytest.fixture
+def book() -> PositionBook:
+    book = PositionBook([SYMBOL], aliases=["BTCUSD"], pending_timeout=60)
+    book.apply_position_risk(position_risk(0, 100))
+    return book
+
+
+def test_fill_at_or_before_update_time_is_skipped(book):
+    book.apply_user_event(trade_update(0.5, 100))
+    book.apply_user_event(trade_update(0.5, 90))
+    assert book.actual[0] == 0
+    book.apply_user_event(trade_update(0.5, 101))
+    assert book.actual[0] == 0.5
+    assert book.fill_time[0] == 101
+
+
+def test_position_update_older_than_fill_is_ignored(book):
+    book.apply_user_event(trade_update(1, 200))
+    # a poll answered before the fill, delivered after it
+    book.apply_position_risk(position_risk(0, 150))
+    assert book.actual[0] == 1
+    assert book.update_time[0] == 100
+    book.apply_user_event(account_update(1, 200))
+    assert book.actual[0] == 1
+    assert book.update_time[0] == 200
+
+
+def test_position_update_older_than_update_time_is_ignored(book):
+    book.apply_position_risk(position_risk(2, 300))
+    book.apply_user_event(account_update(1, 250))
+    assert book.actual[0] == 2
+    assert book.update_time[0] == 300
+
+
+def test_pending_cleared_by_newer_position_update(book):
+    book.set_targets({"BTCUSD": 1})
+    assert book.orders(now_ms=1_000) == [(SYMBOL, 1.0)]
+    assert book.pending_version[0] == 100
+    # the same position update again does not confirm the order, nothing is ordered twice
+    book.apply_position_risk(position_risk(0, 100))
+    assert book.pending[0] == 1
+    assert book.orders(now_ms=2_000) == []
+    # a newer one without the fill means the order did not go through
+    book.apply_position_risk(position_risk(0, 101))
+    assert book.pending[0] == 0
+    assert book.orders(now_ms=3_000) == [(SYMBOL, 1.0)]
+
+
+def test_pending_expires_after_timeout(book):
+    book.set_targets({"BTCUSD": 1})
+    assert book.orders(now_ms=1_000) == [(SYMBOL, 1.0)]
+    assert book.orders(now_ms=61_000) == []
+    assert book.pending[0] == 1
+    assert book.orders(now_ms=61_001) == [(SYMBOL, 1.0)]
+
+
+def test_partial_fills_reduce_pending(book):
+    book.set_targets({"BTCUSD": 1})
+    book.orders(now_ms=1_000)
+    book.apply_user_event(trade_update(0.4, 200))
+    assert book.actual[0] == 0.4
+    assert book.pending[0] == pytest.approx(0.6)
+    assert book.orders(now_ms=2_000) == []
+    book.apply_user_event(trade_update(0.6, 201))
+    assert book.pending[0] == 0
+    assert book.orders(now_ms=3_000) == []
+
+
+def test_overshooting_fill_does_not_flip_pending(book):
+    book.set_targets({"BTCUSD": 1})
+    book.orders(now_ms=1_000)
+    book.apply_user_event(trade_update(1.5, 200))
+    assert book.actual[0] == 1.5
+    assert book.pending[0] == 0
+    assert book.orders(now_ms=2_000) == [(SYMBOL, -0.5)]
+
+
+def test_unrelated_fill_does_not_create_pending(book):
+    book.apply_user_event(trade_update(-0.3, 200))
+    assert book.actual[0] == -0.3
+    assert book.pending[0] == 0
+
+
+def test_stream_fill_before_position_risk_poll(book):
+    book.set_targets({"BTCUSD": 1})
+    book.orders(now_ms=1_000)
+    book.apply_user_event(trade_update(1, 200))
+    assert book.actual[0] == 1
+    # the poll covering the fill sets the same position instead of adding it again
+    book.apply_position_risk(position_risk(1, 250))
+    assert book.actual[0] == 1
+    assert book.pending[0] == 0
+    assert book.orders(now_ms=2_000) == []
+
+
+def test_stream_fill_after_position_risk_poll(book):
+    book.set_targets({"BTCUSD": 1})
+    book.orders(now_ms=1_000)
+    # the poll already includes the fill, its trade update arrives late
+    book.apply_position_risk(position_risk(1, 250))
+    book.apply_user_event(trade_update(1, 200))
+    assert book.actual[0] == 1
+    assert book.pending[0] == 0
+    assert book.orders(now_ms=2_000) == []
+
+
+def test_user_events_of_other_symbols_and_sides_are_ignored(book):
+    book.apply_user_event(trade_update(1, 200, symbol="ETHUSDC"))
+    book.apply_user_event(trade_update(1, 200, position_side="LONG"))
+    book.apply_user_event(account_update(1, 200, symbol="ETHUSDC"))
+    book.apply_user_event({"e": "MARGIN_CALL"})
+    assert book.actual[0] == 0
+    assert book.update_time[0] == 100
+
+
+def test_unknown_symbol_has_no_gap():
+    book = PositionBook([SYMBOL, "ETHUSDC"])
+    book.apply_position_risk(position_risk(0, 100))
+    book.set_targets({SYMBOL: 1, "ETHUSDC": 1})
+    assert book.orders(now_ms=1_000) == [(SYMBOL, 1.0)]
@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+
+from research.Market.resampler import KlineResampler, resample_klines
+from research.Market.synthetic import SyntheticMarket
+
+
+@pytest.fixture(scope="module")
+def kdf() -> pd.DataFrame:
+    # starts mid bucket so the head of every timeframe is incomplete
+    return SyntheticMarket(seed=3).klines(1200).iloc[7:]
+
+
+def _stream(resampler: KlineResampler, kdf: pd.DataFrame, timeframe: str) -> list:
+    closed = [resampler.update("BTCUSDT", kdf.iloc[i : i + 1]).get(timeframe) for i in range(len(kdf))]
+    return [rdf for rdf in closed if rdf is not None]
+
+
+@pytest.mark.parametrize("timeframe", ["5m", "15m", "1h"])
+def test_stream_matches_batch(kdf, timeframe):
+    resampler = KlineResampler([timeframe])
+    pd.testing.assert_frame_equal(pd.concat(_stream(resampler, kdf, timeframe)), resample_klines(kdf, timeframe))
+
+
+@pytest.mark.parametrize("timeframe", ["5m", "15m", "1h"])
+def test_full_frame_with_stale_pending(kdf, timeframe):
+    # candles of an unfinished bucket are pending when a full frame covering them arrives
+    resampler = KlineResampler([timeframe])
+    _stream(resampler, kdf.iloc[:603], timeframe)
+    refresh = kdf.iloc[300:900]
+    pd.testing.assert_frame_equal(resampler.update("BTCUSDT", refresh)[timeframe], resample_klines(refresh, timeframe))
+
+
+@pytest.mark.parametrize("timeframe", ["5m", "15m", "1h"])
+def test_stream_through_refresh(kdf, timeframe):
+    # the startup and refresh path of KlineGenerator: reset, a full frame, then streamed candles
+    resampler = KlineResampler([timeframe])
+    _stream(resampler, kdf.iloc[:603], timeframe)
+    resampler.reset("BTCUSDT")
+    refreshed = [resampler.update("BTCUSDT", kdf.iloc[300:900]).get(timeframe)]
+    refreshed += _stream(resampler, kdf.iloc[900:], timeframe)
+    streamed = pd.concat([rdf for rdf in refreshed if rdf is not None])
+    pd.testing.assert_frame_equal(streamed, resample_klines(kdf.iloc[300:], timeframe))
@@ -0,0 +1,138 @@
+import copy
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from index.signal_dsl import SignalRule, SignalSyntaxError, load_signal_rules, parse_rule
+
+main_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+SIGNALS_PATH = os.path.join(main_path, "research/Alpha/signals.yaml")
+
+
+def _adx_stochrsi_masks(df: pd.DataFrame) -> tuple:
+    return (
+        (df["adx"] >= 25) & (df["upcross"] < 20) & (df["upcross"] > 0),
+        (df["adx"] >= 25) & (df["downcross"] > 80),
+    )
+
+
+def _super_vwap_masks(df: pd.DataFrame) -> tuple:
+    return (
+        (df["close"] > df["vwap"]) & (df["direction"] == 1) & (df["direction"].shift(1) == -1),
+        (df["close"] < df["vwap"]) & (df["direction"] == -1) & (df["direction"].shift(1) == 1),
+    )
+
+
+# alpha -> the .loc masks of its entries before they moved to signals.yaml
+LOC_MASKS = {
+    "alp_adx_stochrsi_multiple": _adx_stochrsi_masks,
+    "alp_adx_stochrsi": _adx_stochrsi_masks,
+    "alp_super_vwap_atropen": _super_vwap_masks,
+    "alp_super_vwap_trailing": _super_vwap_masks,
+}
+
+
+@pytest.fixture(scope="module")
+def columns() -> pd.DataFrame:
+    rng = np.random.default_rng(7)
+    num_bars = 2000
+    df = pd.DataFrame(
+        {
+            "adx": rng.uniform(0, 50, num_bars),
+            "upcross": rng.uniform(-10, 100, num_bars),
+            "downcross": rng.uniform(0, 100, num_bars),
+            "close": rng.normal(100, 1, num_bars),
+            "vwap": rng.normal(100, 1, num_bars),
+            "direction": rng.choice([-1.0, 1.0], num_bars),
+        }
+    )
+    # indicator warmup, comparisons with NaN are False
+    df.iloc[:30] = np.nan
+    df.loc[df.sample(frac=0.05, random_state=7).index, ["upcross", "vwap"]] = np.nan
+    return df
+
+
+def _numpy_backend(rule: SignalRule) -> SignalRule:
+    rule = copy.copy(rule)
+    rule._kernel = None
+    return rule
+
+
+@pytest.mark.parametrize(
+    "expr",
+    [
+        "close.real > 0",
+        "lambda: close",
+        "close if adx else vwap",
+        "__import__('os')",
+        "close > 'a'",
+        "close > True",
+        "prev(close, n=2) > 0",
+        "abs(close, 1) > 0",
+        "prev(close, 1.5) > 0",
+        "prev(close, 0) > 0",
+        "prev(close, lag) > 0",
+        "prev(close + 1) > 0",
+        "close[1] > 0",
+        "close >",
+    ],
+)
+def test_rejects_syntax_outside_the_grammar(expr):
+    with pytest.raises(SignalSyntaxError):
+        parse_rule(expr)
+
+
+def test_parse_rule_columns_and_lag():
+    tree, columns, max_lag = parse_rule("close > vwap and prev(direction, 3) == 1 and abs(adx) < 2 ** 5")
+    assert columns == ["close", "vwap", "direction", "adx"]
+    assert max_lag == 3
+
+
+def test_rule_without_columns_is_rejected():
+    with pytest.raises(SignalSyntaxError):
+        SignalRule(long="1 > 0")
+
+
+def test_missing_column_raises(columns):
+    rule = SignalRule(long="close > ema")
+    with pytest.raises(KeyError):
+        rule.evaluate(columns)
+
+
+@pytest.mark.parametrize("name", sorted(LOC_MASKS))
+def test_matches_the_loc_masks(columns, name):
+    rule = load_signal_rules(SIGNALS_PATH)[name]
+    long, short = LOC_MASKS[name](columns)
+    expected = pd.Series(0, index=columns.index)
+    expected.loc[long] = 1
+    expected.loc[short] = -1
+    for backend in (rule, _numpy_backend(rule)):
+        np.testing.assert_array_equal(backend.evaluate(columns), expected.to_numpy())
+
+
+@pytest.mark.parametrize("name", sorted(LOC_MASKS))
+def test_latest_bar_matches_the_full_evaluation(columns, name):
+    rule = load_signal_rules(SIGNALS_PATH)[name]
+    for backend in (rule, _numpy_backend(rule)):
+        full = backend.evaluate(columns)
+        for end in range(len(columns) - 50, len(columns) + 1):
+            latest = backend.evaluate(columns.iloc[:end], start=end - 1)
+            assert list(latest) == [full[end - 1]]
+
+
+def test_numba_kernel_matches_numpy(columns):
+    pytest.importorskip("numba")
+    exprs = [
+        ("adx >= 25 and 0 < upcross < 20", "adx >= 25 and downcross > 80"),
+        ("close > vwap and direction == 1 and prev(direction) == -1", None),
+        ("not (close - vwap) / (adx - 25) > 0.1 or abs(upcross) ** 0.5 < 3", "prev(close, 5) > close * 1.01"),
+    ]
+    for long, short in exprs:
+        rule = SignalRule(long=long, short=short)
+        assert rule._kernel is not None
+        for start in (0, 1, len(columns) - 1):
+            np.testing.assert_array_equal(
+                rule.evaluate(columns, start=start), _numpy_backend(rule).evaluate(columns, start=start)
+            )
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from index import ta
+
+pta = pytest.importorskip("pandas_ta")
+
+main_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+
+
+@pytest.fixture(scope="module")
+def kdf() -> pd.DataFrame:
+    kdf = pd.read_csv(os.path.join(main_path, "production/data/BTCUSDT_1m.csv"), index_col=0)
+    kdf.index = pd.to_datetime(kdf.index)
+    return kdf
+
+
+def _arrays(kdf: pd.DataFrame) -> tuple:
+    return tuple(kdf[col].to_numpy() for col in ["high", "low", "close", "volume_U"])
+
+
+# name -> (pandas_ta reference, index.ta result), both taking the kdf
+GOLDEN = {
+    "ema": (lambda kdf: pta.ema(kdf["close"], 20), lambda kdf: ta.ema(_arrays(kdf)[2], 20)),
+    "dema": (lambda kdf: pta.dema(kdf["close"], 20), lambda kdf: ta.dema(_arrays(kdf)[2], 20)),
+    "rma": (lambda kdf: pta.rma(kdf["close"], 20), lambda kdf: ta.rma(_arrays(kdf)[2], 20)),
+    "stdev": (lambda kdf: pta.stdev(kdf["close"], 20), lambda kdf: ta.stdev(_arrays(kdf)[2], 20)),
+    "atr": (
+        lambda kdf: pta.atr(kdf["high"], kdf["low"], kdf["close"], 14),
+        lambda kdf: ta.atr(*_arrays(kdf)[:3], 14),
+    ),
+    "atr_ema": (
+        lambda kdf: pta.atr(kdf["high"], kdf["low"], kdf["close"], 14, mamode="EMA"),
+        lambda kdf: ta.atr(*_arrays(kdf)[:3], 14, mamode="EMA"),
+    ),
+    "rsi": (lambda kdf: pta.rsi(kdf["close"], 14), lambda kdf: ta.rsi(_arrays(kdf)[2], 14)),
+    "stochrsi": (
+        lambda kdf: pta.stochrsi(kdf["close"], 14, 14, 3, 3),
+        lambda kdf: np.column_stack(ta.stochrsi(_arrays(kdf)[2], 14, 14, 3, 3)),
+    ),
+    "adx": (
+        lambda kdf: pta.adx(kdf["high"], kdf["low"], kdf["close"], 14),
+        lambda kdf: np.column_stack(ta.adx(*_arrays(kdf)[:3], 14)),
+    ),
+    "macd": (
+        lambda kdf: pta.macd(kdf["close"], 12, 26, 9),
+        lambda kdf: np.column_stack(ta.macd(_arrays(kdf)[2], 12, 26, 9)),
+    ),
+    "supertrend": (
+        lambda kdf: pta.supertrend(kdf["high"], kdf["low"], kdf["close"], 10, 3.0),
+        lambda kdf: np.column_stack(ta.supertrend(*_arrays(kdf)[:3], 10, 3.0)),
+    ),
+    "vwap": (
+        lambda kdf: pta.vwap(kdf["high"], kdf["low"], kdf["close"], kdf["volume_U"]),
+        lambda kdf: ta.vwap(*_arrays(kdf), kdf.index.to_numpy().astype("datetime64[D]")),
+    ),
+}
+
+
+@pytest.mark.parametrize("name", GOLDEN)
+def test_equal_to_pandas_ta(kdf, name):
+    reference, native = GOLDEN[name]
+    expected = np.asarray(reference(kdf), dtype=np.float64)
+    assert np.array_equal(expected, native(kdf), equal_nan=True)